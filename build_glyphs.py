@@ -0,0 +1,50 @@
+"""Builds a glyph atlas for the template engine from labeled numeric crops.
+
+    python build_glyphs.py freefire samples/freefire/ --preprocess '{"upscale": true, "invert": "auto", "threshold": "adaptive"}'
+
+Every image in the samples directory is one ROI crop named after its text ("27_0141.png",
+"55%_a.png", "3-1_x.png": the label is the file name up to the first underscore). Crops go through
+the same preprocessing the profile applies at runtime, so pass that field's "preprocess" options.
+The atlas is written to GLYPHS_DIR/<atlas>.npz and picked up on the next request that needs it.
+"""
+import os, sys, json, glob, argparse
+import cv2
+from glyphs import GlyphAtlas, GLYPHS_DIR
+from ocr import preprocess_crop
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("atlas", help="atlas name, usually the game")
+    parser.add_argument("samples", help="directory of labeled crops")
+    parser.add_argument("--preprocess", default='{"threshold": "otsu"}', help="the field's preprocess options as JSON")
+    parser.add_argument("--out", default=GLYPHS_DIR)
+    args = parser.parse_args(argv)
+
+    params = json.loads(args.preprocess)
+    samples = []
+    for path in sorted(glob.glob(os.path.join(args.samples, "*"))):
+        crop = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if crop is None:
+            continue
+        samples.append((preprocess_crop(crop, params), os.path.basename(path).split("_")[0]))
+    if not samples:
+        sys.exit(f"No images in {args.samples}")
+
+    atlas, skipped = GlyphAtlas.build(samples)
+    os.makedirs(args.out, exist_ok=True)
+    path = os.path.join(args.out, f"{args.atlas}.npz")
+    atlas.save(path)
+    chars = "".join(sorted(set(atlas.labels)))
+    print(f"{path}: {len(atlas.labels)} glyphs of {chars!r} from {len(samples) - skipped} crops, {skipped} skipped (glyph count != label)")
+
+    # Read the samples back: a template engine that cannot read its own training crops is not worth enabling
+    reads = [(text, atlas.read(crop)) for crop, text in samples]
+    misses = [(text, read) for text, read in reads if read[0] != text.replace(" ", "")]
+    for text, (read, score) in misses[:20]:
+        print(f"  {text!r} read as {read!r} ({score:.2f})")
+    print(f"self-check: {len(samples) - len(misses)}/{len(samples)} read back")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import os, json, time, sqlite3, hashlib, threading
+import cv2
+from collections import OrderedDict
+from contextlib import contextmanager
+
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1024"))  # entries kept in memory
+RESULT_CACHE_DB = os.getenv("RESULT_CACHE_DB")  # optional SQLite file for the on-disk tier
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", str(7 * 24 * 3600)))  # seconds, disk tier only
+
+
+def profile_hash(profile: dict):
+    return hashlib.sha256(json.dumps(profile, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, size=RESULT_CACHE_SIZE, db_path=RESULT_CACHE_DB, ttl=RESULT_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.items = OrderedDict()
+        self.lock = threading.Lock()  # memory tier and counters
+        self.db_lock = threading.Lock()  # SQLite tier, so a disk read or commit never holds up a memory lookup
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.puts = 0
+        self.db = None
+        if db_path:
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            self.db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)")
+            self.db.commit()
+
+    @staticmethod
+    def key(*parts):
+        return hashlib.sha256("|".join("" if p is None else str(p) for p in parts).encode("utf-8")).hexdigest()
+
+    def get(self, key, disk=True):
+        # disk=False answers from memory only (safe on the event loop) and leaves the miss to the call that reads SQLite
+        with self.lock:
+            value = self.items.get(key)
+            if value is not None:
+                self.items.move_to_end(key)
+                self.hits += 1
+                return json.loads(value)
+            if self.db is None or not disk:
+                self.misses += self.db is None
+                return None
+        with self.db_lock:
+            row = self.db.execute("SELECT value, expires FROM results WHERE key = ?", (key,)).fetchone()
+            if row and row[1] <= time.time():
+                self.db.execute("DELETE FROM results WHERE key = ?", (key,))
+                self.db.commit()
+                row = None
+        with self.lock:
+            if row:
+                self._remember(key, row[0])
+                self.disk_hits += 1
+                return json.loads(row[0])
+            self.misses += 1
+            return None
+
+    def put(self, key, result: dict):
+        value = json.dumps(result)
+        with self.lock:
+            self._remember(key, value)
+            self.puts += 1
+            puts = self.puts
+        if self.db is not None:
+            with self.db_lock:
+                now = time.time()
+                self.db.execute("INSERT OR REPLACE INTO results (key, value, expires) VALUES (?, ?, ?)", (key, value, now + self.ttl))
+                if puts % 256 == 0:
+                    self.db.execute("DELETE FROM results WHERE expires <= ?", (now,))
+                self.db.commit()
+
+    def _remember(self, key, value):
+        # Results are stored serialized so callers can never mutate a cached response
+        self.items[key] = value
+        self.items.move_to_end(key)
+        while len(self.items) > self.size:
+            self.items.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self.items),
+                "size": self.size,
+                "diskTier": self.db is not None,
+                "hits": self.hits,
+                "diskHits": self.disk_hits,
+                "misses": self.misses,
+                "hitRate": round((self.hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+            }
+
+
+result_cache = ResultCache()
+
+
+OCR_MEMO_SIZE = int(os.getenv("OCR_MEMO_SIZE", "8192"))  # crop -> text entries
+OCR_MEMO_HASH = os.getenv("OCR_MEMO_HASH", "exact")  # "exact" or "normalized" (rescaled to a fixed height first)
+OCR_MEMO_HEIGHT = 24
+
+
+class CropMemo:
+    def __init__(self, size=OCR_MEMO_SIZE, mode=OCR_MEMO_HASH):
+        self.size = size
+        self.mode = mode
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.hits = 0
+        self.misses = 0
+
+    @contextmanager
+    def bypassed(self):
+        # Recognition on this thread neither reads nor fills the memo (model warmup: synthetic crops must
+        # reach the models every time and must not take slots from real ones)
+        self.local.bypass = True
+        try:
+            yield
+        finally:
+            self.local.bypass = False
+
+    def key(self, crop, allowlist=None):
+        # crop: binarized uint8 array, so tiny JPEG noise is already gone; allowlist: characters it may decode to
+        if self.mode == "normalized" and crop.shape[0] != OCR_MEMO_HEIGHT:
+            width = max(1, round(crop.shape[1] * OCR_MEMO_HEIGHT / crop.shape[0]))
+            crop = cv2.resize(crop, (width, OCR_MEMO_HEIGHT), interpolation=cv2.INTER_AREA)
+            crop = cv2.threshold(crop, 127, 255, cv2.THRESH_BINARY)[1]
+        h = hashlib.blake2b(crop.tobytes(), digest_size=16)
+        h.update(str(crop.shape).encode("ascii"))
+        if allowlist:
+            h.update(allowlist.encode("utf-8"))
+        return h.digest()
+
+    def get(self, key):
+        if getattr(self.local, "bypass", False):
+            return None
+        with self.lock:
+            text = self.items.get(key)
+            if text is None:
+                self.misses += 1
+                return None
+            self.items.move_to_end(key)
+            self.hits += 1
+            return text
+
+    def put(self, key, text):
+        if getattr(self.local, "bypass", False):
+            return
+        with self.lock:
+            self.items[key] = text
+            self.items.move_to_end(key)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.items),
+                "size": self.size,
+                "hash": self.mode,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+crop_memo = CropMemo()
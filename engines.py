@@ -0,0 +1,249 @@
+import os, json, time, shutil, logging, threading, subprocess
+import numpy as np
+import cv2
+from glyphs import glyph_atlases, GLYPH_MIN_SCORE
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+OCR_ENGINE = os.getenv("OCR_ENGINE", "easyocr")  # engine for fields whose profile names none
+TESSERACT_CMD = os.getenv("TESSERACT_CMD", "tesseract")
+TESSERACT_LANG = os.getenv("TESSERACT_LANG", "eng")
+TESSERACT_MIN_CONF = float(os.getenv("TESSERACT_MIN_CONF", "0.6"))  # 0-1, lower reads go to EasyOCR
+ONNX_RECOGNIZER = os.getenv("ONNX_RECOGNIZER", os.path.join(_HERE, "models", "recognizer.onnx"))  # see export_recognizer.py
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "1"))  # intra-op threads per session
+ONNX_INTER_THREADS = int(os.getenv("ONNX_INTER_THREADS", "1"))  # inter-op threads per session (parallel graph branches)
+ONNX_REQUIRE_PARITY = os.getenv("ONNX_REQUIRE_PARITY", "1") == "1"  # only load models whose export passed the parity check
+ONNX_MIN_CONF = float(os.getenv("ONNX_MIN_CONF", "0"))
+
+log = logging.getLogger("ocr.engines")
+
+
+class OcrEngine:
+    # Reads a batch of preprocessed single-line crops. `read` returns one (text, confidence) per crop:
+    # confidence in 0-1 or None when the engine has none; text None when it cannot read that crop at all.
+    # Reads under `min_confidence` (and None texts) are handed to EasyOCR by ocr_plan.
+    name = ""
+    min_confidence = 0.0
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.crops = 0
+        self.seconds = 0.0
+        self.fallbacks = 0
+
+    def available(self):
+        return True
+
+    def read(self, crops, params):
+        raise NotImplementedError
+
+    def timed_read(self, crops, params):
+        start = time.perf_counter()
+        out = self.read(crops, params)
+        with self.lock:
+            self.crops += len(crops)
+            self.seconds += time.perf_counter() - start
+        return out
+
+    def fell_back(self, count):
+        with self.lock:
+            self.fallbacks += count
+
+    def stats(self):
+        with self.lock:
+            return {
+                "available": self.available(),
+                "crops": self.crops,
+                "msPerCrop": round(self.seconds * 1000 / self.crops, 3) if self.crops else None,
+                "fallbacks": self.fallbacks,
+            }
+
+
+class EasyOcrEngine(OcrEngine):
+    # The torch recognizer behind the crop memo, the coalescing batcher and the recognizer pool
+    name = "easyocr"
+
+    def read(self, crops, params):
+        from ocr import recognize_crops
+        return [(text, None) for text in recognize_crops(crops, [p.get("allowlist") for p in params])]
+
+
+class GlyphEngine(OcrEngine):
+    # Template matching against the game's digit atlas (glyphs.py); games without an atlas fall back
+    name = "glyphs"
+    min_confidence = GLYPH_MIN_SCORE
+
+    def read(self, crops, params):
+        out = []
+        for crop, p in zip(crops, params):
+            atlas = glyph_atlases.get(p.get("atlas"))
+            out.append(atlas.read(crop) if atlas is not None else (None, None))
+        return out
+
+
+class TesseractEngine(OcrEngine):
+    # tesserocr with one persistent API handle per thread when installed, else the tesseract binary
+    # the Docker image ships. Single-line page segmentation; the allowlist becomes the char whitelist.
+    name = "tesseract"
+    min_confidence = TESSERACT_MIN_CONF
+
+    def __init__(self, cmd=TESSERACT_CMD, lang=TESSERACT_LANG):
+        super().__init__()
+        self.cmd = cmd
+        self.lang = lang
+        self.local = threading.local()
+        try:
+            import tesserocr
+            self.tesserocr = tesserocr
+        except ImportError:
+            self.tesserocr = None
+        self.binary = shutil.which(cmd)
+
+    def available(self):
+        return self.tesserocr is not None or self.binary is not None
+
+    def read(self, crops, params):
+        return [self._read_one(crop, p.get("allowlist")) if crop.size else ("", None) for crop, p in zip(crops, params)]
+
+    def _read_one(self, crop, allowlist):
+        if self.tesserocr is not None:
+            api = getattr(self.local, "api", None)
+            if api is None:
+                api = self.local.api = self.tesserocr.PyTessBaseAPI(lang=self.lang, psm=self.tesserocr.PSM.SINGLE_LINE)
+            from PIL import Image
+            api.SetVariable("tessedit_char_whitelist", allowlist or "")
+            api.SetImage(Image.fromarray(crop))
+            return api.GetUTF8Text().strip(), api.MeanTextConf() / 100.0
+        args = [self.binary, "stdin", "stdout", "-l", self.lang, "--psm", "7"]
+        if allowlist:
+            args += ["-c", f"tessedit_char_whitelist={allowlist}"]
+        ok, png = cv2.imencode(".png", crop)
+        res = subprocess.run(args + ["tsv"], input=png.tobytes(), capture_output=True, timeout=10)
+        if res.returncode != 0:
+            log.warning("tesseract failed: %s", res.stderr.decode("utf-8", "replace").strip())
+            return None, None
+        words, confs = [], []
+        for row in res.stdout.decode("utf-8", "replace").splitlines()[1:]:
+            cols = row.split("\t")
+            if len(cols) == 12 and cols[11].strip() and float(cols[10]) >= 0:
+                words.append(cols[11].strip())
+                confs.append(float(cols[10]) / 100.0)
+        return " ".join(words), (min(confs) if confs else 0.0)
+
+
+class OnnxEngine(OcrEngine):
+    # EasyOCR's recognizer exported to ONNX (export_recognizer.py), run with onnxruntime: same model and
+    # greedy CTC decoding, without torch in the request path. The export writes the character set and
+    # the result of its parity check against the eager model to <model>.json.
+    name = "onnx"
+    min_confidence = ONNX_MIN_CONF
+
+    def __init__(self, path=ONNX_RECOGNIZER, threads=ONNX_THREADS, inter_threads=ONNX_INTER_THREADS, require_parity=ONNX_REQUIRE_PARITY):
+        super().__init__()
+        self.path = path
+        self.threads = threads
+        self.inter_threads = inter_threads
+        self.require_parity = require_parity
+        self.session = None
+        self.characters = None
+        self.height = 64
+        self.load_lock = threading.Lock()
+        self._available = None
+
+    def available(self):
+        if self._available is None:
+            try:
+                import onnxruntime  # noqa: F401
+                self._available = os.path.exists(self.path) and (not self.require_parity or self._parity_passed())
+            except ImportError:
+                self._available = False
+        return self._available
+
+    def _meta(self):
+        with open(os.path.splitext(self.path)[0] + ".json") as f:
+            return json.load(f)
+
+    def _parity_passed(self):
+        try:
+            parity = self._meta().get("parity") or {}
+        except (OSError, ValueError):
+            return False
+        if not parity.get("passed"):
+            log.warning("%s has not passed its parity check, onnx engine disabled", self.path)
+        return bool(parity.get("passed"))
+
+    def _load(self):
+        with self.load_lock:
+            if self.session is None:
+                import onnxruntime as ort
+                meta = self._meta()
+                opts = ort.SessionOptions()
+                opts.intra_op_num_threads = self.threads
+                opts.inter_op_num_threads = self.inter_threads
+                if self.inter_threads > 1:
+                    opts.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+                self.characters = ["[blank]"] + list(meta["characters"])
+                self.height = meta.get("imgH", 64)
+                self.session = ort.InferenceSession(self.path, opts, providers=["CPUExecutionProvider"])
+        return self.session
+
+    def _batch(self, crops):
+        # EasyOCR's AlignCollate: height to imgH keeping the ratio, [-1, 1], right-padded with the last column
+        resized = []
+        for crop in crops:
+            width = max(1, int(np.ceil(self.height * crop.shape[1] / crop.shape[0])))
+            resized.append(cv2.resize(crop, (width, self.height), interpolation=cv2.INTER_CUBIC).astype(np.float32) / 127.5 - 1.0)
+        width = max(r.shape[1] for r in resized)
+        batch = np.empty((len(resized), 1, self.height, width), dtype=np.float32)
+        for i, r in enumerate(resized):
+            batch[i, 0, :, :r.shape[1]] = r
+            batch[i, 0, :, r.shape[1]:] = r[:, -1:]
+        return batch
+
+    def _ignored(self, allowlist):
+        if not allowlist:
+            return []
+        return [i for i, c in enumerate(self.characters) if i and c not in allowlist]
+
+    def read(self, crops, params):
+        session = self._load()
+        out = [("", None)] * len(crops)
+        todo = [i for i, crop in enumerate(crops) if crop.shape[0] >= 2 and crop.shape[1] >= 2]
+        # One run per allowlist, like the torch path
+        by_allowlist = {}
+        for i in todo:
+            by_allowlist.setdefault(params[i].get("allowlist"), []).append(i)
+        for allowlist, idx in by_allowlist.items():
+            logits = session.run(None, {session.get_inputs()[0].name: self._batch([crops[i] for i in idx])})[0]
+            probs = np.exp(logits - logits.max(axis=2, keepdims=True))
+            ignored = self._ignored(allowlist)
+            if ignored:
+                probs[:, :, ignored] = 0.0
+            probs /= probs.sum(axis=2, keepdims=True)
+            best = probs.argmax(axis=2)
+            for row, i in enumerate(idx):
+                out[i] = self._decode(best[row], probs[row].max(axis=1))
+        return out
+
+    def _decode(self, best, maxprob):
+        chars, kept = [], []
+        for t, k in enumerate(best):
+            if k and (t == 0 or k != best[t - 1]):
+                chars.append(self.characters[k])
+                kept.append(maxprob[t])
+        if not kept:
+            return "", 0.0
+        # EasyOCR's custom_mean
+        return "".join(chars).strip(), float(np.prod(kept) ** (2.0 / np.sqrt(len(kept))))
+
+
+ENGINES = {engine.name: engine for engine in (EasyOcrEngine(), GlyphEngine(), TesseractEngine(), OnnxEngine())}
+
+
+def engine_for(name):
+    # An engine that is not installed here reads as EasyOCR
+    engine = ENGINES.get(name or OCR_ENGINE, ENGINES["easyocr"])
+    return engine if engine.available() else ENGINES["easyocr"]
+
+
+def engine_stats():
+    return {name: engine.stats() for name, engine in ENGINES.items()}
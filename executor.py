@@ -0,0 +1,85 @@
+import os, time, asyncio, threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+OCR_EXECUTOR = os.getenv("OCR_EXECUTOR", "thread")  # "thread" or "process"
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "2"))
+OCR_QUEUE_SIZE = int(os.getenv("OCR_QUEUE_SIZE", "8"))  # jobs allowed to wait behind the running ones
+OCR_RETRY_AFTER = int(os.getenv("OCR_RETRY_AFTER", "5"))
+
+
+class PoolFull(Exception):
+    pass
+
+
+def _timed(fn, submitted_at, args):
+    # Runs in the worker; wall clock so it also works across processes
+    started = time.time()
+    return started - submitted_at, fn(*args)
+
+
+class OcrExecutor:
+    def __init__(self, kind=OCR_EXECUTOR, workers=OCR_WORKERS, queue_size=OCR_QUEUE_SIZE):
+        self.kind = kind
+        self.workers = workers
+        self.queue_size = queue_size
+        if kind == "process":
+            self.pool = ProcessPoolExecutor(max_workers=workers)
+        else:
+            self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ocr")
+        self.lock = threading.Lock()
+        self.inflight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.last_wait = 0.0
+
+    async def run(self, fn, *args, done=None):
+        # The slot is held until the worker finishes, not until the caller stops waiting: a cancelled
+        # caller (a batch stream that disconnected) leaves the job running, and admission keeps counting it.
+        # `done` runs on the event loop once the worker has finished with the arguments.
+        with self.lock:
+            if self.inflight >= self.workers + self.queue_size:
+                self.rejected += 1
+                raise PoolFull()
+            self.inflight += 1
+        try:
+            future = asyncio.get_running_loop().run_in_executor(self.pool, _timed, fn, time.time(), args)
+        except BaseException:
+            self._finished(None, done)
+            raise
+        future.add_done_callback(lambda f: self._finished(f, done))
+        return (await asyncio.shield(future))[1]
+
+    def _finished(self, future, done):
+        with self.lock:
+            self.inflight -= 1
+            if future is not None and not future.cancelled() and future.exception() is None:
+                wait = future.result()[0]
+                self.completed += 1
+                self.wait_total += wait
+                self.wait_max = max(self.wait_max, wait)
+                self.last_wait = wait
+        if done is not None:
+            done()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "executor": self.kind,
+                "workers": self.workers,
+                "queueSize": self.queue_size,
+                "inflight": self.inflight,
+                "queueDepth": max(0, self.inflight - self.workers),
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "waitMsAvg": round(1000 * self.wait_total / self.completed, 1) if self.completed else 0.0,
+                "waitMsMax": round(1000 * self.wait_max, 1),
+                "waitMsLast": round(1000 * self.last_wait, 1),
+            }
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+ocr_executor = OcrExecutor()
@@ -0,0 +1,117 @@
+"""Exports EasyOCR's recognizer to ONNX with int8 weights for the "onnx" engine, gated on a parity check.
+
+    python export_recognizer.py samples/ --preprocess '{"threshold": "otsu"}'
+
+The float model is exported with dynamic batch and width, then dynamically quantized (int8 LSTM/Linear
+weights) with onnxruntime. Every crop in the samples directory is then read by the eager model the service
+runs today and by the quantized export. Crops named "<text>_<anything>.png" also count toward accuracy.
+The manifest next to the model (<model>.json) records the character set and the parity result. The
+engine only loads a model whose manifest says the check passed.
+
+Needs torch, easyocr, onnx and onnxruntime. The detector is not exported: only OCR_MODE=detect uses it.
+"""
+import os, sys, json, glob, argparse
+import cv2
+
+ONNX_OPSET = 17
+
+
+def _exportable(reader):
+    import torch
+
+    class MeanOverHeight(torch.nn.Module):
+        # AdaptiveAvgPool2d((None, 1)) as a plain mean, which exports with a dynamic width
+        def forward(self, x):
+            return x.mean(dim=3, keepdim=True)
+
+    class Recognizer(torch.nn.Module):
+        # The CTC model ignores its `text` argument; export it as image -> logits
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+            self.model.AdaptiveAvgPool = MeanOverHeight()
+
+        def forward(self, image):
+            return self.model(image, None)
+
+    return Recognizer(reader.recognizer).eval()
+
+
+def export(out, height):
+    import torch, easyocr
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    # The served reader is already torch-quantized, which does not export; start from the float weights
+    reader = easyocr.Reader(["en"], gpu=False, quantize=False, detector=False, verbose=False)
+    model = _exportable(reader)
+    float_path = os.path.splitext(out)[0] + ".float.onnx"
+    with torch.no_grad():
+        torch.onnx.export(model, torch.randn(1, 1, height, 256), float_path, input_names=["image"], output_names=["logits"],
+                          dynamic_axes={"image": {0: "batch", 3: "width"}, "logits": {0: "batch", 1: "steps"}}, opset_version=ONNX_OPSET)
+    quantize_dynamic(float_path, out, weight_type=QuantType.QInt8)
+    os.remove(float_path)
+    return reader.character
+
+
+def parity(samples, engine, params):
+    # Eager torch path (recognize_crops_local) vs the exported model on the same preprocessed crops
+    from ocr import recognize_crops_local
+    crops = [crop for crop, _ in samples]
+    eager = recognize_crops_local(crops, [params.get("allowlist")] * len(crops))
+    exported = [text for text, _ in engine.read(crops, [params] * len(crops))]
+    labeled = [(label, e, x) for (_, label), e, x in zip(samples, eager, exported) if label is not None]
+    report = {
+        "samples": len(samples),
+        "agreement": round(sum(e == x for e, x in zip(eager, exported)) / len(samples), 4),
+        "labeled": len(labeled),
+        "eagerAccuracy": round(sum(label == e for label, e, _ in labeled) / len(labeled), 4) if labeled else None,
+        "onnxAccuracy": round(sum(label == x for label, _, x in labeled) / len(labeled), 4) if labeled else None,
+    }
+    disagreements = [(e, x) for e, x in zip(eager, exported) if e != x]
+    return report, disagreements
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("samples", help="directory of ROI crops, optionally named <text>_<anything>.png")
+    parser.add_argument("--out", default=None, help="model path, default ONNX_RECOGNIZER")
+    parser.add_argument("--preprocess", default='{"threshold": "otsu"}', help="preprocess options applied to the samples, as JSON")
+    parser.add_argument("--min-agreement", type=float, default=0.99, help="share of samples both models must read identically")
+    parser.add_argument("--max-accuracy-drop", type=float, default=0.005, help="on labeled samples")
+    args = parser.parse_args(argv)
+
+    from ocr import preprocess_crop, RECOGNIZER_HEIGHT
+    from engines import OnnxEngine, ONNX_RECOGNIZER
+    out = args.out or ONNX_RECOGNIZER
+    params = json.loads(args.preprocess)
+    samples = []
+    for path in sorted(glob.glob(os.path.join(args.samples, "*"))):
+        crop = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if crop is not None:
+            name = os.path.basename(path)
+            samples.append((preprocess_crop(crop, params), name.split("_")[0] if "_" in name else None))
+    if not samples:
+        sys.exit(f"No images in {args.samples}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    characters = export(out, RECOGNIZER_HEIGHT)
+    manifest = {"characters": characters, "imgH": RECOGNIZER_HEIGHT, "weights": "int8-dynamic", "opset": ONNX_OPSET, "parity": None}
+    manifest_path = os.path.splitext(out)[0] + ".json"
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f)
+
+    report, disagreements = parity(samples, OnnxEngine(out, require_parity=False), params)
+    report["passed"] = report["agreement"] >= args.min_agreement and (
+        report["eagerAccuracy"] is None or report["onnxAccuracy"] >= report["eagerAccuracy"] - args.max_accuracy_drop)
+    manifest["parity"] = report
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=1)
+
+    print(f"{out}: {json.dumps(report)}")
+    for eager, exported in disagreements[:20]:
+        print(f"  eager {eager!r} vs onnx {exported!r}")
+    if not report["passed"]:
+        sys.exit("Parity check failed: the onnx engine stays disabled for this model")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import os, threading
+import numpy as np
+import cv2
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+GLYPHS_DIR = os.getenv("GLYPHS_DIR", os.path.join(_HERE, "glyphs"))  # <atlas>.npz, built by build_glyphs.py
+GLYPH_MIN_SCORE = float(os.getenv("GLYPH_MIN_SCORE", "0.85"))  # weakest glyph match accepted before falling back to the recognizer
+GLYPH_SIZE = (16, 24)  # width, height every glyph is normalized to
+
+
+def foreground(crop):
+    # Text pixels of a preprocessed crop: the minority class, whichever polarity it came in
+    if crop.dtype != np.uint8 or len(np.unique(crop)) > 2:
+        crop = cv2.threshold(crop, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+    mask = crop > 0
+    if np.count_nonzero(mask) * 2 > mask.size:
+        mask = ~mask
+    return mask.astype(np.uint8)
+
+
+def segment(crop):
+    # -> glyph boxes (x0, y0, x1, y1) left to right. Connected components, minus specks; parts that
+    # overlap horizontally (the rings of "%", the dots of ":") are one glyph. Flat wide marks ("-") stay.
+    mask = foreground(crop)
+    n, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    comps = [tuple(s) for s in stats[1:]]
+    if not comps:
+        return mask, []
+    tallest = max(h for _, _, _, h, _ in comps)
+    boxes = sorted((x, y, x + w, y + h) for x, y, w, h, area in comps
+                   if area >= 3 and (h >= 0.4 * tallest or (w >= 2 * h and w >= 0.2 * tallest)))
+    merged = []
+    for box in boxes:
+        if merged and box[0] < merged[-1][2]:
+            last = merged[-1]
+            merged[-1] = (last[0], min(last[1], box[1]), max(last[2], box[2]), max(last[3], box[3]))
+        else:
+            merged.append(box)
+    return mask, merged
+
+
+def vectors(mask, boxes):
+    # Each glyph cut out, scaled to GLYPH_SIZE and made zero-mean unit-norm, so a dot product is its NCC
+    out = np.zeros((len(boxes), GLYPH_SIZE[0] * GLYPH_SIZE[1]), dtype=np.float32)
+    for i, (x0, y0, x1, y1) in enumerate(boxes):
+        glyph = cv2.resize(mask[y0:y1, x0:x1].astype(np.float32), GLYPH_SIZE, interpolation=cv2.INTER_AREA).ravel()
+        glyph -= glyph.mean()
+        norm = np.linalg.norm(glyph)
+        if norm > 0:
+            out[i] = glyph / norm
+    return out
+
+
+class GlyphAtlas:
+    # Labeled templates of one game's digit font: `labels[i]` is the character `templates[i]` shows
+    def __init__(self, labels, templates):
+        self.labels = np.asarray(labels)
+        self.templates = np.asarray(templates, dtype=np.float32)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["labels"], data["templates"])
+
+    def save(self, path):
+        np.savez_compressed(path, labels=self.labels, templates=self.templates)
+
+    @classmethod
+    def build(cls, samples):
+        # samples: (preprocessed crop, its text). Crops whose glyph count differs from the text are skipped.
+        labels, templates, skipped = [], [], 0
+        for crop, text in samples:
+            chars = text.replace(" ", "")
+            mask, boxes = segment(crop)
+            if len(boxes) != len(chars):
+                skipped += 1
+                continue
+            labels.extend(chars)
+            templates.extend(vectors(mask, boxes))
+        return cls(labels, np.array(templates, dtype=np.float32).reshape(-1, GLYPH_SIZE[0] * GLYPH_SIZE[1])), skipped
+
+    def read(self, crop):
+        # -> (text, confidence): every glyph against every template in one matrix product;
+        # confidence is the weakest glyph's best correlation
+        if not len(self.labels) or crop.size == 0:
+            return "", 0.0
+        mask, boxes = segment(crop)
+        if not boxes:
+            return "", 0.0
+        scores = vectors(mask, boxes) @ self.templates.T
+        best = scores.argmax(axis=1)
+        text = "".join(self.labels[best])
+        return text, float(scores[np.arange(len(boxes)), best].min())
+
+
+class GlyphAtlases:
+    # Loaded on first use per atlas name; a missing file means the game has no template reader
+    def __init__(self, directory=GLYPHS_DIR):
+        self.directory = directory
+        self.atlases = {}
+        self.lock = threading.Lock()
+
+    def get(self, name):
+        with self.lock:
+            if name not in self.atlases:
+                path = os.path.join(self.directory, f"{name}.npz")
+                self.atlases[name] = GlyphAtlas.load(path) if os.path.exists(path) else None
+            return self.atlases[name]
+
+    def stats(self):
+        with self.lock:
+            return {name: len(atlas.labels) if atlas else None for name, atlas in self.atlases.items()}
+
+
+glyph_atlases = GlyphAtlases()
@@ -0,0 +1,330 @@
+import os, json, time, uuid, shutil, socket, sqlite3, asyncio, tempfile, ipaddress, threading, logging
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from executor import PoolFull, OCR_WORKERS
+
+_DATA = os.path.join(tempfile.gettempdir(), "ocr-verifier")
+JOBS_DB = os.getenv("JOBS_DB", os.path.join(_DATA, "jobs.db"))
+JOBS_DIR = os.getenv("JOBS_DIR", os.path.join(_DATA, "jobs"))  # uploaded screenshots waiting for OCR
+JOB_LANES = [l.strip() for l in os.getenv("JOB_LANES", "final,knockout,default,group").split(",") if l.strip()]  # highest priority first
+JOB_DEFAULT_LANE = os.getenv("JOB_DEFAULT_LANE", "default")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", str(OCR_WORKERS)))  # jobs taken off the queue at once
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "5"))  # seconds, doubled on every further attempt
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", str(24 * 3600)))  # finished jobs kept for polling
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+JOB_LEASE = float(os.getenv("JOB_LEASE", "300"))  # seconds a running job may go without a heartbeat before it is requeued
+WEBHOOK_TIMEOUT = float(os.getenv("WEBHOOK_TIMEOUT", "5"))
+WEBHOOK_ATTEMPTS = int(os.getenv("WEBHOOK_ATTEMPTS", "3"))
+WEBHOOK_HOSTS = {h.strip().lower() for h in os.getenv("WEBHOOK_HOSTS", "").split(",") if h.strip()}  # allowed hosts, empty = any public host
+
+log = logging.getLogger("ocr.jobs")
+
+# queued -> running -> done | failed (rejected input, not retried) | dead (out of attempts)
+FINISHED = ("done", "failed", "dead")
+
+
+class JobRejected(Exception):
+    # Raised by a job handler for input that will never succeed; carries the HTTP status and detail
+    def __init__(self, status, detail):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+
+def check_webhook_url(url):
+    # Webhooks are POSTed from inside the service: only http(s) to public addresses (or WEBHOOK_HOSTS)
+    parts = urlsplit(url or "")
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError("webhookUrl must be an http(s) URL")
+    host = parts.hostname.lower()
+    if WEBHOOK_HOSTS and host not in WEBHOOK_HOSTS:
+        raise ValueError(f"webhookUrl host {host} is not allowed")
+    try:
+        infos = socket.getaddrinfo(host, parts.port or (443 if parts.scheme == "https" else 80), proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError):
+        raise ValueError(f"webhookUrl host {host} does not resolve")
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%")[0])
+        if not address.is_global or address.is_multicast:
+            raise ValueError(f"webhookUrl host {host} is not a public address")
+    return url
+
+
+class JobQueue:
+    # Several API processes may share one database: claims are conditional updates, and running jobs
+    # hold a lease (`updated`, refreshed by the runner's heartbeat) instead of being requeued on startup.
+    def __init__(self, db_path=JOBS_DB, directory=JOBS_DIR, lanes=JOB_LANES, max_attempts=JOB_MAX_ATTEMPTS, lease=JOB_LEASE):
+        self.db_path = db_path
+        self.directory = directory
+        self.lanes = lanes
+        self.max_attempts = max_attempts
+        self.lease = lease
+        self.lock = threading.Lock()
+        self.db = None
+
+    def open(self):
+        # Called from the lifespan hook, so importing the app touches no files
+        if self.db is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self.db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY, lane TEXT NOT NULL, priority INTEGER NOT NULL, status TEXT NOT NULL,
+            params TEXT NOT NULL, image TEXT, webhook TEXT, attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL, next_run REAL NOT NULL, created REAL NOT NULL, updated REAL NOT NULL,
+            result TEXT, error TEXT, webhook_status TEXT)""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, priority, next_run, created)")
+        self.db.commit()
+        self.requeue_stale()
+
+    def requeue_stale(self):
+        # Jobs whose worker died (no heartbeat for a lease) go back to the queue; live ones are left alone
+        with self.lock:
+            cur = self.db.execute("UPDATE jobs SET status = 'queued', updated = ? WHERE status = 'running' AND updated < ?",
+                                  (time.time(), time.time() - self.lease))
+            self.db.commit()
+            return cur.rowcount
+
+    def touch(self, job_id):
+        with self.lock:
+            self.db.execute("UPDATE jobs SET updated = ? WHERE id = ? AND status = 'running'", (time.time(), job_id))
+            self.db.commit()
+
+    def priority(self, lane):
+        if lane not in self.lanes:
+            raise ValueError(f"Unknown lane {lane}, expected one of {', '.join(self.lanes)}")
+        return self.lanes.index(lane)
+
+    def submit(self, params, fileobj, lane=JOB_DEFAULT_LANE, webhook=None):
+        priority = self.priority(lane)
+        job_id = uuid.uuid4().hex
+        path = os.path.join(self.directory, job_id)
+        with open(path, "wb") as f:
+            shutil.copyfileobj(fileobj, f, 1 << 20)
+        now = time.time()
+        with self.lock:
+            self.db.execute(
+                "INSERT INTO jobs (id, lane, priority, status, params, image, webhook, max_attempts, next_run, created, updated) "
+                "VALUES (?, ?, ?, 'queued', ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, lane, priority, json.dumps(params), path, webhook, self.max_attempts, now, now, now))
+            self.db.commit()
+        return job_id
+
+    def claim(self):
+        # Highest lane first, then oldest due job. The update only takes a job that is still queued,
+        # so when another process claimed it in between, try the next one.
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' AND next_run <= ? ORDER BY priority, next_run, created LIMIT 8",
+                (time.time(),)).fetchall()
+            for row in rows:
+                cur = self.db.execute("UPDATE jobs SET status = 'running', attempts = attempts + 1, updated = ? WHERE id = ? AND status = 'queued'",
+                                      (time.time(), row["id"]))
+                self.db.commit()
+                if cur.rowcount:
+                    return dict(row, status="running", attempts=row["attempts"] + 1)
+            return None
+
+    def defer(self, job, delay):
+        # Back on the queue without using up an attempt (OCR pool busy)
+        self._update(job["id"], status="queued", attempts=job["attempts"] - 1, next_run=time.time() + delay)
+
+    def complete(self, job, result):
+        self._finish(job, "done", result=json.dumps(result))
+
+    def reject(self, job, status, detail):
+        self._finish(job, "failed", error=json.dumps({"status": status, "detail": detail}))
+
+    def fail(self, job, error):
+        if job["attempts"] >= job["max_attempts"]:
+            log.error("Job %s dead after %d attempts: %s", job["id"], job["attempts"], error)
+            self._update(job["id"], status="dead", error=json.dumps({"status": 500, "detail": error}))
+            return "dead"
+        delay = JOB_RETRY_DELAY * 2 ** (job["attempts"] - 1)
+        self._update(job["id"], status="queued", next_run=time.time() + delay, error=json.dumps({"status": 500, "detail": error}))
+        return "queued"
+
+    def retry(self, job_id):
+        # Dead-lettered jobs keep their screenshot, so they can be replayed by hand
+        with self.lock:
+            cur = self.db.execute(
+                "UPDATE jobs SET status = 'queued', attempts = 0, next_run = ?, updated = ? WHERE id = ? AND status = 'dead'",
+                (time.time(), time.time(), job_id))
+            self.db.commit()
+            return cur.rowcount > 0
+
+    def _finish(self, job, status, **fields):
+        self._update(job["id"], status=status, **fields)
+        self._drop_image(job)
+
+    def _drop_image(self, job):
+        try:
+            os.remove(job["image"])
+        except (OSError, TypeError):
+            pass
+
+    def _update(self, job_id, **fields):
+        fields["updated"] = time.time()
+        with self.lock:
+            self.db.execute(f"UPDATE jobs SET {', '.join(f'{k} = ?' for k in fields)} WHERE id = ?", (*fields.values(), job_id))
+            self.db.commit()
+
+    def set_webhook_status(self, job_id, status):
+        self._update(job_id, webhook_status=status)
+
+    def get(self, job_id):
+        with self.lock:
+            row = self.db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self.describe(row) if row else None
+
+    def list(self, status, limit=100):
+        with self.lock:
+            rows = self.db.execute("SELECT * FROM jobs WHERE status = ? ORDER BY updated DESC LIMIT ?", (status, limit)).fetchall()
+        return [self.describe(row) for row in rows]
+
+    def describe(self, row):
+        job = {
+            "jobId": row["id"],
+            "status": row["status"],
+            "lane": row["lane"],
+            "attempts": row["attempts"],
+            "maxAttempts": row["max_attempts"],
+            "createdAt": row["created"],
+            "updatedAt": row["updated"],
+            "webhook": row["webhook_status"],
+        }
+        if row["status"] == "done":
+            job["result"] = json.loads(row["result"])
+        elif row["error"]:
+            job["error"] = json.loads(row["error"])
+        return job
+
+    def purge(self, ttl=JOB_RESULT_TTL):
+        with self.lock:
+            self.db.execute(f"DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated < ?", (time.time() - ttl,))
+            self.db.commit()
+
+    def stats(self):
+        with self.lock:
+            rows = self.db.execute("SELECT lane, status, COUNT(*) FROM jobs GROUP BY lane, status").fetchall()
+        lanes = {lane: {} for lane in self.lanes}
+        for lane, status, count in rows:
+            lanes.setdefault(lane, {})[status] = count
+        return {"lanes": lanes, "order": self.lanes}
+
+
+class JobRunner:
+    # Pulls jobs off the queue into the OCR executor; submitting never waits on OCR capacity
+    def __init__(self, queue, handler, workers=JOB_WORKERS):
+        self.queue = queue
+        self.handler = handler  # async (params, image) -> result dict
+        self.workers = workers
+        self.tasks = []
+        self.loop = None
+        self.wakeup = None
+        self.webhooks = ThreadPoolExecutor(max_workers=2, thread_name_prefix="webhook")
+        self.session = requests.Session()
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        self.tasks = [asyncio.ensure_future(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.webhooks.shutdown(wait=False)
+
+    def notify(self):
+        # Callable from any thread (sync routes run in the threadpool)
+        if self.wakeup is not None:
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+
+    # Every queue call is a SQLite commit under the queue's lock: it runs in a thread, never on the event loop
+    async def _work(self):
+        purged_at = 0.0
+        while True:
+            job = await asyncio.to_thread(self.queue.claim)
+            if job is None:
+                if time.monotonic() - purged_at > 600:
+                    await asyncio.to_thread(self.queue.purge)
+                    await asyncio.to_thread(self.queue.requeue_stale)
+                    purged_at = time.monotonic()
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _heartbeat(self, job):
+        while True:
+            await asyncio.sleep(self.queue.lease / 3)
+            await asyncio.to_thread(self.queue.touch, job["id"])
+
+    async def _run(self, job):
+        try:
+            image = await asyncio.to_thread(StoredImage, job["image"])
+        except OSError as e:
+            await asyncio.to_thread(self.queue.reject, job, 410, f"Screenshot is gone: {e}")
+            self._deliver(job)
+            return
+        beat = asyncio.ensure_future(self._heartbeat(job))
+        try:
+            result = await self.handler(json.loads(job["params"]), image)
+        except PoolFull:
+            await asyncio.to_thread(self.queue.defer, job, 0.2)
+            return
+        except JobRejected as e:
+            await asyncio.to_thread(self.queue.reject, job, e.status, e.detail)
+        except asyncio.CancelledError:
+            await asyncio.to_thread(self.queue.defer, job, 0)
+            raise
+        except Exception as e:
+            log.warning("Job %s attempt %d failed: %s", job["id"], job["attempts"], e)
+            if await asyncio.to_thread(self.queue.fail, job, str(e)) == "queued":
+                return
+        else:
+            await asyncio.to_thread(self.queue.complete, job, result)
+        finally:
+            beat.cancel()
+            image.file.close()
+        self._deliver(job)
+
+    def _deliver(self, job):
+        if job["webhook"]:
+            self.webhooks.submit(self._post_webhook, job["id"], job["webhook"])
+
+    def _post_webhook(self, job_id, url):
+        payload = self.queue.get(job_id)
+        for attempt in range(WEBHOOK_ATTEMPTS):
+            try:
+                # Checked again here: the name may resolve somewhere else by now. No redirects either.
+                check_webhook_url(url)
+                res = self.session.post(url, json=payload, timeout=WEBHOOK_TIMEOUT, allow_redirects=False)
+                if res.status_code < 300:
+                    self.queue.set_webhook_status(job_id, "delivered")
+                    return
+                error = f"HTTP {res.status_code}"
+            except ValueError as e:
+                error = str(e)
+                break
+            except requests.RequestException as e:
+                error = str(e)
+            if attempt + 1 < WEBHOOK_ATTEMPTS:
+                time.sleep(min(30, 2 ** attempt))
+        log.warning("Webhook for job %s failed: %s", job_id, error)
+        self.queue.set_webhook_status(job_id, f"failed: {error}")
+
+
+class StoredImage:
+    # Stands in for an UploadFile when a job's screenshot is read back from JOBS_DIR
+    def __init__(self, path):
+        self.file = open(path, "rb")
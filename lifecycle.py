@@ -0,0 +1,91 @@
+import os, time, logging, threading
+import numpy as np
+import cv2
+from ocr import load_reader, ocr_plan
+from ocr_workers import recognizer_pool
+from registry import profile_registry
+from cache import crop_memo
+
+OCR_WARMUP = os.getenv("OCR_WARMUP", "1") == "1"  # read a synthetic screenshot of every profile before reporting ready
+OCR_WARMUP_SIZE = tuple(int(v) for v in os.getenv("OCR_WARMUP_SIZE", "1600x720").split("x"))  # width x height of those screenshots
+
+log = logging.getLogger("ocr.lifecycle")
+
+
+def synthetic_screenshot(plan):
+    # Dark text on a light frame in every ROI: digits where the ROI has an allowlist, a name otherwise
+    img = np.full((plan.height, plan.width, 3), 235, dtype=np.uint8)
+    ux0, uy0 = plan.union[:2]
+    for (x0, y0, x1, y1), _, params in plan.groups:
+        x0, y0, x1, y1 = x0 + ux0, y0 + uy0, x1 + ux0, y1 + uy0
+        h = y1 - y0
+        if h < 4 or x1 - x0 < 4:
+            continue
+        allowlist = params.get("allowlist")
+        text = "Player7"
+        if allowlist:
+            text = "".join(c for c in "1234" if c in allowlist) or allowlist[:3]
+        scale = h * 0.6 / 22  # Hershey simplex caps are ~22 px at scale 1
+        cv2.putText(img, text, (x0 + 2, y1 - max(2, h // 5)), cv2.FONT_HERSHEY_SIMPLEX, scale, (20, 20, 20), max(1, h // 12), cv2.LINE_AA)
+    return img
+
+
+class ModelState:
+    # starting -> loading -> warming -> ready, or failed. Runs once, off the event loop, from the lifespan hook:
+    # /healthz answers while it runs, /readyz only once the first real verify will not pay for cold models.
+    def __init__(self, warmup=OCR_WARMUP, size=OCR_WARMUP_SIZE):
+        self.warmup_enabled = warmup
+        self.size = size
+        self.state = "starting"
+        self.error = None
+        self.load_ms = None
+        self.warmup_ms = None
+        self.warmed = []
+        self.lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self.state == "ready"
+
+    def _set(self, state):
+        with self.lock:
+            self.state = state
+
+    def start(self):
+        try:
+            self._set("loading")
+            started = time.perf_counter()
+            load_reader()
+            # Fork the model processes before this process runs any inference (torch's thread pools are
+            # not fork-safe once used) and while the verify routes still answer 503, so no request thread
+            # is inside torch or OpenCV; the warmup then goes through them like real traffic
+            recognizer_pool.start()
+            self.load_ms = round((time.perf_counter() - started) * 1000, 1)
+            self._set("warming")
+            if self.warmup_enabled:
+                started = time.perf_counter()
+                self.warmup()
+                self.warmup_ms = round((time.perf_counter() - started) * 1000, 1)
+            self._set("ready")
+            log.info("Models ready: load %s ms, warmup %s ms", self.load_ms, self.warmup_ms)
+        except Exception as e:
+            with self.lock:
+                self.state, self.error = "failed", f"{type(e).__name__}: {e}"
+            log.exception("Model startup failed")
+
+    def warmup(self):
+        # Every profile's plan through ocr_plan: crop preprocessing, each engine its fields name (glyph
+        # atlases, the ONNX session) and recognizer batches at the widths real ROIs produce. Past the crop memo.
+        width, height = self.size
+        for (game, team_size, layout), profile in sorted(profile_registry.profiles.items()):
+            plan = profile_registry.plan(profile, width, height)
+            with crop_memo.bypassed():
+                ocr_plan(synthetic_screenshot(plan), plan)
+            self.warmed.append(f"{game}_{team_size}v{team_size}_{layout}")
+
+    def describe(self):
+        with self.lock:
+            return {"state": self.state, "error": self.error, "loadMs": self.load_ms, "warmupMs": self.warmup_ms, "warmedProfiles": list(self.warmed)}
+
+
+model_state = ModelState()
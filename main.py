@@ -1,20 +1,48 @@
-from fastapi import FastAPI, UploadFile, Form
+from fastapi import FastAPI, UploadFile, Form, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-import json
+from typing import Optional, List
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
+import os, json, time, asyncio
+from executor import ocr_executor, PoolFull, OCR_RETRY_AFTER
+from ocr_workers import recognizer_pool
+from cache import result_cache, crop_memo
+from registry import profile_registry
+from translate import translator
+from roster import rosters, RosterIndex
+from jobs import JobQueue, JobRunner, JobRejected, JOB_DEFAULT_LANE, check_webhook_url
 from models import ParsedResult, SideStats
-from ocr import load_image_bytes, crop_roi, ocr_text, bytes_hash, parse_penalties, parse_clock
-from validators import parse_int_safe, parse_percent_safe, validate_coherence_sports, normalize_label, translate_to_english, timestamps_close, pick_better_submission
-from winner import compute_winner_sports
-from ocr import load_image_bytes, crop_roi, ocr_text, bytes_hash
-from validators import parse_int_safe, parse_percent_safe, normalize_label, translate_to_english, parse_score, parse_pair_numbers
-from winner import compute_winner_fcm
-
-from ocr import load_image_bytes, crop_roi, ocr_text, bytes_hash
-from validators import parse_int_safe, fuzzy_match
-from winner import compute_winner_freefire
-
-
-app = FastAPI()
+from ocr import Upload, crop_batcher
+from pipeline import verify_upload, request_identity, VERIFY_MODE, VERIFY_MODES
+from glyphs import glyph_atlases
+from engines import engine_stats
+from screen import screen_index, screen_scope, seen_before, relevant, flag
+from matches import match_store, compare_submissions
+from lifecycle import model_state
+from metrics import metrics, Timings
+
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "500"))  # screenshots accepted by one /ocr/batch/verify request
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "0")) or ocr_executor.workers  # items of one batch on the OCR pool at once
+
+
+@asynccontextmanager
+async def lifespan(app):
+  # Models load and warm up in the background so /healthz answers at once. Verify routes answer 503 until
+  # they are ready (require_ready), so the model processes fork before any executor thread takes a verify;
+  # jobs start pulling once they are ready.
+  async def startup():
+    await run_in_threadpool(model_state.start)
+    job_runner.start()
+  await run_in_threadpool(job_queue.open)
+  starting = asyncio.create_task(startup())
+  yield
+  starting.cancel()
+  await job_runner.stop()
+  ocr_executor.shutdown()
+  recognizer_pool.shutdown()
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
   CORSMiddleware,
   allow_origins=["*"],
@@ -23,268 +51,233 @@ app.add_middleware(
   allow_headers=["*"],
 )
 
+@app.exception_handler(PoolFull)
+async def pool_full_handler(request, exc):
+  return JSONResponse(
+    status_code=503,
+    content={"detail": "OCR queue is full, retry later", "pool": ocr_executor.stats()},
+    headers={"Retry-After": str(OCR_RETRY_AFTER)}
+  )
+
+class NotReady(Exception):
+  pass
+
+@app.exception_handler(NotReady)
+async def not_ready_handler(request, exc):
+  return JSONResponse(
+    status_code=503,
+    content={"detail": "OCR models are still loading, retry later", "models": model_state.describe()},
+    headers={"Retry-After": str(OCR_RETRY_AFTER)}
+  )
+
+def require_ready():
+  if not model_state.ready:
+    raise NotReady()
+
 @app.get("/")
 def root():
-    return {"status": "OCR API is running"}
-
-
-def load_profile():
-  with open("profiles/efootball_1v1.json", "r", encoding="utf-8") as f:
-    return json.load(f)
+    return {"status": "OCR API is running", "models": model_state.state}
+
+@app.get("/healthz")
+def healthz():
+    # Liveness: only a failed model load is worth a restart
+    status = 503 if model_state.state == "failed" else 200
+    return JSONResponse(status_code=status, content=model_state.describe())
+
+@app.get("/readyz")
+def readyz():
+    # Readiness: models loaded and every profile warmed up
+    return JSONResponse(status_code=200 if model_state.ready else 503, content=model_state.describe())
+
+@app.get("/ocr/pool")
+def pool_stats():
+    return {**ocr_executor.stats(), "recognizer": recognizer_pool.stats(), "coalescing": crop_batcher.stats(), "engines": engine_stats()}
+
+@app.get("/ocr/cache")
+def cache_stats():
+    return {"results": result_cache.stats(), "crops": crop_memo.stats(), "translations": translator.stats(), "matches": match_store.stats(),
+            "screening": screen_index.stats(), "glyphAtlases": glyph_atlases.stats()}
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/profiles")
+def list_profiles():
+    return profile_registry.describe()
+
+
+@app.post("/rosters/{rosterId}")
+async def register_roster(rosterId: str, payload: dict):
+  # payload: { usernames: [registered game usernames of a match or tournament] }
+  index = rosters.put(rosterId, payload.get("usernames", []))
+  return {"rosterId": rosterId, "size": len(index), "version": index.version}
+
+
+def compare_payload(game, payload, team_size=None):
+  # Two verify results posted back by the caller, or just a matchId whose submissions the server already holds
+  if "submissions" not in payload and payload.get("matchId"):
+    match = get_match(payload["matchId"])
+    sizes = {sub["result"].get("teamSize") for sub in match["submissions"]}
+    if match["game"] != game or (team_size is not None and team_size not in sizes):
+      held = f"{match['game']} {'/'.join(f'{s}v{s}' for s in sorted(sizes, key=str))}"
+      raise HTTPException(status_code=409, detail=f"Match {payload['matchId']} holds {held} submissions, not {game}" + (f" {team_size}v{team_size}" if team_size else ""))
+    if match["compare"] is None:
+      raise HTTPException(status_code=409, detail=f"Match {payload['matchId']} has {len(match['submissions'])} submission(s), compare needs two")
+    return match["compare"]
+  subA, subB = payload["submissions"][0], payload["submissions"][1]
+  server = (payload.get("serverTimestamps") or []) + [None, None]
+  return compare_submissions(game, subA, subB, server[0], server[1])
+
+
+@app.get("/matches/{matchId}")
+def get_match(matchId: str):
+  match = match_store.get(matchId)
+  if match is None:
+    raise HTTPException(status_code=404, detail=f"Unknown match {matchId}")
+  for sub in match["submissions"]:
+    sub.pop("signatures", None)
+  return match
+
+
+def get_profile(game, team_size, layoutVersion):
+  try:
+    return profile_registry.get(game, team_size, layoutVersion)
+  except KeyError as e:
+    raise HTTPException(status_code=404, detail=e.args[0])
+
+
+def get_roster(rosterId, usernames=None):
+  # Registered names come inline or from a roster posted to /rosters/{rosterId}
+  if usernames:
+    return RosterIndex(usernames)
+  if not rosterId:
+    return None
+  roster = rosters.get(rosterId)
+  if roster is None:
+    raise HTTPException(status_code=404, detail=f"Unknown roster {rosterId}")
+  return roster
+
+
+async def verify(profile, image, debug=None, **request):
+  # Every game runs the same profile-driven pipeline; see pipeline.py
+  # debug=timings adds this request's stage and per-field breakdown under "debug"
+  if request.get("mode", VERIFY_MODE) not in VERIFY_MODES:
+    raise HTTPException(status_code=422, detail=f"mode must be one of {', '.join(VERIFY_MODES)}")
+  require_ready()
+  started = time.perf_counter()
+  timings = Timings()
+  result, extras = await cached_verify(profile, request["matchId"], image, request_identity(profile, request), timings, verify_upload, profile, request)
+  # Screening is judged against this request every time, cached result or not: an exact copy first sent
+  # by someone else, else what the content resembles when it was first read
+  digest = result["meta"]["bytesHash"]
+  similar = seen_before(screen_scope(profile, request), digest, request) or relevant(extras.get("screening"), digest, request)
+  if similar is not None:
+    flag(result, similar, request)
+  # Keep this side's result on the match; the second submission triggers the compare
+  if match_store.db is None:
+    match_store.record(request["matchId"], request["userId"], result, extras.get("signatures"))
+  else:
+    await run_in_threadpool(match_store.record, request["matchId"], request["userId"], result, extras.get("signatures"))
+  total = time.perf_counter() - started
+  metrics.record(profile, timings, total, result["meta"].get("cached", False))
+  if debug == "timings":
+    result = {**result, "debug": {"timings": timings.describe(total)}}
+  return result
+
+
+async def cache_get(key):
+  # The memory tier answers on the event loop; only a lookup that falls through to RESULT_CACHE_DB goes to a thread
+  result = result_cache.get(key, disk=False)
+  if result is None and result_cache.db is not None:
+    result = await run_in_threadpool(result_cache.get, key)
+  return result
+
+async def cache_put(key, value):
+  if result_cache.db is None:
+    result_cache.put(key, value)
+  else:
+    await run_in_threadpool(result_cache.put, key, value)
+
+
+async def cached_verify(profile, matchId, image, identity, timings, job, *args):
+  # Same screenshot + same profile + same registered names -> same verify result, so skip decode and OCR.
+  # The job gets the Upload as its last argument; its "_timings" go into `timings`. -> (result, extras):
+  # the job's "_screening" and "_signatures", cached apart from the result so it only holds what is returned.
+  with timings.stage("hash"):
+    upload = await run_in_threadpool(Upload, image.file)
+  key = result_cache.key(upload.digest, profile.get("game"), profile.get("teamSize"), profile.get("layoutVersion"), profile_registry.hash_of(profile), *identity)
+  extras_key = result_cache.key(key, "extras")
+  result = await cache_get(key)
+  extras = await cache_get(extras_key) if result is not None else None
+  if result is None or extras is None:
+    try:
+      # Released once the worker is done with it, also when this request is cancelled while it runs
+      result = await ocr_executor.run(job, *args, upload, done=upload.release)
+    except PoolFull:
+      # A caller that waits for a slot (batch items) retries with the same UploadFile
+      upload.release(close=False)
+      raise
+    found = Timings.from_dict(result.pop("_timings", None))
+    timings.stages.update(found.stages)
+    timings.rois.extend(found.rois)
+    extras = {"screening": result.pop("_screening", None), "signatures": result.pop("_signatures", None)}
+    # A label read raw because its translation missed the budget may read differently once the
+    # translation lands: that result is returned but not cached
+    if not result.pop("_fallbacks", 0):
+      await cache_put(key, result)
+      await cache_put(extras_key, extras)
+  else:
+    upload.release()
+    result["meta"]["cached"] = True
+  result["meta"]["matchId"] = matchId
+  return result, extras
+
+
+def load_profile(layoutVersion="v1"):
+  return get_profile("efootball", 1, layoutVersion)
 
 @app.post("/ocr/efootball/verify")
 async def efootball_verify(
   matchId: str = Form(...),
   userId: str = Form(...),
   layoutVersion: str = Form("v1"),
+  tournamentId: Optional[str] = Form(None),   # screenshots are screened for near-duplicates per tournament
+  mode: str = Form(VERIFY_MODE),
+  debug: Optional[str] = Form(None),   # "timings": per-stage breakdown under "debug"
   image: UploadFile = UploadFile(...)
 ):
-  profile = load_profile()
-  img, raw_bytes, exif_time = load_image_bytes(image)
-
-  roi = profile["roi"]
-  labels = profile.get("labels", {})
-
-  # Read full-time/in-progress banner ROI text and normalize
-  banner_txt = ocr_text(crop_roi(img, roi["title_full_time"]))
-  banner_label = normalize_label(banner_txt, { "full_time": labels.get("full_time", []), "in_progress": labels.get("in_progress", []) })
-  is_full_time = (banner_label == "full_time")
-
-  # If banner shows time format (e.g., 54:34), capture clock seconds
-  in_progress_clock = parse_clock(banner_txt)
-
-  # Extract usernames and stats
-  teamA_user_raw = ocr_text(crop_roi(img, roi["teamA_user"]))
-  teamB_user_raw = ocr_text(crop_roi(img, roi["teamB_user"]))
-
-  teamA_goals = parse_int_safe(ocr_text(crop_roi(img, roi["teamA_goals"])))
-  teamB_goals = parse_int_safe(ocr_text(crop_roi(img, roi["teamB_goals"])))
-
-  teamA_sot = parse_int_safe(ocr_text(crop_roi(img, roi["teamA_shots_on_target"])))
-  teamB_sot = parse_int_safe(ocr_text(crop_roi(img, roi["teamB_shots_on_target"])))
-
-  teamA_pos = parse_percent_safe(ocr_text(crop_roi(img, roi["teamA_possession"])))
-  teamB_pos = parse_percent_safe(ocr_text(crop_roi(img, roi["teamB_possession"])))
-
-  # Penalties block
-  penaltiesA, penaltiesB = parse_penalties(ocr_text(crop_roi(img, roi["penalties_block"])))
-
-  sideA = { "userName": teamA_user_raw, "goals": teamA_goals, "shotsOnTarget": teamA_sot, "possession": teamA_pos, "penalties": penaltiesA, "raw": {} }
-  sideB = { "userName": teamB_user_raw, "goals": teamB_goals, "shotsOnTarget": teamB_sot, "possession": teamB_pos, "penalties": penaltiesB, "raw": {} }
-
-  coh_ok, notes = validate_coherence_sports(sideA, sideB)
-
-  winner, tieBreak = compute_winner_sports(sideA, sideB, "efootball", allow_penalties=True, penaltiesA=penaltiesA, penaltiesB=penaltiesB)
-
-  bytes_hash_hex = bytes_hash(raw_bytes)
-  resolution = f"{img.shape[1]}x{img.shape[0]}"
-  orientation = "landscape" if img.shape[1] >= img.shape[0] else "portrait"
-
-  # Confidence heuristic
-  filled = sum([1 for v in [teamA_goals, teamB_goals, teamA_sot, teamB_sot, teamA_pos, teamB_pos] if v is not None])
-  confidence = min(0.99, 0.6 + filled * 0.06)
-  if not is_full_time and in_progress_clock is None:
-    confidence -= 0.15
-
-  return {
-    "game": "efootball",
-    "teamSize": 1,
-    "sideA": sideA,
-    "sideB": sideB,
-    "meta": {
-      "matchId": matchId,
-      "bytesHash": bytes_hash_hex,
-      "resolution": resolution,
-      "orientation": orientation,
-      "isFullTime": is_full_time,
-      "bannerText": banner_txt,
-      "clockSeconds": in_progress_clock,
-      "timestamp": exif_time  # may be None
-    },
-    "coherence": { "ok": coh_ok, "notes": notes },
-    "winner": winner,
-    "tieBreak": tieBreak,
-    "confidence": round(confidence, 2)
-  }
+  return await verify(load_profile(layoutVersion), image, matchId=matchId, userId=userId, tournamentId=tournamentId, mode=mode, debug=debug)
 
 @app.post("/ocr/efootball/compare")
 async def efootball_compare(payload: dict):
-  # payload: { submissions: [ParsedResultA, ParsedResultB], serverTimestamps: [isoA, isoB] }
-  subA, subB = payload["submissions"][0], payload["submissions"][1]
-  tsA = subA["meta"].get("timestamp") or payload.get("serverTimestamps", [None, None])[0]
-  tsB = subB["meta"].get("timestamp") or payload.get("serverTimestamps", [None, None])[1]
-
-  # Prefer full-time submission; else prefer later timestamp
-  preferred = pick_better_submission(subA["meta"], subB["meta"])
-
-  # Timestamp alignment check (if both timestamps exist)
-  aligned = (tsA and tsB and timestamps_close(tsA, tsB)) or False
-
-  # Winner consistency (if both computed)
-  winA, winB = subA.get("winner"), subB.get("winner")
-  final_winner = winA if winA == winB and winA is not None else (winA if preferred == "A" else winB)
-
-  confidence = round((subA.get("confidence", 0.6) + subB.get("confidence", 0.6)) / 2.0, 2)
-  if preferred == "A" and subA["meta"].get("isFullTime"): confidence += 0.05
-  if preferred == "B" and subB["meta"].get("isFullTime"): confidence += 0.05
-  if aligned: confidence += 0.04
-
-  return {
-    "aligned": aligned,
-    "preferred": preferred,
-    "winner": final_winner,
-    "tieBreak": subA.get("tieBreak") if preferred == "A" else subB.get("tieBreak"),
-    "confidence": min(0.99, confidence)
-  }
-
-
+  # payload: { submissions: [ParsedResultA, ParsedResultB], serverTimestamps: [isoA, isoB] } or { matchId }
+  return compare_payload("efootball", payload)
 
 
-
-def load_profile_fcm():
-    with open("profiles/fcm_1v1.json", "r", encoding="utf-8") as f:
-        return json.load(f)
+def load_profile_fcm(layoutVersion="v1"):
+    return get_profile("fcm", 1, layoutVersion)
 
 @app.post("/ocr/fcm/verify")
 async def fcm_verify(
     matchId: str = Form(...),
     userId: str = Form(...),
     layoutVersion: str = Form("v1"),
+    tournamentId: Optional[str] = Form(None),
+    mode: str = Form(VERIFY_MODE),
+    debug: Optional[str] = Form(None),
     image: UploadFile = UploadFile(...)
 ):
-    profile = load_profile_fcm()
-    roi = profile["roi"]
-    labels = profile.get("labels", {})
-    img, raw_bytes, exif_time = load_image_bytes(image)
-
-    # Usernames
-    uploader_user = ocr_text(crop_roi(img, roi["uploader_user"]))
-    opponent_user = ocr_text(crop_roi(img, roi["opponent_user"]))
-
-    # Score + full time clock
-    score_txt = ocr_text(crop_roi(img, roi["score_block"]))
-    goals_opponent, goals_uploader = parse_score(score_txt)
-    clock_txt = ocr_text(crop_roi(img, roi["clock_full_time"]))
-    clock_norm = normalize_label(clock_txt, { "full_time": labels.get("full_time", []) })
-    is_full_time = (clock_norm == "full_time") or ("90" in clock_txt)
-
-    # Shots / Shots on Target / Possession
-    opp_shots_txt = ocr_text(crop_roi(img, roi["opponent_shots"]))
-    up_shots_txt = ocr_text(crop_roi(img, roi["uploader_shots"]))
-    shots_opponent, shots_uploader = parse_pair_numbers(opp_shots_txt, up_shots_txt)
-
-    opp_sot_txt = ocr_text(crop_roi(img, roi["opponent_sot"]))
-    up_sot_txt = ocr_text(crop_roi(img, roi["uploader_sot"]))
-    sot_opponent, sot_uploader = parse_pair_numbers(opp_sot_txt, up_sot_txt)
-
-    opp_pos_txt = ocr_text(crop_roi(img, roi["opponent_possession"]))
-    up_pos_txt = ocr_text(crop_roi(img, roi["uploader_possession"]))
-    pos_opponent = parse_percent_safe(opp_pos_txt)
-    pos_uploader = parse_percent_safe(up_pos_txt)
-
-    # Build sides normalized to platform: SideA = uploader, SideB = opponent
-    sideA = {
-        "userName": uploader_user,
-        "goals": goals_uploader,
-        "shotsOnTarget": sot_uploader,
-        "possession": pos_uploader,
-        "raw": {}
-    }
-    sideB = {
-        "userName": opponent_user,
-        "goals": goals_opponent,
-        "shotsOnTarget": sot_opponent,
-        "possession": pos_opponent,
-        "raw": {}
-    }
-
-    # Winner and confidence
-    winner, tieBreak = compute_winner_fcm(sideA, sideB)
-
-    notes = []
-    if sot_uploader and shots_uploader and sot_uploader > shots_uploader:
-        notes.append("Uploader shots on goal > shots")
-    if sot_opponent and shots_opponent and sot_opponent > shots_opponent:
-        notes.append("Opponent shots on goal > shots")
-    if pos_uploader and pos_opponent:
-        total = pos_uploader + pos_opponent
-        if abs(100 - total) > 3:
-            notes.append("Possession does not sum to ~100")
-
-    filled = sum([1 for v in [goals_uploader, goals_opponent, sot_uploader, sot_opponent, pos_uploader, pos_opponent] if v is not None])
-    confidence = min(0.99, 0.6 + filled * 0.06)
-    if not is_full_time:
-        confidence -= 0.08
-
-    return {
-        "game": "fcm",
-        "teamSize": 1,
-        "sideA": sideA,
-        "sideB": sideB,
-        "meta": {
-            "matchId": matchId,
-            "bytesHash": bytes_hash(raw_bytes),
-            "resolution": f"{img.shape[1]}x{img.shape[0]}",
-            "orientation": "landscape" if img.shape[1] >= img.shape[0] else "portrait",
-            "isFullTime": is_full_time,
-            "clockText": clock_txt,
-            "timestamp": exif_time
-        },
-        "coherence": { "ok": len(notes) == 0, "notes": notes },
-        "winner": winner,
-        "tieBreak": tieBreak,
-        "confidence": round(confidence, 2)
-    }
+    return await verify(load_profile_fcm(layoutVersion), image, matchId=matchId, userId=userId, tournamentId=tournamentId, mode=mode, debug=debug)
 
 @app.post("/ocr/fcm/compare")
 async def fcm_compare(payload: dict):
-    # payload: { submissions: [A, B], serverTimestamps: [isoA, isoB] }
-    subA, subB = payload["submissions"][0], payload["submissions"][1]
-    tsA = subA["meta"].get("timestamp") or (payload.get("serverTimestamps") or [None])[0]
-    tsB = subB["meta"].get("timestamp") or (payload.get("serverTimestamps") or [None])[1]
-
-    # Prefer full-time; else later timestamp
-    preferred = "A"
-    if subA["meta"].get("isFullTime") and not subB["meta"].get("isFullTime"):
-        preferred = "A"
-    elif subB["meta"].get("isFullTime") and not subA["meta"].get("isFullTime"):
-        preferred = "B"
-    else:
-        try:
-            from datetime import datetime
-            a = datetime.fromisoformat((tsA or "").replace("Z",""))
-            b = datetime.fromisoformat((tsB or "").replace("Z",""))
-            preferred = "A" if a > b else "B"
-        except Exception:
-            preferred = "A"
-
-    # Winner consistency
-    winA, winB = subA.get("winner"), subB.get("winner")
-    final_winner = winA if winA == winB and winA is not None else (winA if preferred == "A" else winB)
-
-    # Confidence heuristic
-    confidence = round((subA.get("confidence", 0.6) + subB.get("confidence", 0.6)) / 2.0, 2)
-    if (preferred == "A" and subA["meta"].get("isFullTime")) or (preferred == "B" and subB["meta"].get("isFullTime")):
-        confidence = min(0.99, confidence + 0.05)
-
-    return {
-        "aligned": bool(tsA and tsB),
-        "preferred": preferred,
-        "winner": final_winner,
-        "tieBreak": subA.get("tieBreak") if preferred == "A" else subB.get("tieBreak"),
-        "confidence": confidence
-    }
-
-
-from ocr import load_image_bytes, crop_roi, ocr_text, bytes_hash
-from validators import parse_int_safe, parse_percent_safe, normalize_label, parse_score, estimate_sot, fuzzy_match
-from winner import compute_winner_dls
-
+    # payload: { submissions: [A, B], serverTimestamps: [isoA, isoB] } or { matchId }
+    return compare_payload("fcm", payload)
 
 
-def load_profile_dls():
-    with open("profiles/dls_1v1.json", "r", encoding="utf-8") as f:
-        return json.load(f)
+def load_profile_dls(layoutVersion="v1"):
+    return get_profile("dls", 1, layoutVersion)
 
 @app.post("/ocr/dls/verify")
 async def dls_verify(
@@ -293,182 +286,19 @@ async def dls_verify(
     uploaderGameUser: str = Form(...),   # registered DLS username for uploader
     opponentGameUser: str = Form(...),   # registered DLS username for opponent
     layoutVersion: str = Form("v1"),
+    tournamentId: Optional[str] = Form(None),
+    mode: str = Form(VERIFY_MODE),
+    debug: Optional[str] = Form(None),
     image: UploadFile = UploadFile(...)
 ):
-    profile = load_profile_dls()
-    roi = profile["roi"]; labels = profile.get("labels", {})
-    img, raw_bytes, exif_time = load_image_bytes(image)
-
-    # OCR usernames (left/right)
-    left_user = ocr_text(crop_roi(img, roi["left_user"]))
-    right_user = ocr_text(crop_roi(img, roi["right_user"]))
-
-    # Decide which side is uploader/opponent via fuzzy match to registered names
-    left_is_uploader = fuzzy_match(left_user, uploaderGameUser)
-    right_is_uploader = fuzzy_match(right_user, uploaderGameUser)
-
-    if left_is_uploader and not right_is_uploader:
-        uploader_side = "left"; opponent_side = "right"
-        uploader_user = left_user; opponent_user = right_user
-    elif right_is_uploader and not left_is_uploader:
-        uploader_side = "right"; opponent_side = "left"
-        uploader_user = right_user; opponent_user = left_user
-    else:
-        # Ambiguous—fallback to exact match first, else mark for review
-        if left_user.strip().lower() == uploaderGameUser.strip().lower():
-            uploader_side = "left"; opponent_side = "right"
-            uploader_user = left_user; opponent_user = right_user
-        elif right_user.strip().lower() == uploaderGameUser.strip().lower():
-            uploader_side = "right"; opponent_side = "left"
-            uploader_user = right_user; opponent_user = left_user
-        else:
-            uploader_side = None; opponent_side = None
-            uploader_user = left_user; opponent_user = right_user  # still return OCR values
-
-    # Score + full time
-    score_txt = ocr_text(crop_roi(img, roi["score_block"]))
-    goals_left, goals_right = parse_score(score_txt)
-    clock_txt = ocr_text(crop_roi(img, roi["clock_full_time"]))
-    clock_norm = normalize_label(clock_txt, { "full_time": labels.get("full_time", []) })
-    is_full_time = (clock_norm == "full_time") or ("90" in clock_txt)
-
-    # Stats per side
-    shots_left = parse_int_safe(ocr_text(crop_roi(img, roi["left_shots"])))
-    shots_right = parse_int_safe(ocr_text(crop_roi(img, roi["right_shots"])))
-
-    acc_left = parse_percent_safe(ocr_text(crop_roi(img, roi["left_shot_accuracy"])))
-    acc_right = parse_percent_safe(ocr_text(crop_roi(img, roi["right_shot_accuracy"])))
-
-    pos_left = parse_percent_safe(ocr_text(crop_roi(img, roi["left_possession"])))
-    pos_right = parse_percent_safe(ocr_text(crop_roi(img, roi["right_possession"])))
-
-    # Estimated SOT
-    sot_left = estimate_sot(shots_left, acc_left)
-    sot_right = estimate_sot(shots_right, acc_right)
-
-    # Map to platform sides: SideA = uploader, SideB = opponent
-    def pick(side):
-        if side == "left":
-            return {
-                "userName": left_user,
-                "goals": goals_left,
-                "shotsOnTarget": sot_left,
-                "possession": pos_left,
-                "raw": { "shots": shots_left, "shotAccuracy": acc_left }
-            }
-        else:
-            return {
-                "userName": right_user,
-                "goals": goals_right,
-                "shotsOnTarget": sot_right,
-                "possession": pos_right,
-                "raw": { "shots": shots_right, "shotAccuracy": acc_right }
-            }
-
-    if uploader_side and opponent_side:
-        sideA = pick(uploader_side)
-        sideB = pick(opponent_side)
-    else:
-        # Ambiguous identity—return both sides but mark low confidence
-        sideA = pick("left")
-        sideB = pick("right")
-
-    winner, tieBreak = compute_winner_dls(sideA, sideB)
-
-    notes = []
-    if sideA["raw"]["shots"] is not None and sideA["shotsOnTarget"] is not None and sideA["shotsOnTarget"] > sideA["raw"]["shots"]:
-        notes.append("Uploader estimated SOT > shots")
-    if sideB["raw"]["shots"] is not None and sideB["shotsOnTarget"] is not None and sideB["shotsOnTarget"] > sideB["raw"]["shots"]:
-        notes.append("Opponent estimated SOT > shots")
-    if sideA["possession"] is not None and sideB["possession"] is not None:
-        total = sideA["possession"] + sideB["possession"]
-        if abs(100 - total) > 3:
-            notes.append("Possession does not sum to ~100")
-    if not (left_is_uploader or right_is_uploader):
-        notes.append("Username match ambiguous—manual review may be required")
-
-    filled = sum([1 for v in [
-        sideA["goals"], sideB["goals"],
-        sideA["shotsOnTarget"], sideB["shotsOnTarget"],
-        sideA["possession"], sideB["possession"]
-    ] if v is not None])
-    confidence = min(0.99, 0.6 + filled * 0.06)
-    if not is_full_time:
-        confidence -= 0.08
-    if not (left_is_uploader or right_is_uploader):
-        confidence -= 0.10
-
-    return {
-        "game": "dls",
-        "teamSize": 1,
-        "sideA": sideA,
-        "sideB": sideB,
-        "meta": {
-            "matchId": matchId,
-            "bytesHash": bytes_hash(raw_bytes),
-            "resolution": f"{img.shape[1]}x{img.shape[0]}",
-            "orientation": "landscape" if img.shape[1] >= img.shape[0] else "portrait",
-            "isFullTime": is_full_time,
-            "clockText": clock_txt,
-            "timestamp": exif_time,
-            "identity": {
-                "leftUserOCR": left_user,
-                "rightUserOCR": right_user,
-                "uploaderGameUser": uploaderGameUser,
-                "opponentGameUser": opponentGameUser,
-                "uploaderSide": uploader_side
-            }
-        },
-        "coherence": { "ok": len(notes) == 0, "notes": notes },
-        "winner": winner,
-        "tieBreak": tieBreak,
-        "confidence": round(confidence, 2)
-    }
-
+    return await verify(load_profile_dls(layoutVersion), image, matchId=matchId, userId=userId,
+                        uploaderGameUser=uploaderGameUser, opponentGameUser=opponentGameUser, tournamentId=tournamentId, mode=mode, debug=debug)
 
 @app.post("/ocr/dls/compare")
 async def dls_compare(payload: dict):
-    subA, subB = payload["submissions"][0], payload["submissions"][1]
-    tsA = subA["meta"].get("timestamp") or (payload.get("serverTimestamps") or [None])[0]
-    tsB = subB["meta"].get("timestamp") or (payload.get("serverTimestamps") or [None])[1]
-
-    preferred = "A"
-    if subA["meta"].get("isFullTime") and not subB["meta"].get("isFullTime"):
-        preferred = "A"
-    elif subB["meta"].get("isFullTime") and not subA["meta"].get("isFullTime"):
-        preferred = "B"
-    else:
-        try:
-            from datetime import datetime
-            a = datetime.fromisoformat((tsA or "").replace("Z",""))
-            b = datetime.fromisoformat((tsB or "").replace("Z",""))
-            preferred = "A" if a > b else "B"
-        except Exception:
-            preferred = "A"
-
-    winA, winB = subA.get("winner"), subB.get("winner")
-    final_winner = winA if winA == winB and winA is not None else (winA if preferred == "A" else winB)
-
-    confidence = round((subA.get("confidence", 0.6) + subB.get("confidence", 0.6)) / 2.0, 2)
-    if (preferred == "A" and subA["meta"].get("isFullTime")) or (preferred == "B" and subB["meta"].get("isFullTime")):
-        confidence = min(0.99, confidence + 0.05)
-
-    return {
-        "aligned": bool(tsA and tsB),
-        "preferred": preferred,
-        "winner": final_winner,
-        "tieBreak": subA.get("tieBreak") if preferred == "A" else subB.get("tieBreak"),
-        "confidence": confidence
-    }
-
-
-
+    return compare_payload("dls", payload)
 
 
-def load_profile_freefire():
-    with open("profiles/freefire_4v4.json", "r", encoding="utf-8") as f:
-        return json.load(f)
-
 @app.post("/ocr/freefire/verify")
 async def freefire_verify(
     matchId: str = Form(...),
@@ -476,125 +306,22 @@ async def freefire_verify(
     uploaderGameUser: str = Form(...),
     opponentGameUser: str = Form(...),
     layoutVersion: str = Form("v1"),
+    tournamentId: Optional[str] = Form(None),
+    rosterId: Optional[str] = Form(None),
+    mode: str = Form(VERIFY_MODE),
+    debug: Optional[str] = Form(None),
     image: UploadFile = UploadFile(...)
 ):
-    profile = load_profile_freefire(4)
-    roi = profile["roi"]
-    img, raw_bytes, exif_time = load_image_bytes(image)
-
-    # OCR usernames + stats
-    left_users, right_users = [], []
-    left_kills, right_kills = [], []
-    left_damage, right_damage = [], []
-
-    for i in range(4):
-        left_users.append(ocr_text(crop_roi(img, roi["left_usernames"][i])))
-        right_users.append(ocr_text(crop_roi(img, roi["right_usernames"][i])))
-
-        left_kills.append(parse_int_safe(ocr_text(crop_roi(img, roi["left_kills"][i]))))
-        right_kills.append(parse_int_safe(ocr_text(crop_roi(img, roi["right_kills"][i]))))
-
-        left_damage.append(parse_int_safe(ocr_text(crop_roi(img, roi["left_damage"][i]))))
-        right_damage.append(parse_int_safe(ocr_text(crop_roi(img, roi["right_damage"][i]))))
-
-    # Aggregate team stats
-    total_left_kills = sum([k for k in left_kills if k is not None])
-    total_right_kills = sum([k for k in right_kills if k is not None])
-    total_left_damage = sum([d for d in left_damage if d is not None])
-    total_right_damage = sum([d for d in right_damage if d is not None])
-
-    sideA = {
-        "userNames": left_users,
-        "kills": left_kills,
-        "damage": left_damage,
-        "totalKills": total_left_kills,
-        "totalDamage": total_left_damage,
-        "mvp": left_users[0] if left_users else None
-    }
-    sideB = {
-        "userNames": right_users,
-        "kills": right_kills,
-        "damage": right_damage,
-        "totalKills": total_right_kills,
-        "totalDamage": total_right_damage,
-        "mvp": right_users[0] if right_users else None
-    }
-
-    winner, tieBreak = compute_winner_freefire(sideA, sideB)
-
-    notes = []
-    if not fuzzy_match(uploaderGameUser, " ".join(sideA["userNames"])):
-        notes.append("Uploader username mismatch")
-    if not fuzzy_match(opponentGameUser, " ".join(sideB["userNames"])):
-        notes.append("Opponent username mismatch")
-
-    confidence = 0.95
-    if notes:
-        confidence -= 0.15
-
-    return {
-        "game": "freefire",
-        "teamSize": 4,
-        "sideA": sideA,
-        "sideB": sideB,
-        "winner": winner,
-        "tieBreak": tieBreak,
-        "confidence": round(confidence, 2),
-        "meta": {
-            "matchId": matchId,
-            "bytesHash": bytes_hash(raw_bytes),
-            "resolution": f"{img.shape[1]}x{img.shape[0]}",
-            "orientation": "landscape" if img.shape[1] >= img.shape[0] else "portrait",
-            "timestamp": exif_time
-        },
-        "coherence": { "ok": len(notes) == 0, "notes": notes }
-    }
+    return await freefire_verify_generic(4, matchId, userId, uploaderGameUser, opponentGameUser, image, layoutVersion, rosterId, mode, tournamentId, debug)
 
 @app.post("/ocr/freefire/compare")
 async def freefire_compare(payload: dict):
-    subA, subB = payload["submissions"][0], payload["submissions"][1]
-    tsA = subA["meta"].get("timestamp") or (payload.get("serverTimestamps") or [None])[0]
-    tsB = subB["meta"].get("timestamp") or (payload.get("serverTimestamps") or [None])[1]
-
-    preferred = "A"
-    try:
-        from datetime import datetime
-        a = datetime.fromisoformat((tsA or "").replace("Z",""))
-        b = datetime.fromisoformat((tsB or "").replace("Z",""))
-        preferred = "A" if a > b else "B"
-    except Exception:
-        preferred = "A"
-
-    winA, winB = subA.get("winner"), subB.get("winner")
-    final_winner = winA if winA == winB and winA is not None else (winA if preferred == "A" else winB)
-
-    confidence = round((subA.get("confidence", 0.6) + subB.get("confidence", 0.6)) / 2.0, 2)
-    if preferred == "A" and winA is not None:
-        confidence = min(0.99, confidence + 0.05)
-    elif preferred == "B" and winB is not None:
-        confidence = min(0.99, confidence + 0.05)
-
-    return {
-        "aligned": bool(tsA and tsB),
-        "preferred": preferred,
-        "winner": final_winner,
-        "tieBreak": subA.get("tieBreak") if preferred == "A" else subB.get("tieBreak"),
-        "confidence": confidence
-    }
-
-
-
-from  ocr import load_image_bytes, crop_roi, ocr_text, bytes_hash
-from  validators import parse_int_safe, fuzzy_match
-from  winner import compute_winner_freefire
-
+    return compare_payload("freefire", payload)
 
 
 # Utility: load profile by team size
-def load_profile_freefire(team_size: int):
-    path = f"profiles/freefire_{team_size}v{team_size}.json"
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+def load_profile_freefire(team_size: int, layoutVersion="v1"):
+    return get_profile("freefire", team_size, layoutVersion)
 
 # ---------- VERIFY ROUTES ----------
 
@@ -604,9 +331,14 @@ async def freefire_verify_1v1(
     userId: str = Form(...),
     uploaderGameUser: str = Form(...),
     opponentGameUser: str = Form(...),
+    layoutVersion: str = Form("v1"),
+    tournamentId: Optional[str] = Form(None),
+    rosterId: Optional[str] = Form(None),
+    mode: str = Form(VERIFY_MODE),
+    debug: Optional[str] = Form(None),
     image: UploadFile = UploadFile(...)
 ):
-    return await freefire_verify_generic(1, matchId, userId, uploaderGameUser, opponentGameUser, image)
+    return await freefire_verify_generic(1, matchId, userId, uploaderGameUser, opponentGameUser, image, layoutVersion, rosterId, mode, tournamentId, debug)
 
 @app.post("/ocr/freefire/verify/2")
 async def freefire_verify_2v2(
@@ -614,9 +346,14 @@ async def freefire_verify_2v2(
     userId: str = Form(...),
     uploaderGameUser: str = Form(...),
     opponentGameUser: str = Form(...),
+    layoutVersion: str = Form("v1"),
+    tournamentId: Optional[str] = Form(None),
+    rosterId: Optional[str] = Form(None),
+    mode: str = Form(VERIFY_MODE),
+    debug: Optional[str] = Form(None),
     image: UploadFile = UploadFile(...)
 ):
-    return await freefire_verify_generic(2, matchId, userId, uploaderGameUser, opponentGameUser, image)
+    return await freefire_verify_generic(2, matchId, userId, uploaderGameUser, opponentGameUser, image, layoutVersion, rosterId, mode, tournamentId, debug)
 
 # ---------- COMPARE ROUTES ----------
 
@@ -630,104 +367,17 @@ async def freefire_compare_2v2(payload: dict):
 
 # ---------- GENERIC VERIFY FUNCTION ----------
 
-async def freefire_verify_generic(team_size, matchId, userId, uploaderGameUser, opponentGameUser, image):
-    profile = load_profile_freefire(team_size)
-    roi = profile["roi"]
-    img, raw_bytes, exif_time = load_image_bytes(image)
-
-    left_users, right_users = [], []
-    left_kills, right_kills = [], []
-    left_damage, right_damage = [], []
-
-    for i in range(team_size):
-        left_users.append(ocr_text(crop_roi(img, roi["left_usernames"][i])))
-        right_users.append(ocr_text(crop_roi(img, roi["right_usernames"][i])))
-
-        left_kills.append(parse_int_safe(ocr_text(crop_roi(img, roi["left_kills"][i]))))
-        right_kills.append(parse_int_safe(ocr_text(crop_roi(img, roi["right_kills"][i]))))
-
-        left_damage.append(parse_int_safe(ocr_text(crop_roi(img, roi["left_damage"][i]))))
-        right_damage.append(parse_int_safe(ocr_text(crop_roi(img, roi["right_damage"][i]))))
-
-    sideA = {
-        "userNames": left_users,
-        "kills": left_kills,
-        "damage": left_damage,
-        "totalKills": sum([k for k in left_kills if k is not None]),
-        "totalDamage": sum([d for d in left_damage if d is not None]),
-        "mvp": left_users[0] if left_users else None
-    }
-    sideB = {
-        "userNames": right_users,
-        "kills": right_kills,
-        "damage": right_damage,
-        "totalKills": sum([k for k in right_kills if k is not None]),
-        "totalDamage": sum([d for d in right_damage if d is not None]),
-        "mvp": right_users[0] if right_users else None
-    }
-
-    winner, tieBreak = compute_winner_freefire(sideA, sideB)
-
-    notes = []
-    if not fuzzy_match(uploaderGameUser, " ".join(sideA["userNames"])):
-        notes.append("Uploader username mismatch")
-    if not fuzzy_match(opponentGameUser, " ".join(sideB["userNames"])):
-        notes.append("Opponent username mismatch")
-
-    confidence = 0.95
-    if notes:
-        confidence -= 0.15
-
-    return {
-        "game": "freefire",
-        "teamSize": team_size,
-        "sideA": sideA,
-        "sideB": sideB,
-        "winner": winner,
-        "tieBreak": tieBreak,
-        "confidence": round(confidence, 2),
-        "meta": {
-            "matchId": matchId,
-            "bytesHash": bytes_hash(raw_bytes),
-            "resolution": f"{img.shape[1]}x{img.shape[0]}",
-            "orientation": "landscape" if img.shape[1] >= img.shape[0] else "portrait",
-            "timestamp": exif_time
-        },
-        "coherence": { "ok": len(notes) == 0, "notes": notes }
-    }
+async def freefire_verify_generic(team_size, matchId, userId, uploaderGameUser, opponentGameUser, image, layoutVersion="v1", rosterId=None, mode=VERIFY_MODE, tournamentId=None, debug=None):
+    profile = load_profile_freefire(team_size, layoutVersion)
+    return await verify(profile, image, matchId=matchId, userId=userId, uploaderGameUser=uploaderGameUser,
+                        opponentGameUser=opponentGameUser, roster=get_roster(rosterId), tournamentId=tournamentId, mode=mode, debug=debug)
 
 # ---------- GENERIC COMPARE FUNCTION ----------
 
 def freefire_compare_generic(team_size, payload: dict):
-    subA, subB = payload["submissions"][0], payload["submissions"][1]
-    tsA = subA["meta"].get("timestamp")
-    tsB = subB["meta"].get("timestamp")
+    # The per-size routes never looked at serverTimestamps
+    return compare_payload("freefire", {**payload, "serverTimestamps": None}, team_size)
 
-    preferred = "A"
-    try:
-        from datetime import datetime
-        a = datetime.fromisoformat((tsA or "").replace("Z",""))
-        b = datetime.fromisoformat((tsB or "").replace("Z",""))
-        preferred = "A" if a > b else "B"
-    except Exception:
-        preferred = "A"
-
-    winA, winB = subA.get("winner"), subB.get("winner")
-    final_winner = winA if winA == winB and winA is not None else (winA if preferred == "A" else winB)
-
-    confidence = round((subA.get("confidence", 0.6) + subB.get("confidence", 0.6)) / 2.0, 2)
-    if preferred == "A" and winA is not None:
-        confidence = min(0.99, confidence + 0.05)
-    elif preferred == "B" and winB is not None:
-        confidence = min(0.99, confidence + 0.05)
-
-    return {
-        "aligned": bool(tsA and tsB),
-        "preferred": preferred,
-        "winner": final_winner,
-        "tieBreak": subA.get("tieBreak") if preferred == "A" else subB.get("tieBreak"),
-        "confidence": confidence
-    }
 
 # ---------- VERIFY ROUTES ----------
 
@@ -737,12 +387,171 @@ async def freefire_verify_3v3(
     userId: str = Form(...),
     uploaderGameUser: str = Form(...),
     opponentGameUser: str = Form(...),
+    layoutVersion: str = Form("v1"),
+    tournamentId: Optional[str] = Form(None),
+    rosterId: Optional[str] = Form(None),
+    mode: str = Form(VERIFY_MODE),
+    debug: Optional[str] = Form(None),
     image: UploadFile = UploadFile(...)
 ):
-    return await freefire_verify_generic(3, matchId, userId, uploaderGameUser, opponentGameUser, image)
+    return await freefire_verify_generic(3, matchId, userId, uploaderGameUser, opponentGameUser, image, layoutVersion, rosterId, mode, tournamentId, debug)
 
 # ---------- COMPARE ROUTES ----------
 
 @app.post("/ocr/freefire/compare/3")
 async def freefire_compare_3v3(payload: dict):
     return freefire_compare_generic(3, payload)
+
+
+# ---------- BATCH VERIFY ----------
+
+BATCH_REQUIRED = {
+    "efootball": ("matchId", "userId"),
+    "fcm": ("matchId", "userId"),
+    "dls": ("matchId", "userId", "uploaderGameUser", "opponentGameUser"),
+    "freefire": ("matchId", "userId", "uploaderGameUser", "opponentGameUser"),
+}
+
+def check_item(item):
+    # Input errors a batch item or queued job can be rejected with up front
+    game = item.get("game")
+    if game not in BATCH_REQUIRED:
+        raise HTTPException(status_code=400, detail=f"Unsupported game {game}")
+    missing = [f for f in BATCH_REQUIRED[game] if not item.get(f)]
+    if missing:
+        raise HTTPException(status_code=422, detail=f"Missing {', '.join(missing)}")
+    if item.get("mode", VERIFY_MODE) not in VERIFY_MODES:
+        raise HTTPException(status_code=422, detail=f"mode must be one of {', '.join(VERIFY_MODES)}")
+    team_size = 1
+    if game == "freefire":
+        try:
+            team_size = int(item.get("teamSize", 4))
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=422, detail="teamSize must be an integer")
+    return get_profile(game, team_size, item.get("layoutVersion", "v1"))
+
+async def batch_item_verify(item, image):
+    profile = check_item(item)
+    return await verify(profile, image, matchId=str(item["matchId"]), userId=str(item["userId"]),
+                        uploaderGameUser=item.get("uploaderGameUser"), opponentGameUser=item.get("opponentGameUser"),
+                        roster=get_roster(item.get("rosterId"), item.get("usernames")), tournamentId=item.get("tournamentId"),
+                        mode=item.get("mode", VERIFY_MODE), debug=item.get("debug"))
+
+async def batch_item_run(index, item, image, slots):
+    # Batch items wait for a pool slot instead of failing with 503 like single verifies
+    line = {"index": index, "matchId": item.get("matchId") if isinstance(item, dict) else None}
+    async with slots:
+        while True:
+            try:
+                if not isinstance(item, dict):
+                    raise HTTPException(status_code=422, detail="Item must be an object")
+                line.update(status=200, result=await batch_item_verify(item, image))
+            except PoolFull:
+                await asyncio.sleep(0.05)
+                continue
+            except HTTPException as e:
+                line.update(status=e.status_code, detail=e.detail)
+            except Exception as e:
+                line.update(status=500, detail=str(e))
+            return line
+
+@app.post("/ocr/batch/verify")
+async def batch_verify(
+    items: str = Form(...),   # JSON array, items[i] describes images[i]: {game, teamSize, matchId, userId, uploaderGameUser, opponentGameUser, layoutVersion, rosterId | usernames, tournamentId, mode, debug}
+    images: List[UploadFile] = UploadFile(...)
+):
+    try:
+        metas = json.loads(items)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="items must be a JSON array")
+    if not isinstance(metas, list) or len(metas) != len(images):
+        raise HTTPException(status_code=422, detail=f"Expected one item per image, got {len(metas) if isinstance(metas, list) else 0} items for {len(images)} images")
+    if len(metas) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_ITEMS} images per batch")
+    require_ready()
+
+    # Items run concurrently on the OCR pool, so their recognizer calls are merged by crop_batcher;
+    # each result is written as one NDJSON line as soon as it is ready, in completion order.
+    slots = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def stream():
+        tasks = [asyncio.ensure_future(batch_item_run(i, item, image, slots)) for i, (item, image) in enumerate(zip(metas, images))]
+        try:
+            for done in asyncio.as_completed(tasks):
+                yield json.dumps(await done) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+# ---------- ASYNC JOBS ----------
+
+async def job_verify(params, image):
+    try:
+        return await batch_item_verify(params, image)
+    except NotReady:
+        raise PoolFull()  # deferred without using up an attempt
+    except HTTPException as e:
+        if e.status_code >= 500:
+            raise
+        raise JobRejected(e.status_code, e.detail)
+
+job_queue = JobQueue()
+job_runner = JobRunner(job_queue, job_verify)
+
+@app.post("/jobs", status_code=202)
+async def submit_job(
+    game: str = Form(...),
+    matchId: str = Form(...),
+    userId: str = Form(...),
+    teamSize: int = Form(4),
+    uploaderGameUser: Optional[str] = Form(None),
+    opponentGameUser: Optional[str] = Form(None),
+    layoutVersion: str = Form("v1"),
+    tournamentId: Optional[str] = Form(None),
+    rosterId: Optional[str] = Form(None),
+    lane: str = Form(JOB_DEFAULT_LANE),       # priority lane, see JOB_LANES
+    webhookUrl: Optional[str] = Form(None),   # receives the same body as GET /jobs/{jobId} once the job finishes
+    mode: str = Form(VERIFY_MODE),
+    image: UploadFile = UploadFile(...)
+):
+    # Answers as soon as the screenshot is on disk; OCR happens when a job worker gets to it
+    params = {"game": game, "matchId": matchId, "userId": userId, "teamSize": teamSize, "uploaderGameUser": uploaderGameUser,
+              "opponentGameUser": opponentGameUser, "layoutVersion": layoutVersion, "rosterId": rosterId,
+              "tournamentId": tournamentId, "mode": mode}
+    check_item(params)
+    if webhookUrl:
+        try:
+            await run_in_threadpool(check_webhook_url, webhookUrl)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+    try:
+        job_id = await run_in_threadpool(job_queue.submit, params, image.file, lane, webhookUrl)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    job_runner.notify()
+    return {"jobId": job_id, "status": "queued", "lane": lane, "poll": f"/jobs/{job_id}"}
+
+@app.get("/jobs")
+def list_jobs(status: Optional[str] = None, limit: int = 100):
+    # ?status=dead lists the dead-letter queue
+    body = job_queue.stats()
+    if status:
+        body["jobs"] = job_queue.list(status, limit)
+    return body
+
+@app.get("/jobs/{jobId}")
+def get_job(jobId: str):
+    job = job_queue.get(jobId)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {jobId}")
+    return job
+
+@app.post("/jobs/{jobId}/retry")
+def retry_job(jobId: str):
+    if not job_queue.retry(jobId):
+        raise HTTPException(status_code=409, detail=f"Job {jobId} is not dead-lettered")
+    job_runner.notify()
+    return job_queue.get(jobId)
@@ -0,0 +1,195 @@
+import os, json, time, sqlite3, threading
+from collections import OrderedDict
+from validators import timestamps_close, pick_better_submission, later_of
+
+MATCH_STORE_SIZE = int(os.getenv("MATCH_STORE_SIZE", "4096"))  # matches kept in memory
+MATCH_STORE_DB = os.getenv("MATCH_STORE_DB")  # optional SQLite file, survives restarts
+MATCH_STORE_TTL = int(os.getenv("MATCH_STORE_TTL", str(7 * 24 * 3600)))  # seconds, disk tier only
+MATCH_DIFF_BITS = int(os.getenv("MATCH_DIFF_BITS", "10"))  # ROI signature distance (of 64 bits) reported as changed
+
+
+def _server_time():
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime())
+
+
+# ---------- compare rules, shared by the /compare routes and the match store ----------
+
+def compare_efootball(subA, subB, tsA, tsB):
+    # Prefer full-time submission; else prefer later timestamp
+    preferred = pick_better_submission(subA["meta"], subB["meta"])
+    aligned = (tsA and tsB and timestamps_close(tsA, tsB)) or False
+
+    winA, winB = subA.get("winner"), subB.get("winner")
+    final_winner = winA if winA == winB and winA is not None else (winA if preferred == "A" else winB)
+
+    confidence = round((subA.get("confidence", 0.6) + subB.get("confidence", 0.6)) / 2.0, 2)
+    if preferred == "A" and subA["meta"].get("isFullTime"): confidence += 0.05
+    if preferred == "B" and subB["meta"].get("isFullTime"): confidence += 0.05
+    if aligned: confidence += 0.04
+
+    return {
+        "aligned": aligned,
+        "preferred": preferred,
+        "winner": final_winner,
+        "tieBreak": subA.get("tieBreak") if preferred == "A" else subB.get("tieBreak"),
+        "confidence": min(0.99, confidence)
+    }
+
+
+def compare_full_time(subA, subB, tsA, tsB):
+    # fcm / dls: prefer full-time; else later timestamp
+    if subA["meta"].get("isFullTime") and not subB["meta"].get("isFullTime"):
+        preferred = "A"
+    elif subB["meta"].get("isFullTime") and not subA["meta"].get("isFullTime"):
+        preferred = "B"
+    else:
+        preferred = later_of(tsA, tsB) or "A"
+
+    winA, winB = subA.get("winner"), subB.get("winner")
+    final_winner = winA if winA == winB and winA is not None else (winA if preferred == "A" else winB)
+
+    confidence = round((subA.get("confidence", 0.6) + subB.get("confidence", 0.6)) / 2.0, 2)
+    if (preferred == "A" and subA["meta"].get("isFullTime")) or (preferred == "B" and subB["meta"].get("isFullTime")):
+        confidence = min(0.99, confidence + 0.05)
+
+    return {
+        "aligned": bool(tsA and tsB),
+        "preferred": preferred,
+        "winner": final_winner,
+        "tieBreak": subA.get("tieBreak") if preferred == "A" else subB.get("tieBreak"),
+        "confidence": confidence
+    }
+
+
+def compare_freefire(subA, subB, tsA, tsB):
+    preferred = later_of(tsA, tsB) or "A"
+
+    winA, winB = subA.get("winner"), subB.get("winner")
+    final_winner = winA if winA == winB and winA is not None else (winA if preferred == "A" else winB)
+
+    confidence = round((subA.get("confidence", 0.6) + subB.get("confidence", 0.6)) / 2.0, 2)
+    if preferred == "A" and winA is not None:
+        confidence = min(0.99, confidence + 0.05)
+    elif preferred == "B" and winB is not None:
+        confidence = min(0.99, confidence + 0.05)
+
+    return {
+        "aligned": bool(tsA and tsB),
+        "preferred": preferred,
+        "winner": final_winner,
+        "tieBreak": subA.get("tieBreak") if preferred == "A" else subB.get("tieBreak"),
+        "confidence": confidence
+    }
+
+
+COMPARERS = {
+    "efootball": compare_efootball,
+    "fcm": compare_full_time,
+    "dls": compare_full_time,
+    "freefire": compare_freefire,
+}
+
+
+def compare_submissions(game, subA, subB, serverA=None, serverB=None):
+    # EXIF time of each screenshot, else the time the server (or caller) received it
+    tsA = subA["meta"].get("timestamp") or serverA
+    tsB = subB["meta"].get("timestamp") or serverB
+    return COMPARERS[game](subA, subB, tsA, tsB)
+
+
+def crop_diff(a, b):
+    # Per-ROI Hamming distance between the dHash signatures of two screenshots of the same layout
+    if not a["signatures"] or not b["signatures"]:
+        return None
+    rois = {key: bin(int(sig, 16) ^ int(b["signatures"][key], 16)).count("1")
+            for key, sig in a["signatures"].items() if key in b["signatures"]}
+    return {
+        "sameImage": a["digest"] == b["digest"],
+        "rois": rois,
+        "changed": sorted(key for key, d in rois.items() if d > MATCH_DIFF_BITS),
+    }
+
+
+# ---------- match store ----------
+
+class MatchStore:
+    # matchId -> each user's verify result plus the compare of the first two, updated as submissions arrive
+    def __init__(self, size=MATCH_STORE_SIZE, db_path=MATCH_STORE_DB, ttl=MATCH_STORE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+        self.compares = 0
+        self.db = None
+        if db_path:
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            self.db.execute("CREATE TABLE IF NOT EXISTS matches (match_id TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)")
+            self.db.commit()
+
+    def record(self, match_id, user_id, result, signatures=None):
+        submission = {
+            "userId": user_id,
+            "receivedAt": _server_time(),
+            "digest": result["meta"].get("bytesHash"),
+            "signatures": signatures or {},
+            "result": result,
+        }
+        with self.lock:
+            match = self._load(match_id) or {"matchId": match_id, "game": result["game"], "submissions": [], "compare": None, "diff": None}
+            subs = [s for s in match["submissions"] if s["userId"] != user_id]
+            # A resubmission replaces that user's earlier one and keeps its place
+            position = next((i for i, s in enumerate(match["submissions"]) if s["userId"] == user_id), len(subs))
+            subs.insert(position, submission)
+            match["submissions"] = subs
+            if len(subs) >= 2 and position < 2:
+                self._compare(match)
+            self._save(match_id, match)
+            return match
+
+    def _compare(self, match):
+        a, b = match["submissions"][:2]
+        if a["result"]["game"] != b["result"]["game"] or a["result"].get("teamSize") != b["result"].get("teamSize"):
+            match["compare"] = {"error": "Submissions are for different games or team sizes"}
+            match["diff"] = None
+            return
+        match["compare"] = compare_submissions(match["game"], a["result"], b["result"], a["receivedAt"], b["receivedAt"])
+        match["diff"] = crop_diff(a, b)
+        self.compares += 1
+
+    def get(self, match_id):
+        with self.lock:
+            match = self._load(match_id)
+            return json.loads(json.dumps(match)) if match else None
+
+    def _load(self, match_id):
+        match = self.items.get(match_id)
+        if match is not None:
+            self.items.move_to_end(match_id)
+            return match
+        if self.db is not None:
+            row = self.db.execute("SELECT value, expires FROM matches WHERE match_id = ?", (match_id,)).fetchone()
+            if row and row[1] > time.time():
+                match = json.loads(row[0])
+                self._remember(match_id, match)
+                return match
+        return None
+
+    def _save(self, match_id, match):
+        self._remember(match_id, match)
+        if self.db is not None:
+            self.db.execute("INSERT OR REPLACE INTO matches (match_id, value, expires) VALUES (?, ?, ?)",
+                            (match_id, json.dumps(match), time.time() + self.ttl))
+            self.db.commit()
+
+    def _remember(self, match_id, match):
+        self.items[match_id] = match
+        self.items.move_to_end(match_id)
+        while len(self.items) > self.size:
+            self.items.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.items), "size": self.size, "diskTier": self.db is not None, "compares": self.compares}
+
+
+match_store = MatchStore()
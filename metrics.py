@@ -0,0 +1,116 @@
+import os, time, threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # seconds
+ROI_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+
+
+class Timings:
+    # Stage and ROI durations of one verify. Plain lists and dicts, so it crosses the process executor
+    # inside the result ("_timings") and is recorded by the API process.
+    # Stages run again by a fast evaluation add up; "winner" runs inside "assemble".
+    def __init__(self, stages=None, rois=None):
+        self.stages = stages or {}
+        self.rois = rois or []  # [field, engine, seconds] per ROI crop
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def roi(self, field, engine, seconds):
+        self.rois.append([field, engine, seconds])
+
+    def as_dict(self):
+        return {"stages": self.stages, "rois": self.rois}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(dict(data["stages"]), list(data["rois"])) if data else cls()
+
+    def describe(self, total):
+        # The debug=timings block: milliseconds per stage, and per field summed over its ROIs
+        fields = {}
+        for field, engine, seconds in self.rois:
+            entry = fields.setdefault(field, {"engine": engine, "rois": 0, "ms": 0.0})
+            entry["rois"] += 1
+            entry["ms"] += seconds * 1000
+            if entry["engine"] != engine:
+                entry["engine"] = "mixed"
+        for entry in fields.values():
+            entry["ms"] = round(entry["ms"], 3)
+        return {"totalMs": round(total * 1000, 3), "stagesMs": {name: round(s * 1000, 3) for name, s in self.stages.items()}, "fields": fields}
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class Histogram:
+    # Prometheus histogram with fixed buckets; one bisect and one locked increment per observation
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}  # label values -> per-bucket counts (last one +Inf), then the sum
+        self.lock = threading.Lock()
+
+    def observe(self, values, seconds):
+        i = bisect_left(self.buckets, seconds)
+        with self.lock:
+            series = self.series.get(values)
+            if series is None:
+                series = self.series[values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += seconds
+
+    def render(self):
+        with self.lock:
+            items = sorted((values, list(series)) for values, series in self.series.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for values, series in items:
+            labels = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.labels, values))
+            count = 0
+            for bound, n in zip(self.buckets + (float("inf"),), series):
+                count += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{labels},le="{le}"}} {count}')
+            lines.append(f"{self.name}_sum{{{labels}}} {series[-1]}")
+            lines.append(f"{self.name}_count{{{labels}}} {count}")
+        return "\n".join(lines)
+
+
+class Metrics:
+    def __init__(self, enabled=METRICS_ENABLED):
+        self.enabled = enabled
+        self.verify = Histogram("ocr_verify_seconds", "Verify requests end to end, result cache hits included",
+                                ("game", "teamSize", "cached"), STAGE_BUCKETS)
+        self.stages = Histogram("ocr_stage_seconds", "Verify pipeline stages: hash, decode, screen, ocr, parse, sides, assemble, winner, signatures",
+                                ("game", "teamSize", "stage"), STAGE_BUCKETS)
+        self.rois = Histogram("ocr_roi_seconds", "Per ROI crop: preprocessing plus its share of the engine batch that read it",
+                              ("game", "teamSize", "field", "engine"), ROI_BUCKETS)
+
+    def record(self, profile, timings, total, cached):
+        if not self.enabled:
+            return
+        game, team_size = profile["game"], str(profile["teamSize"])
+        self.verify.observe((game, team_size, "true" if cached else "false"), total)
+        for name, seconds in timings.stages.items():
+            self.stages.observe((game, team_size, name), seconds)
+        for field, engine, seconds in timings.rois:
+            self.rois.observe((game, team_size, field, engine), seconds)
+
+    def render(self):
+        return "\n".join(h.render() for h in (self.verify, self.stages, self.rois)) + "\n"
+
+
+metrics = Metrics()
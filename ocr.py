@@ -1,14 +1,118 @@
-import io, hashlib
+import io, os, time, mmap, hashlib, threading
+from functools import lru_cache
 import numpy as np
 import cv2
 from PIL import Image, ExifTags
-import easyocr 
+from ocr_workers import recognizer_pool
+from cache import crop_memo
+from registry import build_plan, flatten_rois
+from engines import ENGINES, engine_for
 
-reader = easyocr.Reader(["en"], gpu=False)
+# "batch": ROIs are single text lines, recognize them all in one batch without detection
+# "detect": one detection pass per image, boxes assigned to ROIs; "roi": one readtext call per ROI
+OCR_MODE = os.getenv("OCR_MODE", "batch")
+OCR_BATCH_SIZE = int(os.getenv("OCR_BATCH_SIZE", "32"))
+RECOGNIZER_HEIGHT = 64  # easyocr.config.imgH for the stock english model
+OCR_MIN_ROI_PIXELS = int(os.getenv("OCR_MIN_ROI_PIXELS", "40"))  # smallest ROI height we allow reduced decoding to produce
+HASH_CHUNK = 1 << 20
+OCR_COALESCE_MS = float(os.getenv("OCR_COALESCE_MS", "0"))  # extra wait to gather crops from concurrent verifies, 0 = only what queued up meanwhile
+OCR_COALESCE_MAX = int(os.getenv("OCR_COALESCE_MAX", str(OCR_BATCH_SIZE * 4)))  # crops that end the wait early
+OCR_MODEL_DIR = os.getenv("OCR_MODEL_DIR") or None  # EasyOCR weights; the Docker image can bake them in here
+OCR_MODEL_DOWNLOAD = os.getenv("OCR_MODEL_DOWNLOAD", "1") == "1"  # 0: fail instead of fetching missing weights at startup
 
-def load_image_bytes(upload_file):
-  data = upload_file.file.read()
-  image = Image.open(io.BytesIO(data)).convert("RGB")
+_reader = None
+_reader_lock = threading.Lock()
+
+def load_reader():
+  # Loaded once, by the lifespan hook (lifecycle.py) or else by the first read. Only the detect and roi
+  # modes run CRAFT, so batch mode skips loading the detector.
+  global _reader
+  if _reader is None:
+    with _reader_lock:
+      if _reader is None:
+        import easyocr
+        _reader = easyocr.Reader(["en"], gpu=False, model_storage_directory=OCR_MODEL_DIR, download_enabled=OCR_MODEL_DOWNLOAD,
+                                 detector=OCR_MODE != "batch", verbose=False)
+  return _reader
+
+def reader_loaded():
+  return _reader is not None
+
+_DECODE_FLAGS = {
+  1: cv2.IMREAD_GRAYSCALE,
+  2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+  4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+  8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+def decode_scale(height, min_roi_height):
+  # Largest power-of-two reduction that keeps the smallest ROI at least OCR_MIN_ROI_PIXELS tall
+  scale = 1
+  while min_roi_height and scale < 8 and min_roi_height * height / (scale * 2) >= OCR_MIN_ROI_PIXELS:
+    scale *= 2
+  return scale
+
+class Upload:
+  # The raw bytes of an UploadFile viewed in place: the spooled BytesIO buffer, or an mmap once
+  # the SpooledTemporaryFile has rolled to disk. Hashed in chunks over the view, never copied.
+  def __init__(self, fileobj):
+    self.fileobj = fileobj
+    self._mmap = None
+    raw = getattr(fileobj, "_file", fileobj)
+    if hasattr(raw, "getbuffer"):
+      self.view = raw.getbuffer()
+    else:
+      raw.flush()
+      if os.fstat(raw.fileno()).st_size:
+        self._mmap = mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self._mmap)
+      else:
+        self.view = memoryview(b"")
+    h = hashlib.sha256()
+    for offset in range(0, len(self.view), HASH_CHUNK):
+      h.update(self.view[offset:offset + HASH_CHUNK])
+    self.digest = h.hexdigest()
+    self.size = len(self.view)
+
+  def header(self):
+    if self.fileobj is not None:
+      self.fileobj.seek(0)
+      return self.fileobj
+    return io.BytesIO(self.view)
+
+  def release(self, close=True):
+    # Drop the raw buffer as soon as the image is decoded; close=False keeps the file for another attempt
+    if self.view is not None:
+      self.view.release()
+      self.view = None
+    if self._mmap is not None:
+      self._mmap.close()
+      self._mmap = None
+    if self.fileobj is not None and close:
+      self.fileobj.close()
+      self.fileobj = None
+
+  def __getstate__(self):
+    # Crossing into an OCR process (OCR_EXECUTOR=process) has to copy the bytes once
+    return {"data": bytes(self.view), "digest": self.digest}
+
+  def __setstate__(self, state):
+    self.fileobj = None
+    self._mmap = None
+    self.view = memoryview(state["data"])
+    self.digest = state["digest"]
+    self.size = len(self.view)
+
+def _decode(view, header_fp, min_roi_height):
+  # PIL only parses the header here (size + EXIF); pixels are decoded by OpenCV straight to
+  # grayscale, at 1/2, 1/4 or 1/8 scale when the profile's ROIs stay tall enough (JPEG uses DCT scaling).
+  image = Image.open(header_fp)
+  width, height = image.size
+  scale = decode_scale(height, min_roi_height)
+  img = cv2.imdecode(np.frombuffer(view, np.uint8), _DECODE_FLAGS[scale] | cv2.IMREAD_IGNORE_ORIENTATION)
+  if img is None:
+    # Format this OpenCV build can't read
+    img = np.array(image.convert("L").reduce(scale))
   # Try EXIF timestamp
   exif_time = None
   try:
@@ -22,22 +126,360 @@ def load_image_bytes(upload_file):
           break
   except Exception:
     pass
-  return np.array(image), data, exif_time
+  return img, exif_time, (width, height)
+
+def load_upload(upload, min_roi_height=None):
+  # Returns the decoded image, EXIF time and original (width, height); the upload is released either way
+  try:
+    return _decode(upload.view, upload.header(), min_roi_height)
+  finally:
+    upload.release()
+
+def load_image_bytes(data: bytes, min_roi_height=None):
+  img, exif_time, size = _decode(data, io.BytesIO(data), min_roi_height)
+  return img, data, exif_time, size
 
 def bytes_hash(data: bytes):
   return hashlib.sha256(data).hexdigest()
 
-def crop_roi(img, roi):
+def roi_box(img, roi):
   h, w = img.shape[:2]
-  x0 = int(roi[0] * w); y0 = int(roi[1] * h)
-  x1 = int(roi[2] * w); y1 = int(roi[3] * h)
+  return int(roi[0] * w), int(roi[1] * h), int(roi[2] * w), int(roi[3] * h)
+
+def crop_roi(img, roi):
+  x0, y0, x1, y1 = roi_box(img, roi)
   return img[y0:y1, x0:x1]
 
+def dhash(gray):
+  # 64-bit difference hash: survives rescaling and JPEG noise, so two captures of the same screen stay close
+  small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+  return int.from_bytes(np.packbits(small[:, 1:] > small[:, :-1]).tobytes(), "big")
+
+def roi_signatures(img, plan):
+  return {key: format(dhash(img[y0:y1, x0:x1]), "016x") for key, (x0, y0, x1, y1) in plan.rects.items() if x1 > x0 and y1 > y0}
+
+def ink_hash(gray, size=(32, 16)):
+  # Text-vs-background thumbnail thresholded halfway between the darkest and lightest pixel: recompression
+  # moves a few bits, a changed digit dozens. Flat crops hash to 0.
+  small = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+  lo, hi = int(small.min()), int(small.max())
+  if hi - lo < 32:
+    return 0
+  return int.from_bytes(np.packbits(small > (lo + hi) // 2).tobytes(), "big")
+
+def roi_fingerprints(img, plan):
+  return {key: ink_hash(img[y0:y1, x0:x1]) for key, (x0, y0, x1, y1) in plan.rects.items() if x1 > x0 and y1 > y0}
+
+def to_gray(img):
+  if img.ndim == 2:
+    return img
+  return cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+
+def binarize(gray):
+  return cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+
 def ocr_text(img):
-  gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
-  gray = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
-  result = reader.readtext(gray, detail=0, paragraph=True)
-  return " ".join(result).strip()
+  gray = binarize(to_gray(img))
+  key = crop_memo.key(gray)
+  text = crop_memo.get(key)
+  if text is None:
+    result = load_reader().readtext(gray, detail=0, paragraph=True)
+    text = " ".join(result).strip()
+    crop_memo.put(key, text)
+  return text
+
+def recognize_crops(crops, allowlists=None):
+  # Runs the recognizer once over a batch of single-line grayscale crops (no detection),
+  # in a model process when the recognizer pool is running. Crops seen before come from the memo.
+  # allowlists[i]: characters crop i may decode to (None = any)
+  allowlists = allowlists or [None] * len(crops)
+  texts = [None] * len(crops)
+  keys, todo = {}, []
+  for i, crop in enumerate(crops):
+    if crop.size == 0:
+      texts[i] = ""
+      continue
+    keys[i] = crop_memo.key(crop, allowlists[i])
+    texts[i] = crop_memo.get(keys[i])
+    if texts[i] is None:
+      todo.append(i)
+  if todo:
+    found = crop_batcher.recognize([crops[i] for i in todo], [allowlists[i] for i in todo])
+    for i, text in zip(todo, found):
+      texts[i] = text
+      crop_memo.put(keys[i], text)
+  return texts
+
+@lru_cache(maxsize=64)
+def _ignore_chars(allowlist):
+  reader = load_reader()
+  return "".join(set(reader.character) - set(allowlist if allowlist else reader.lang_char))
+
+def recognize_crops_local(crops, allowlists=None):
+  # Reader.recognize() loops box by box on CPU, so feed easyocr's get_text directly,
+  # once per distinct allowlist (get_text takes a single set of characters to ignore).
+  from easyocr.recognition import get_text
+  from easyocr.utils import get_image_list
+  reader = load_reader()
+  allowlists = allowlists or [None] * len(crops)
+  texts = [""] * len(crops)
+  by_allowlist = {}
+  for i, crop in enumerate(crops):
+    if crop.shape[0] < 2 or crop.shape[1] < 2:
+      continue
+    items, width = get_image_list([[0, crop.shape[1], 0, crop.shape[0]]], [], crop, model_height=RECOGNIZER_HEIGHT, sort_output=False)
+    group = by_allowlist.setdefault(allowlists[i], [[], RECOGNIZER_HEIGHT])
+    for _, resized in items:
+      group[0].append((i, resized))
+      group[1] = max(group[1], width)
+  for allowlist, (image_list, max_width) in by_allowlist.items():
+    results = get_text(reader.character, RECOGNIZER_HEIGHT, int(max_width), reader.recognizer, reader.converter, image_list,
+                       _ignore_chars(allowlist), "greedy", 5, OCR_BATCH_SIZE, 0.1, 0.5, 0.003, 0, reader.device)
+    for i, text, _conf in results:
+      texts[i] = text.strip()
+  return texts
+
+def _recognize_backend(crops, allowlists):
+  return recognizer_pool.recognize(crops, allowlists) if recognizer_pool.active else recognize_crops_local(crops, allowlists)
+
+class CropBatcher:
+  # Merges recognize calls from concurrent verifies (e.g. the items of a batch request) into one
+  # recognizer invocation. A caller that finds no batch running leads: it waits up to `window`,
+  # takes everything queued, runs it and hands leadership to the next waiting caller.
+  def __init__(self, run, window_ms=OCR_COALESCE_MS, max_crops=OCR_COALESCE_MAX):
+    self.run = run
+    self.window = window_ms / 1000.0
+    self.max_crops = max_crops
+    self.cond = threading.Condition()
+    self.queue = []
+    self.queued = 0
+    self.leading = False
+    self.batches = 0
+    self.calls = 0
+    self.crops = 0
+
+  def recognize(self, crops, allowlists=None):
+    req = {"crops": crops, "allowlists": allowlists or [None] * len(crops), "texts": None, "error": None, "done": False}
+    with self.cond:
+      self.queue.append(req)
+      self.queued += len(crops)
+      self.cond.notify_all()
+      while self.leading and not req["done"]:
+        self.cond.wait()
+      if not req["done"]:
+        self.leading = True
+    if not req["done"]:
+      self._lead()
+    if req["error"] is not None:
+      raise req["error"]
+    return req["texts"]
+
+  def _lead(self):
+    with self.cond:
+      deadline = time.monotonic() + self.window
+      while self.queued < self.max_crops:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+          break
+        self.cond.wait(remaining)
+      batch, self.queue, self.queued = self.queue, [], 0
+    try:
+      texts = self.run([crop for req in batch for crop in req["crops"]], [a for req in batch for a in req["allowlists"]])
+      error = None
+    except Exception as e:
+      texts, error = [], e
+    with self.cond:
+      offset = 0
+      for req in batch:
+        req["texts"] = texts[offset:offset + len(req["crops"])]
+        req["error"] = error
+        req["done"] = True
+        offset += len(req["crops"])
+      self.batches += 1
+      self.calls += len(batch)
+      self.crops += offset
+      self.leading = False
+      self.cond.notify_all()
+
+  def stats(self):
+    with self.cond:
+      return {
+        "windowMs": self.window * 1000,
+        "batches": self.batches,
+        "calls": self.calls,
+        "crops": self.crops,
+        "callsPerBatch": round(self.calls / self.batches, 2) if self.batches else 0.0,
+      }
+
+crop_batcher = CropBatcher(_recognize_backend)
+
+def _overlap(a, b):
+  w = min(a[2], b[2]) - max(a[0], b[0])
+  h = min(a[3], b[3]) - max(a[1], b[1])
+  return w * h if w > 0 and h > 0 else 0
+
+def ocr_text_detect(img, plan):
+  # One CRAFT pass over the union of the ROIs, then every detected line is assigned to the
+  # ROI(s) it overlaps and recognized in a single batch.
+  if not plan.rects:
+    return {}
+  ux0, uy0, ux1, uy1 = plan.union
+  gray = to_gray(img[uy0:uy1, ux0:ux1])
+  boxes = {k: (r[0] - ux0, r[1] - uy0, r[2] - ux0, r[3] - uy0) for k, r in plan.rects.items()}
+  horizontal, free = load_reader().detect(gray)
+  detected = [(b[0], b[2], b[1], b[3]) for b in horizontal[0]]
+  for poly in free[0]:
+    xs = [p[0] for p in poly]; ys = [p[1] for p in poly]
+    detected.append((int(min(xs)), int(min(ys)), int(max(xs)), int(max(ys))))
+
+  lines = {k: [] for k in boxes}
+  for line in detected:
+    area = max(1, (line[2] - line[0]) * (line[3] - line[1]))
+    overlaps = {k: _overlap(line, b) for k, b in boxes.items()}
+    owners = [k for k, o in overlaps.items() if o * 2 >= area]
+    if not owners:
+      best = max(overlaps, key=overlaps.get)
+      owners = [best] if overlaps[best] > 0 else []
+    for k in owners:
+      rx0, ry0, rx1, ry1 = boxes[k]
+      lines[k].append((max(line[0], rx0), max(line[1], ry0), min(line[2], rx1), min(line[3], ry1)))
+
+  crops, owners = [], []
+  for k, found in lines.items():
+    if not found:
+      continue
+    rx0, ry0, rx1, ry1 = boxes[k]
+    roi_bin = binarize(gray[ry0:ry1, rx0:rx1])
+    for x0, y0, x1, y1 in sorted(found, key=lambda b: (b[1], b[0])):
+      crops.append(roi_bin[y0 - ry0:y1 - ry0, x0 - rx0:x1 - rx0])
+      owners.append(k)
+
+  out = {k: [] for k in boxes}
+  for k, text in zip(owners, recognize_crops(crops)):
+    if text:
+      out[k].append(text)
+  return {k: " ".join(v).strip() for k, v in out.items()}
+
+def light_on_dark(gray):
+  # Text is the minority class of an Otsu split, so mostly-dark crops carry light text
+  return np.count_nonzero(binarize(gray)) * 2 < gray.size
+
+def _percentiles(crops, qs):
+  # np.percentile (linear) of every crop, read off one histogram of the whole group -> one array per q
+  sizes = np.array([c.size for c in crops])
+  owner = np.repeat(np.arange(len(crops)) * 256, sizes)
+  cum = np.cumsum(np.bincount(owner + np.concatenate([c.ravel() for c in crops]), minlength=len(crops) * 256).reshape(-1, 256), axis=1)
+  out = []
+  for q in qs:
+    index = (sizes - 1) * (q / 100)
+    below = np.floor(index).astype(np.int64)
+    t = index - below
+    a = (cum <= below[:, None]).sum(axis=1).astype(np.float64)
+    b = (cum <= np.minimum(below + 1, sizes - 1)[:, None]).sum(axis=1).astype(np.float64)
+    out.append(np.where(t >= 0.5, b - (b - a) * (1 - t), a + (b - a) * t))
+  return out
+
+def preprocess_crops(crops, params):
+  # The crops of a plan that share one strategy (RoiPlan.batches, compiled from the profile's "preprocess"
+  # section), in one pass: options resolved once; one Otsu split per crop, since thresholding an inverted
+  # crop gives the binarized crop flipped; the adaptive offsets from one histogram of the whole group.
+  upscale, invert, threshold = params.get("upscale"), params.get("invert", False), params.get("threshold")
+  out = list(crops)
+  live = [i for i, crop in enumerate(crops) if crop.size]
+  for i in live:
+    crop = crops[i]
+    if upscale and crop.shape[0] < RECOGNIZER_HEIGHT:
+      # The recognizer resizes to its input height anyway; doing it first keeps thin strokes through thresholding
+      width = max(1, round(crop.shape[1] * RECOGNIZER_HEIGHT / crop.shape[0]))
+      crop = cv2.resize(crop, (width, RECOGNIZER_HEIGHT), interpolation=cv2.INTER_CUBIC)
+    if threshold not in ("none", "adaptive"):
+      mask = binarize(crop)
+      if invert is True or (invert == "auto" and np.count_nonzero(mask) * 2 < mask.size):
+        mask = cv2.bitwise_not(mask)
+      out[i] = mask
+      continue
+    if invert is True or (invert == "auto" and light_on_dark(crop)):
+      crop = cv2.bitwise_not(crop)
+    out[i] = cv2.GaussianBlur(crop, (3, 3), 0) if threshold == "adaptive" else crop
+  if threshold == "adaptive" and live:
+    # Local mean over about half the text height, so low-contrast cells on a gradient still separate;
+    # the offset scales with the crop's contrast so sensor/JPEG noise on flat background stays white
+    lo, hi = _percentiles([out[i] for i in live], (5, 95))
+    for i, l, h in zip(live, lo, hi):
+      block = max(3, out[i].shape[0] // 2 | 1)
+      out[i] = cv2.adaptiveThreshold(out[i], 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, block, max(4, int((h - l) * 0.15)))
+  return out
+
+def preprocess_crop(crop, params):
+  return preprocess_crops([crop], params)[0]
+
+def ocr_plan(img, plan, reads=None, timings=None):
+  # Reads every ROI of a precompiled plan -> {key: text}. Only the union box is converted to grayscale.
+  # Each ROI goes to the engine its profile field names (engines.py); reads an engine is unsure of,
+  # and everything set to EasyOCR, end up in one recognizer batch. `reads`, when given, gets
+  # {key: {"engine", "confidence"}} for the ROIs set to another engine. `timings` (metrics.Timings)
+  # gets each crop's preprocessing plus an even share of every engine batch it went through.
+  if OCR_MODE == "roi":
+    return {k: ocr_text(img[y0:y1, x0:x1]) for k, (x0, y0, x1, y1) in plan.rects.items()}
+  if OCR_MODE == "detect":
+    return ocr_text_detect(img, plan)
+  ux0, uy0, ux1, uy1 = plan.union
+  gray = to_gray(img[uy0:uy1, ux0:ux1])
+  crops, seconds = [None] * len(plan.groups), [0.0] * len(plan.groups)
+  for params, idx in plan.batches:
+    start = time.perf_counter()
+    rects = [plan.groups[i][0] for i in idx]
+    for i, crop in zip(idx, preprocess_crops([gray[y0:y1, x0:x1] for x0, y0, x1, y1 in rects], params)):
+      crops[i] = crop
+    share = (time.perf_counter() - start) / len(idx)
+    for i in idx:
+      seconds[i] = share
+  by_engine = {}
+  for i, (_, _, params) in enumerate(plan.groups):
+    by_engine.setdefault(engine_for(params.get("engine")), []).append(i)
+  found, pending = [None] * len(crops), by_engine.pop(ENGINES["easyocr"], [])
+  read_by = ["easyocr"] * len(crops)
+  for engine, idx in by_engine.items():
+    start = time.perf_counter()
+    results = engine.timed_read([crops[i] for i in idx], [plan.groups[i][2] for i in idx])
+    share = (time.perf_counter() - start) / len(idx)
+    unsure = 0
+    for i, (text, confidence) in zip(idx, results):
+      seconds[i] += share
+      if text is None:
+        pending.append(i)
+        continue
+      read = {"engine": engine.name, "confidence": None if confidence is None else round(confidence, 3)}
+      if confidence is not None and confidence < engine.min_confidence:
+        read = {"engine": "easyocr", "confidence": None, "fallbackFrom": engine.name, "fallbackConfidence": read["confidence"]}
+        pending.append(i)
+        unsure += 1
+      else:
+        found[i] = text
+        read_by[i] = engine.name
+      if reads is not None:
+        for k in plan.groups[i][1]:
+          reads[k] = read
+    engine.fell_back(unsure)
+  if pending:
+    start = time.perf_counter()
+    results = ENGINES["easyocr"].timed_read([crops[i] for i in pending], [plan.groups[i][2] for i in pending])
+    share = (time.perf_counter() - start) / len(pending)
+    for i, (text, _) in zip(pending, results):
+      found[i] = text
+      seconds[i] += share
+  if timings is not None:
+    for (_, keys, _), engine, s in zip(plan.groups, read_by, seconds):
+      timings.roi(keys[0].split(".")[0], engine, s)
+  texts = {}
+  for (_, keys, _), text in zip(plan.groups, found):
+    for k in keys:
+      texts[k] = text
+  return texts
+
+def ocr_text_batch(img, rois):
+  # rois: {key: [x0, y0, x1, y1]} -> {key: text}
+  return ocr_plan(img, build_plan(rois, img.shape[1], img.shape[0]))
 
 def parse_penalties(text: str):
   # Expect formats like "PK: 9 - 8" or "Penalties: 5-4"
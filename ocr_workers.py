@@ -0,0 +1,89 @@
+import os, threading
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+OCR_PROCESSES = int(os.getenv("OCR_PROCESSES", "0"))  # 0 = run the recognizer in the API process
+OCR_TORCH_THREADS = int(os.getenv("OCR_TORCH_THREADS", "1"))  # intra-op threads per model process
+
+
+def _init_worker(torch_threads):
+    import torch
+    torch.set_num_threads(torch_threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # already set by the parent
+
+
+def _ping(_):
+    return os.getpid()
+
+
+def _recognize(crops, allowlists):
+    # Runs in a forked model process: the reader was loaded by the parent before
+    # the fork, so its weights are shared copy-on-write instead of loaded again.
+    from ocr import recognize_crops_local
+    return recognize_crops_local(crops, allowlists)
+
+
+class RecognizerPool:
+    def __init__(self, processes=OCR_PROCESSES, torch_threads=OCR_TORCH_THREADS):
+        self.processes = processes
+        self.torch_threads = torch_threads
+        self.pool = None
+        self.pids = []
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.crops = 0
+        self.failures = 0
+
+    @property
+    def active(self):
+        return self.pool is not None
+
+    def start(self):
+        if self.processes <= 0 or self.pool is not None:
+            return
+        from ocr import load_reader
+        load_reader()  # before forking, so the model processes share its weights
+        ctx = mp.get_context("fork")
+        self.pool = ProcessPoolExecutor(max_workers=self.processes, mp_context=ctx,
+                                        initializer=_init_worker, initargs=(self.torch_threads,))
+        # Fork every worker now, while the parent is still idle, instead of on demand from a busy thread
+        self.pids = sorted(set(self.pool.map(_ping, range(self.processes * 4))))
+
+    def recognize(self, crops, allowlists=None):
+        pool = self.pool
+        if pool is not None:
+            with self.lock:
+                self.calls += 1
+                self.crops += len(crops)
+            try:
+                return pool.submit(_recognize, crops, allowlists).result()
+            except BrokenProcessPool:
+                # A model process died; keep serving from the parent's reader
+                with self.lock:
+                    self.failures += 1
+                    self.pool = None
+        from ocr import recognize_crops_local
+        return recognize_crops_local(crops, allowlists)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "processes": self.processes if self.pool is not None else 0,
+                "torchThreads": self.torch_threads,
+                "pids": self.pids,
+                "calls": self.calls,
+                "crops": self.crops,
+                "failures": self.failures,
+            }
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+
+recognizer_pool = RecognizerPool()
@@ -0,0 +1,456 @@
+import os
+from ocr import load_upload, ocr_plan, roi_signatures, roi_fingerprints, parse_penalties, parse_clock
+from registry import profile_registry, min_roi_height
+from validators import parse_int_safe, parse_percent_safe, parse_score, normalize_label, validate_coherence_sports, estimate_sot, fuzzy_match
+from winner import compute_winner_sports, compute_winner_fcm, compute_winner_freefire
+from roster import RosterIndex
+from screen import screen_index, screen_scope
+from metrics import Timings
+from translate import translator
+
+# Field parsers a profile can name; pair parsers read one ROI holding both sides ("3 - 1" -> left, right)
+PARSERS = {
+    "text": lambda s: s,
+    "int": parse_int_safe,
+    "percent": parse_percent_safe,
+    "clock": parse_clock,
+    "score": parse_score,
+    "penalties": parse_penalties,
+}
+PAIR_PARSERS = ("score", "penalties")
+NUMERIC_PARSERS = ("int", "percent", "clock", "score", "penalties")  # read again even when a screenshot's texts are reused
+
+VERIFY_MODE = os.getenv("VERIFY_MODE", "full")  # default for requests without `mode`: "full" or "fast"
+VERIFY_MODES = ("full", "fast")
+
+
+class WinnerRule:
+    # `stages` lists the fields the rule reads in the order it reads them, each with the
+    # tie-breaks that settle the match at that stage; the last stage always settles it.
+    def __init__(self, decide, stages):
+        self.decide = decide
+        self.stages = stages
+
+
+WINNER_RULES = {
+    "goals_penalties": WinnerRule(
+        lambda a, b: compute_winner_sports(a, b, "efootball", allow_penalties=True, penaltiesA=a["penalties"], penaltiesB=b["penalties"]),
+        [(["goals"], ("goals",)), (["penalties"], None)]),
+    "goals_percent": WinnerRule(compute_winner_fcm, [(["goals"], ("goals",)), (["shotsOnTarget", "possession"], None)]),
+    "kills_damage": WinnerRule(compute_winner_freefire, [(["kills"], ("kills",)), (["damage"], None)]),
+}
+
+
+def _read(profile, texts, key, parse):
+    # A list ROI ("left_kills": [[...], [...]]) reads one value per slot
+    box = profile["roi"][key]
+    if box and isinstance(box[0], (list, tuple)):
+        return [parse(texts.get(f"{key}.{i}", "")) for i in range(len(box))]
+    return parse(texts.get(key, ""))
+
+
+def read_fields(profile, texts):
+    # profile["fields"]: {name: {"roi": key} | {"left": key, "right": key}, "parser": ..., "labels": [...]}
+    # A field whose ROI was not OCR'd parses as if the ROI were blank
+    values = {}
+    for name, spec in profile["fields"].items():
+        parser = spec.get("parser", "text")
+        if parser == "label":
+            matcher = profile_registry.label_matcher(profile, *spec["labels"])
+            parse = lambda s: normalize_label(s, matcher)
+        else:
+            parse = PARSERS[parser]
+        if "roi" in spec:
+            value = _read(profile, texts, spec["roi"], parse)
+            if parser in PAIR_PARSERS:
+                value = {"left": value[0], "right": value[1]}
+        else:
+            value = {"left": _read(profile, texts, spec["left"], parse), "right": _read(profile, texts, spec["right"], parse)}
+        values[name] = value
+    return values
+
+
+def resolve_sides(profile, values, request):
+    # -> ({"A": screen side, "B": screen side}, uploader side or None when the profile matches by username)
+    sides = profile.get("sides", {"A": "left", "B": "right"})
+    if sides != "uploader":
+        return sides, sides["A"]
+    left_user, right_user = values["userName"]["left"], values["userName"]["right"]
+    uploader = request["uploaderGameUser"]
+    left_is_uploader = fuzzy_match(left_user, uploader)
+    right_is_uploader = fuzzy_match(right_user, uploader)
+    if left_is_uploader and not right_is_uploader:
+        side = "left"
+    elif right_is_uploader and not left_is_uploader:
+        side = "right"
+    elif left_user.strip().lower() == uploader.strip().lower():
+        side = "left"
+    elif right_user.strip().lower() == uploader.strip().lower():
+        side = "right"
+    else:
+        # Ambiguous: report screen order and let the assembler lower confidence
+        return {"A": "left", "B": "right"}, None
+    return {"A": side, "B": "right" if side == "left" else "left"}, side
+
+
+class Verify:
+    # What an assembler works from: parsed fields already mapped to sides A/B, plus the request
+    def __init__(self, profile, request, values, mapping, uploader_side, upload, width, height, exif_time, timings=None):
+        self.profile = profile
+        self.request = request
+        self.values = values
+        self.mapping = mapping
+        self.uploader_side = uploader_side
+        self.digest = upload.digest
+        self.width = width
+        self.height = height
+        self.timestamp = exif_time
+        self.timings = timings or Timings()
+
+    def field(self, name):
+        return self.values[name]
+
+    def side(self, name, side):
+        return self.values[name][self.mapping[side]]
+
+    def screen(self, name, screen_side):
+        return self.values[name][screen_side]
+
+    def winner(self, sideA, sideB):
+        with self.timings.stage("winner"):
+            return WINNER_RULES[self.profile["winner"]].decide(sideA, sideB)
+
+    def meta(self, **extra):
+        return {
+            "matchId": self.request["matchId"],
+            "bytesHash": self.digest,
+            "resolution": f"{self.width}x{self.height}",
+            "orientation": "landscape" if self.width >= self.height else "portrait",
+            **extra,
+        }
+
+
+def assemble_efootball(v):
+    banner_txt = v.field("banner")
+    is_full_time = v.field("bannerLabel") == "full_time"
+    in_progress_clock = v.field("clock")
+
+    sideA = {"userName": v.side("userName", "A"), "goals": v.side("goals", "A"), "shotsOnTarget": v.side("shotsOnTarget", "A"),
+             "possession": v.side("possession", "A"), "penalties": v.side("penalties", "A"), "raw": {}}
+    sideB = {"userName": v.side("userName", "B"), "goals": v.side("goals", "B"), "shotsOnTarget": v.side("shotsOnTarget", "B"),
+             "possession": v.side("possession", "B"), "penalties": v.side("penalties", "B"), "raw": {}}
+
+    coh_ok, notes = validate_coherence_sports(sideA, sideB)
+    winner, tieBreak = v.winner(sideA, sideB)
+
+    filled = sum(1 for s in (sideA, sideB) for k in ("goals", "shotsOnTarget", "possession") if s[k] is not None)
+    confidence = min(0.99, 0.6 + filled * 0.06)
+    if not is_full_time and in_progress_clock is None:
+        confidence -= 0.15
+
+    return {
+        "game": "efootball",
+        "teamSize": 1,
+        "sideA": sideA,
+        "sideB": sideB,
+        "meta": v.meta(isFullTime=is_full_time, bannerText=banner_txt, clockSeconds=in_progress_clock, timestamp=v.timestamp),
+        "coherence": {"ok": coh_ok, "notes": notes},
+        "winner": winner,
+        "tieBreak": tieBreak,
+        "confidence": round(confidence, 2)
+    }
+
+
+def _sports_side(v, side):
+    return {"userName": v.side("userName", side), "goals": v.side("goals", side), "shotsOnTarget": v.side("shotsOnTarget", side),
+            "possession": v.side("possession", side), "raw": {}}
+
+
+def assemble_fcm(v):
+    clock_txt = v.field("clockText")
+    is_full_time = v.field("clockLabel") == "full_time" or "90" in clock_txt
+
+    # SideA = uploader, SideB = opponent
+    sideA, sideB = _sports_side(v, "A"), _sports_side(v, "B")
+    shots_uploader, shots_opponent = v.side("shots", "A"), v.side("shots", "B")
+    sot_uploader, sot_opponent = sideA["shotsOnTarget"], sideB["shotsOnTarget"]
+    pos_uploader, pos_opponent = sideA["possession"], sideB["possession"]
+
+    winner, tieBreak = v.winner(sideA, sideB)
+
+    notes = []
+    if sot_uploader and shots_uploader and sot_uploader > shots_uploader:
+        notes.append("Uploader shots on goal > shots")
+    if sot_opponent and shots_opponent and sot_opponent > shots_opponent:
+        notes.append("Opponent shots on goal > shots")
+    if pos_uploader and pos_opponent:
+        total = pos_uploader + pos_opponent
+        if abs(100 - total) > 3:
+            notes.append("Possession does not sum to ~100")
+
+    filled = sum(1 for s in (sideA, sideB) for k in ("goals", "shotsOnTarget", "possession") if s[k] is not None)
+    confidence = min(0.99, 0.6 + filled * 0.06)
+    if not is_full_time:
+        confidence -= 0.08
+
+    return {
+        "game": "fcm",
+        "teamSize": 1,
+        "sideA": sideA,
+        "sideB": sideB,
+        "meta": v.meta(isFullTime=is_full_time, clockText=clock_txt, timestamp=v.timestamp),
+        "coherence": {"ok": len(notes) == 0, "notes": notes},
+        "winner": winner,
+        "tieBreak": tieBreak,
+        "confidence": round(confidence, 2)
+    }
+
+
+def assemble_dls(v):
+    clock_txt = v.field("clockText")
+    is_full_time = v.field("clockLabel") == "full_time" or "90" in clock_txt
+    uploader = v.request["uploaderGameUser"]
+    matched = fuzzy_match(v.screen("userName", "left"), uploader) or fuzzy_match(v.screen("userName", "right"), uploader)
+
+    # SideA = uploader, SideB = opponent; shots on target are estimated from shots x accuracy
+    def pick(side):
+        shots, accuracy = v.side("shots", side), v.side("shotAccuracy", side)
+        return {
+            "userName": v.side("userName", side),
+            "goals": v.side("goals", side),
+            "shotsOnTarget": estimate_sot(shots, accuracy),
+            "possession": v.side("possession", side),
+            "raw": {"shots": shots, "shotAccuracy": accuracy}
+        }
+
+    sideA, sideB = pick("A"), pick("B")
+    winner, tieBreak = v.winner(sideA, sideB)
+
+    notes = []
+    if sideA["raw"]["shots"] is not None and sideA["shotsOnTarget"] is not None and sideA["shotsOnTarget"] > sideA["raw"]["shots"]:
+        notes.append("Uploader estimated SOT > shots")
+    if sideB["raw"]["shots"] is not None and sideB["shotsOnTarget"] is not None and sideB["shotsOnTarget"] > sideB["raw"]["shots"]:
+        notes.append("Opponent estimated SOT > shots")
+    if sideA["possession"] is not None and sideB["possession"] is not None:
+        total = sideA["possession"] + sideB["possession"]
+        if abs(100 - total) > 3:
+            notes.append("Possession does not sum to ~100")
+    if not matched:
+        notes.append("Username match ambiguous—manual review may be required")
+
+    filled = sum(1 for s in (sideA, sideB) for k in ("goals", "shotsOnTarget", "possession") if s[k] is not None)
+    confidence = min(0.99, 0.6 + filled * 0.06)
+    if not is_full_time:
+        confidence -= 0.08
+    if not matched:
+        confidence -= 0.10
+
+    return {
+        "game": "dls",
+        "teamSize": 1,
+        "sideA": sideA,
+        "sideB": sideB,
+        "meta": v.meta(isFullTime=is_full_time, clockText=clock_txt, timestamp=v.timestamp, identity={
+            "leftUserOCR": v.screen("userName", "left"),
+            "rightUserOCR": v.screen("userName", "right"),
+            "uploaderGameUser": v.request["uploaderGameUser"],
+            "opponentGameUser": v.request["opponentGameUser"],
+            "uploaderSide": v.uploader_side
+        }),
+        "coherence": {"ok": len(notes) == 0, "notes": notes},
+        "winner": winner,
+        "tieBreak": tieBreak,
+        "confidence": round(confidence, 2)
+    }
+
+
+def assemble_freefire(v):
+    def team(side):
+        users, kills, damage = v.side("userNames", side), v.side("kills", side), v.side("damage", side)
+        return {
+            "userNames": users,
+            "kills": kills,
+            "damage": damage,
+            "totalKills": sum([k for k in kills if k is not None]),
+            "totalDamage": sum([d for d in damage if d is not None]),
+            "mvp": users[0] if users else None
+        }
+
+    sideA, sideB = team("A"), team("B")
+    winner, tieBreak = v.winner(sideA, sideB)
+
+    # Each OCR'd slot is resolved against the registered names on its own
+    uploader, opponent, roster = v.request["uploaderGameUser"], v.request["opponentGameUser"], v.request.get("roster")
+    index = roster or RosterIndex([uploader, opponent])
+    slotsA = index.assign(sideA["userNames"])
+    slotsB = index.assign(sideB["userNames"])
+
+    notes = []
+    if not index.contains(slotsA, uploader):
+        notes.append("Uploader username mismatch")
+    if not index.contains(slotsB, opponent):
+        notes.append("Opponent username mismatch")
+
+    confidence = 0.95
+    if notes:
+        confidence -= 0.15
+
+    return {
+        "game": "freefire",
+        "teamSize": int(v.profile["teamSize"]),
+        "sideA": sideA,
+        "sideB": sideB,
+        "winner": winner,
+        "tieBreak": tieBreak,
+        "confidence": round(confidence, 2),
+        "meta": v.meta(timestamp=v.timestamp, identity={
+            "uploaderGameUser": uploader,
+            "opponentGameUser": opponent,
+            "rosterVersion": roster.version if roster else None,
+            "sideASlots": slotsA,
+            "sideBSlots": slotsB
+        }),
+        "coherence": {"ok": len(notes) == 0, "notes": notes}
+    }
+
+
+ASSEMBLERS = {
+    "efootball": assemble_efootball,
+    "fcm": assemble_fcm,
+    "dls": assemble_dls,
+    "freefire": assemble_freefire,
+}
+
+# Request fields an assembler reads besides matchId, so they belong in the result cache key
+IDENTITY = {
+    "dls": ("uploaderGameUser", "opponentGameUser"),
+    "freefire": ("uploaderGameUser", "opponentGameUser", "roster"),
+}
+
+
+def assembler_of(profile):
+    return profile.get("assembler", profile["game"])
+
+
+def request_identity(profile, request):
+    parts = []
+    for name in IDENTITY.get(assembler_of(profile), ()):
+        value = request.get(name)
+        parts.append(value.version if name == "roster" and value is not None else value)
+    if request.get("mode", "full") != "full":
+        parts.append(request["mode"])
+    return parts
+
+
+def fast_stages(profile):
+    # Fields always read ("required": identity and validity checks) go with the winner rule's first stage
+    rule = WINNER_RULES[profile["winner"]]
+    fields = profile.get("winnerStages") or [fields for fields, _ in rule.stages]
+    stages = [(list(names), decisive) for names, (_, decisive) in zip(fields, rule.stages)]
+    stages[0] = (list(profile.get("required", [])) + stages[0][0], stages[0][1])
+    return stages
+
+
+def numeric_fields(profile):
+    return tuple(name for name, spec in profile["fields"].items() if spec.get("parser", "text") in NUMERIC_PARSERS)
+
+
+def field_reads(profile, reads):
+    # ROI-level reads from the glyph engine -> per field: the engine that produced it and its weakest ROI's confidence
+    out = {}
+    for name, spec in profile["fields"].items():
+        bases = [spec[k] for k in ("roi", "left", "right") if k in spec]
+        found = [read for key, read in reads.items() if key.split(".")[0] in bases]
+        if not found:
+            continue
+        engines = {read["engine"] for read in found}
+        scores = [read["confidence"] for read in found]
+        out[name] = {
+            "engine": engines.pop() if len(engines) == 1 else "mixed",
+            "confidence": min(scores) if None not in scores else None,
+        }
+    return out
+
+
+def roi_fields(profile):
+    # ROI key -> the field that reads it, for labeling per-ROI timings
+    return {spec[k]: name for name, spec in profile["fields"].items() for k in ("roi", "left", "right") if k in spec}
+
+
+def _assemble(profile, request, texts, upload, width, height, exif_time, timings):
+    with timings.stage("parse"):
+        values = read_fields(profile, texts)
+    with timings.stage("sides"):
+        mapping, uploader_side = resolve_sides(profile, values, request)
+    verify = Verify(profile, request, values, mapping, uploader_side, upload, width, height, exif_time, timings)
+    with timings.stage("assemble"):
+        return ASSEMBLERS[assembler_of(profile)](verify)
+
+
+def verify_upload(profile, request, upload):
+    # decode -> screen against screenshots seen in the tournament -> batched OCR over the ROIs the fields use
+    # -> parse -> map sides -> assemble. mode=fast OCRs stage by stage and stops once the winner rule has what it needs.
+    # The result carries per-ROI image signatures under "_signatures" for the match store, the closest
+    # earlier screenshot under "_screening", its stage timings under "_timings" and under "_fallbacks" how many
+    # labels were read untranslated because the translation missed its budget; callers pop all four.
+    timings = Timings()
+    fallbacks = translator.fallbacks()
+    with timings.stage("decode"):
+        img, exif_time, (width, height) = load_upload(upload, min_roi_height(profile))
+    h, w = img.shape[:2]
+    with timings.stage("screen"):
+        plan = profile_registry.plan(profile, w, h)
+        fingerprints = roi_fingerprints(img, plan)
+        scope = screen_scope(profile, request)
+        hit = screen_index.lookup(scope, fingerprints)
+    fast = request.get("mode", "full") == "fast"
+
+    reads = {}
+    if hit is not None and hit.exact and hit.entry["texts"] is not None:
+        # Same ink in every ROI as a screenshot already read in full: its names and labels are reused,
+        # numbers are read again (a retouched digit can leave a 32x16 ink hash unchanged)
+        numeric = numeric_fields(profile)
+        bases = {spec[k] for name, spec in profile["fields"].items() if name in numeric for k in ("roi", "left", "right") if k in spec}
+        texts = dict(hit.entry["texts"])
+        reads = {key: read for key, read in hit.entry["reads"].items() if key.split(".")[0] not in bases}
+        if numeric:
+            with timings.stage("ocr"):
+                texts.update(ocr_plan(img, profile_registry.plan(profile, w, h, numeric), reads, timings))
+        result = _assemble(profile, request, texts, upload, width, height, exif_time, timings)
+        if fast:
+            result["meta"]["evaluation"] = {"mode": "fast", "stages": 0, "skipped": []}
+    elif not fast:
+        with timings.stage("ocr"):
+            texts = ocr_plan(img, plan, reads, timings)
+        result = _assemble(profile, request, texts, upload, width, height, exif_time, timings)
+        screen_index.add(scope, fingerprints, upload.digest, request["matchId"], request.get("userId"), texts, reads)
+    else:
+        stages = fast_stages(profile)
+        texts, read = {}, set()
+        for i, (names, decisive) in enumerate(stages):
+            fresh = tuple(name for name in names if name not in read)
+            read.update(fresh)
+            if fresh:
+                with timings.stage("ocr"):
+                    texts.update(ocr_plan(img, profile_registry.plan(profile, w, h, fresh), reads, timings))
+            skipped = [name for name in profile["fields"] if name not in read]
+            # Confidence counts only the values read: a skipped field scores like an unread one, so a fast
+            # result is never more confident than a full read of the same screenshot
+            result = _assemble(profile, request, texts, upload, width, height, exif_time, timings)
+            if decisive is None or result["tieBreak"] in decisive:
+                break
+        result["meta"]["evaluation"] = {"mode": "fast", "stages": i + 1, "skipped": skipped}
+        screen_index.add(scope, fingerprints, upload.digest, request["matchId"], request.get("userId"), texts if not skipped else None, reads)
+
+    if reads:
+        result["meta"]["fields"] = field_reads(profile, reads)
+
+    # Flagged by the caller (screen.relevant), so a result cache hit is judged against its own request
+    result["_screening"] = hit.describe() if hit is not None else None
+    with timings.stage("signatures"):
+        result["_signatures"] = roi_signatures(img, plan)
+    fields = roi_fields(profile)
+    timings.rois = [[fields.get(key, key), engine, seconds] for key, engine, seconds in timings.rois]
+    result["_timings"] = timings.as_dict()
+    result["_fallbacks"] = translator.fallbacks() - fallbacks
+    return result
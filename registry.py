@@ -0,0 +1,301 @@
+import os, json, glob, time, threading, logging
+from collections import OrderedDict
+from cache import profile_hash
+from validators import compile_labels, LABEL_MAX_EDITS
+
+PROFILES_DIR = os.getenv("PROFILES_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles"))
+PROFILE_RELOAD_INTERVAL = float(os.getenv("PROFILE_RELOAD_INTERVAL", "5"))  # seconds between change checks, 0 disables
+ROI_PLAN_CACHE_SIZE = int(os.getenv("ROI_PLAN_CACHE_SIZE", "256"))  # (profile, resolution) plans kept
+DEFAULT_PREPROCESS = {"threshold": "otsu"}
+# "preprocess" options: threshold otsu|adaptive|none, invert auto|true|false (light-on-dark text),
+# upscale true (to the recognizer's input height before thresholding), allowlist (a name below or the characters),
+# engine easyocr|glyphs|tesseract|onnx (see engines.py; a profile-level "engines" maps parsers to a default),
+# atlas (glyph atlas, defaults to the game)
+OCR_ENGINES = ("easyocr", "glyphs", "tesseract", "onnx")
+PREPROCESS_OPTIONS = {"threshold": ("otsu", "adaptive", "none"), "invert": ("auto", True, False), "upscale": (True, False),
+                      "engine": OCR_ENGINES}
+# Names pipeline.PARSERS (plus "label") and pipeline.WINNER_RULES define; checked here so a profile naming
+# another fails at load time instead of on its first request
+PARSER_NAMES = ("text", "int", "percent", "clock", "score", "penalties", "label")
+WINNER_RULE_NAMES = ("goals_penalties", "goals_percent", "kills_damage")
+ALLOWLISTS = {"digits": "0123456789", "percent": "0123456789%", "score": "0123456789-: "}
+
+log = logging.getLogger("ocr.profiles")
+
+
+class ProfileError(Exception):
+    pass
+
+
+def flatten_rois(roi):
+    # {"left_kills": [[...], [...]]} -> {"left_kills.0": [...], "left_kills.1": [...]}
+    flat = {}
+    for key, box in roi.items():
+        if box and isinstance(box[0], (list, tuple)):
+            for i, b in enumerate(box):
+                flat[f"{key}.{i}"] = b
+        else:
+            flat[key] = box
+    return flat
+
+
+class RoiPlan:
+    # Pixel geometry of a profile at one resolution. `rects` are absolute; `groups` hold
+    # each distinct rect relative to the union box with the ROI keys that share it.
+    # `batches` lists the groups that share preprocessing params: (params, [group index, ...]).
+    __slots__ = ("width", "height", "rects", "union", "groups", "batches")
+
+    def __init__(self, width, height, rects, union, groups):
+        self.width = width
+        self.height = height
+        self.rects = rects
+        self.union = union
+        self.groups = groups
+        batches = OrderedDict()
+        for i, (_, _, params) in enumerate(groups):
+            batches.setdefault(tuple(sorted(params.items())), (params, []))[1].append(i)
+        self.batches = list(batches.values())
+
+
+def field_rois(profile, names=None):
+    # Only the ROIs some field (of `names`, when given) reads get OCR'd; profiles without "fields" read them all
+    fields = profile.get("fields")
+    if not fields:
+        return profile["roi"]
+    used = set()
+    for name, spec in fields.items():
+        if names is None or name in names:
+            used.update(spec[k] for k in ("roi", "left", "right") if k in spec)
+    return {key: box for key, box in profile["roi"].items() if key in used}
+
+
+def min_roi_height(profile):
+    return min(box[3] - box[1] for box in flatten_rois(field_rois(profile)).values())
+
+
+def roi_preprocess(profile):
+    # "preprocess" entries name a field (applied to every ROI it reads) or an ROI; ROI entries win
+    # A field's engine comes from its own entry, else from "engines" by its parser ({"int": "glyphs"})
+    preprocess = profile.get("preprocess") or {}
+    engines = profile.get("engines") or {}
+    out = {}
+    for name, spec in profile.get("fields", {}).items():
+        params = dict(preprocess.get(name, {}))
+        if "engine" not in params and spec.get("parser", "text") in engines:
+            params["engine"] = engines[spec.get("parser", "text")]
+        if params:
+            for key in (spec.get("roi"), spec.get("left"), spec.get("right")):
+                if key:
+                    out.setdefault(key, {}).update(params)
+    for name, params in preprocess.items():
+        if name in profile["roi"]:
+            out.setdefault(name, {}).update(params)
+    for params in out.values():
+        if params.get("engine") == "glyphs":
+            params.setdefault("atlas", profile.get("glyphAtlas", profile["game"]))
+    return out
+
+
+def build_plan(roi, width, height, preprocess=None):
+    preprocess = preprocess or {}
+    rects = {}
+    for key, box in flatten_rois(roi).items():
+        rects[key] = (int(box[0] * width), int(box[1] * height), int(box[2] * width), int(box[3] * height))
+    if not rects:
+        return RoiPlan(width, height, {}, (0, 0, 0, 0), [])
+    union = (min(r[0] for r in rects.values()), min(r[1] for r in rects.values()),
+             max(r[2] for r in rects.values()), max(r[3] for r in rects.values()))
+    shared = OrderedDict()
+    for key, (x0, y0, x1, y1) in rects.items():
+        shared.setdefault((x0 - union[0], y0 - union[1], x1 - union[0], y1 - union[1]), []).append(key)
+    groups = []
+    for local, keys in shared.items():
+        field = keys[0].split(".")[0]
+        params = {**DEFAULT_PREPROCESS, **preprocess.get(field, {})}
+        if params.get("allowlist"):
+            params["allowlist"] = ALLOWLISTS.get(params["allowlist"], params["allowlist"])
+        groups.append((local, keys, params))
+    return RoiPlan(width, height, rects, union, groups)
+
+
+def _check_box(name, box):
+    if not isinstance(box, (list, tuple)) or len(box) != 4 or not all(isinstance(v, (int, float)) for v in box):
+        raise ProfileError(f"ROI {name} must be [x0, y0, x1, y1]")
+    x0, y0, x1, y1 = box
+    if not (0 <= x0 < x1 <= 1 and 0 <= y0 < y1 <= 1):
+        raise ProfileError(f"ROI {name} is outside the frame or empty: {box}")
+
+
+def _check_object(name, value, of=None):
+    if not isinstance(value, dict) or (of is not None and not all(isinstance(v, of) for v in value.values())):
+        raise ProfileError(f"{name} must be an object" + (" of objects" if of is dict else ""))
+
+
+def validate_profile(profile):
+    if not isinstance(profile, dict):
+        raise ProfileError("a profile must be a JSON object")
+    for field in ("game", "teamSize", "layoutVersion", "roi"):
+        if field not in profile:
+            raise ProfileError(f"missing {field}")
+    if not isinstance(profile["game"], str) or not isinstance(profile["layoutVersion"], str):
+        raise ProfileError("game and layoutVersion must be strings")
+    if not isinstance(profile["teamSize"], int) or isinstance(profile["teamSize"], bool) or profile["teamSize"] < 1:
+        raise ProfileError("teamSize must be a positive integer")
+    if not isinstance(profile["roi"], dict) or not profile["roi"]:
+        raise ProfileError("roi must be a non-empty object")
+    for name, box in profile["roi"].items():
+        if isinstance(box, (list, tuple)) and box and isinstance(box[0], (list, tuple)):
+            for i, b in enumerate(box):
+                _check_box(f"{name}[{i}]", b)
+        else:
+            _check_box(name, box)
+    _check_object("labels", profile.get("labels", {}))
+    for name, variants in profile.get("labels", {}).items():
+        if not isinstance(variants, list) or not all(isinstance(v, str) for v in variants):
+            raise ProfileError(f"labels.{name} must be a list of strings")
+    _check_object("fields", profile.get("fields", {}), dict)
+    for name, spec in profile.get("fields", {}).items():
+        refs = [spec["roi"]] if "roi" in spec else [spec.get("left"), spec.get("right")]
+        for ref in refs:
+            if not isinstance(ref, str) or ref not in profile["roi"]:
+                raise ProfileError(f"fields.{name} reads unknown ROI {ref}")
+        parser = spec.get("parser", "text")
+        if parser not in PARSER_NAMES:
+            raise ProfileError(f"fields.{name}.parser must be one of {', '.join(PARSER_NAMES)}")
+        if parser == "label" and not spec.get("labels"):
+            raise ProfileError(f"fields.{name} needs labels for the label parser")
+        if not isinstance(spec.get("labels", []), list):
+            raise ProfileError(f"fields.{name}.labels must be a list")
+        for label in spec.get("labels", []):
+            if not isinstance(label, str) or label not in profile.get("labels", {}):
+                raise ProfileError(f"fields.{name} uses unknown label {label}")
+    _check_object("preprocess", profile.get("preprocess", {}), dict)
+    for name, params in profile.get("preprocess", {}).items():
+        if name not in profile["roi"] and name not in profile.get("fields", {}):
+            raise ProfileError(f"preprocess.{name} is neither a field nor an ROI")
+        for option, value in params.items():
+            if option == "allowlist":
+                if not isinstance(value, str) or not value:
+                    raise ProfileError(f"preprocess.{name}.allowlist must be {', '.join(ALLOWLISTS)} or the allowed characters")
+            elif option == "atlas":
+                if not isinstance(value, str) or not value:
+                    raise ProfileError(f"preprocess.{name}.atlas must be an atlas name")
+            elif not isinstance(value, (str, bool)) or value not in PREPROCESS_OPTIONS.get(option, ()):
+                raise ProfileError(f"preprocess.{name}.{option} must be one of {PREPROCESS_OPTIONS.get(option, ())}")
+    _check_object("engines", profile.get("engines", {}))
+    for parser, engine in profile.get("engines", {}).items():
+        if not isinstance(engine, str) or engine not in OCR_ENGINES:
+            raise ProfileError(f"engines.{parser} must be one of {', '.join(OCR_ENGINES)}")
+    if profile.get("fields") and "winner" not in profile:
+        raise ProfileError("profiles with fields need a winner rule")
+    if "winner" in profile and profile["winner"] not in WINNER_RULE_NAMES:
+        raise ProfileError(f"winner must be one of {', '.join(WINNER_RULE_NAMES)}")
+    sides = profile.get("sides", {"A": "left", "B": "right"})
+    if sides != "uploader" and (not isinstance(sides, dict) or sorted(sides) != ["A", "B"] or sorted(sides.values()) != ["left", "right"]):
+        raise ProfileError('sides must be "uploader" or {"A": "left"|"right", "B": the other}')
+    required, stages = profile.get("required", []), profile.get("winnerStages", [])
+    if not isinstance(required, list) or not isinstance(stages, list) or not all(isinstance(stage, list) for stage in stages):
+        raise ProfileError("required must be a list of fields and winnerStages a list of lists")
+    for name in required + [f for stage in stages for f in stage]:
+        if not isinstance(name, str) or name not in profile.get("fields", {}):
+            raise ProfileError(f"unknown field {name} in required/winnerStages")
+
+
+class ProfileRegistry:
+    def __init__(self, directory=PROFILES_DIR, reload_interval=PROFILE_RELOAD_INTERVAL):
+        self.directory = directory
+        self.reload_interval = reload_interval
+        self.lock = threading.Lock()
+        self.profiles = {}  # (game, teamSize, layoutVersion) -> profile
+        self.hashes = {}
+        self.sources = {}  # profile file -> the key it loaded as
+        self.mtimes = {}
+        self.errors = {}
+        self.checked_at = 0.0
+        self.plans = OrderedDict()
+        self.load()
+
+    def _scan(self):
+        return {path: os.stat(path).st_mtime for path in sorted(glob.glob(os.path.join(self.directory, "*.json")))}
+
+    def load(self):
+        mtimes = self._scan()
+        profiles, hashes, sources, errors, failed = {}, {}, {}, {}, []
+        for path in mtimes:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    profile = json.load(f)
+                validate_profile(profile)
+                key = (profile["game"], int(profile["teamSize"]), profile["layoutVersion"])
+                digest = profile_hash(profile)
+            except (OSError, ValueError, ProfileError) as e:
+                errors[os.path.basename(path)] = str(e)
+                failed.append(path)
+                log.error("Skipping profile %s: %s", path, e)
+                continue
+            profiles[key] = profile
+            hashes[key] = digest
+            sources[path] = key
+        with self.lock:
+            # A broken edit must not take a working layout offline: a file that fails keeps what it last loaded.
+            # Files that parse replace their entry, and profiles whose file is gone are dropped.
+            for path in failed:
+                key = self.sources.get(path)
+                if key is not None and key not in profiles:
+                    profiles[key] = self.profiles[key]
+                    hashes[key] = self.hashes[key]
+                    sources[path] = key
+            self.profiles, self.hashes, self.sources, self.mtimes, self.errors = profiles, hashes, sources, mtimes, errors
+            self.plans.clear()
+            self.checked_at = time.monotonic()
+
+    def maybe_reload(self):
+        if self.reload_interval <= 0 or time.monotonic() - self.checked_at < self.reload_interval:
+            return
+        self.checked_at = time.monotonic()
+        if self._scan() != self.mtimes:
+            log.info("Profiles changed on disk, reloading")
+            self.load()
+
+    def get(self, game, team_size=1, layout_version="v1"):
+        self.maybe_reload()
+        profile = self.profiles.get((game, int(team_size), layout_version))
+        if profile is None:
+            raise KeyError(f"No {game} {team_size}v{team_size} profile for layout {layout_version}")
+        return profile
+
+    def plan(self, profile, width, height, fields=None):
+        # fields: tuple of field names to plan for (one stage of a fast evaluation), None for all
+        key = (profile["game"], int(profile["teamSize"]), profile["layoutVersion"], self.hash_of(profile), width, height, fields)
+        with self.lock:
+            plan = self.plans.get(key)
+            if plan is not None:
+                self.plans.move_to_end(key)
+                return plan
+        plan = build_plan(field_rois(profile, fields), width, height, roi_preprocess(profile))
+        with self.lock:
+            self.plans[key] = plan
+            while len(self.plans) > ROI_PLAN_CACHE_SIZE:
+                self.plans.popitem(last=False)
+        return plan
+
+    def label_matcher(self, profile, *keys):
+        # Compiled once per distinct (labels, keys) content; later calls are a cache lookup
+        labels = profile.get("labels", {})
+        return compile_labels({k: labels.get(k, []) for k in keys}, profile.get("labelMaxEdits", LABEL_MAX_EDITS))
+
+    def hash_of(self, profile):
+        return self.hashes.get((profile["game"], int(profile["teamSize"]), profile["layoutVersion"])) or profile_hash(profile)
+
+    def describe(self):
+        with self.lock:
+            return {
+                "profiles": [
+                    {"game": g, "teamSize": t, "layoutVersion": v, "hash": self.hashes[(g, t, v)]}
+                    for (g, t, v) in sorted(self.profiles)
+                ],
+                "errors": self.errors,
+            }
+
+
+profile_registry = ProfileRegistry()
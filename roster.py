@@ -0,0 +1,111 @@
+import os, hashlib, threading
+from collections import OrderedDict
+from Levenshtein import distance as lev
+from validators import normalize_username
+
+ROSTER_MAX_EDITS = int(os.getenv("ROSTER_MAX_EDITS", "2"))
+ROSTER_CACHE_SIZE = int(os.getenv("ROSTER_CACHE_SIZE", "512"))  # rosters (matches/tournaments) kept in memory
+
+
+class BKTree:
+    # Metric tree over Levenshtein distance: a lookup with tolerance k only descends into
+    # children whose edge distance lies in [d - k, d + k].
+    def __init__(self):
+        self.root = None
+
+    def add(self, word):
+        if self.root is None:
+            self.root = (word, {})
+            return
+        node = self.root
+        while True:
+            d = lev(word, node[0])
+            if d == 0:
+                return
+            child = node[1].get(d)
+            if child is None:
+                node[1][d] = (word, {})
+                return
+            node = child
+
+    def search(self, word, max_dist):
+        found = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            d = lev(word, node[0])
+            if d <= max_dist:
+                found.append((d, node[0]))
+            for edge, child in node[1].items():
+                if d - max_dist <= edge <= d + max_dist:
+                    stack.append(child)
+        return sorted(found)
+
+
+class RosterIndex:
+    def __init__(self, usernames, max_edits=ROSTER_MAX_EDITS):
+        self.max_edits = max_edits
+        self.names = {}  # normalized -> registered spelling
+        self.tree = BKTree()
+        for name in usernames:
+            norm = normalize_username(name)
+            if norm and norm not in self.names:
+                self.names[norm] = name
+                self.tree.add(norm)
+        self.version = hashlib.sha1("\n".join(sorted(self.names)).encode("utf-8")).hexdigest()[:12]
+
+    def __len__(self):
+        return len(self.names)
+
+    def best(self, ocr_name):
+        # -> (registered name, distance) or (None, None)
+        hits = self.tree.search(normalize_username(ocr_name), self.max_edits)
+        if not hits:
+            return None, None
+        d, norm = hits[0]
+        return self.names[norm], d
+
+    def assign(self, ocr_names):
+        # One registered name per slot, closest pairs first -> [{"slot", "ocr", "match", "distance"}]
+        candidates = []
+        for slot, ocr_name in enumerate(ocr_names):
+            for d, norm in self.tree.search(normalize_username(ocr_name), self.max_edits):
+                candidates.append((d, slot, norm))
+        slots = [{"slot": i, "ocr": name, "match": None, "distance": None} for i, name in enumerate(ocr_names)]
+        taken = set()
+        for d, slot, norm in sorted(candidates):
+            if slots[slot]["match"] is None and norm not in taken:
+                slots[slot]["match"] = self.names[norm]
+                slots[slot]["distance"] = d
+                taken.add(norm)
+        return slots
+
+    def contains(self, slots, name):
+        norm = normalize_username(name)
+        return any(s["match"] is not None and normalize_username(s["match"]) == norm for s in slots)
+
+
+class RosterStore:
+    def __init__(self, size=ROSTER_CACHE_SIZE):
+        self.size = size
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def put(self, roster_id, usernames):
+        index = RosterIndex(usernames)
+        with self.lock:
+            self.items[roster_id] = index
+            self.items.move_to_end(roster_id)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+        return index
+
+    def get(self, roster_id):
+        with self.lock:
+            index = self.items.get(roster_id)
+            if index is not None:
+                self.items.move_to_end(roster_id)
+            return index
+
+
+rosters = RosterStore()
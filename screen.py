@@ -0,0 +1,246 @@
+import os, threading
+from collections import OrderedDict
+import numpy as np
+
+SCREEN_INDEX_SIZE = int(os.getenv("SCREEN_INDEX_SIZE", "20000"))  # screenshots remembered per tournament and layout
+SCREEN_SCOPES = int(os.getenv("SCREEN_SCOPES", "256"))  # tournament/layout indexes kept
+SCREEN_INDEX_MB = float(os.getenv("SCREEN_INDEX_MB", "256"))  # estimated memory of all indexes together, oldest evicted first
+SCREEN_MAX_BITS = int(os.getenv("SCREEN_MAX_BITS", "128"))  # total fingerprint distance for a candidate, 0 disables screening
+SCREEN_ROI_BITS = int(os.getenv("SCREEN_ROI_BITS", "5"))  # per-ROI distance (of 512 bits) still counted as the same content when flagging
+SCREEN_EDIT_ROIS = int(os.getenv("SCREEN_EDIT_ROIS", "2"))  # at most this many changed ROIs reads as an edited copy
+
+ROI_BITS = 512  # ocr.ink_hash over 32x16
+CHUNK_ENTRY_BYTES = 330  # one code in one chunk table: its part, a set and the dict slot (measured on CPython 3.11)
+
+
+class HammingIndex:
+    # Multi-index hashing: two codes within k bits of each other agree exactly on at least one of
+    # k + 1 disjoint chunks, so a lookup is k + 1 dict probes plus a popcount per candidate.
+    # Chunk i takes every (k + 1)-th bit starting at i, so each chunk samples every ROI instead of
+    # one ROI's background that all screenshots of a layout share.
+    def __init__(self, bits, max_bits):
+        self.bits = bits
+        self.chunks = max_bits + 1
+        self.tables = [{} for _ in range(self.chunks)]
+        self.codes = {}
+
+    def _parts(self, code):
+        raw = np.frombuffer(code.to_bytes(self.bits // 8, "big"), dtype=np.uint8)
+        bits = np.unpackbits(raw)
+        bits = np.pad(bits, (0, -len(bits) % self.chunks)).reshape(-1, self.chunks).T
+        return [row.tobytes() for row in np.packbits(bits, axis=1)]
+
+    def add(self, key, code):
+        self.codes[key] = code
+        for table, part in zip(self.tables, self._parts(code)):
+            table.setdefault(part, set()).add(key)
+
+    def remove(self, key):
+        code = self.codes.pop(key, None)
+        if code is None:
+            return
+        for table, part in zip(self.tables, self._parts(code)):
+            keys = table[part]
+            keys.discard(key)
+            if not keys:
+                del table[part]
+
+    def search(self, code, max_bits):
+        seen, found = set(), []
+        for table, part in zip(self.tables, self._parts(code)):
+            for key in table.get(part, ()):
+                if key not in seen:
+                    seen.add(key)
+                    d = (code ^ self.codes[key]).bit_count()
+                    if d <= max_bits:
+                        found.append((d, key))
+        return sorted(found)
+
+
+class ScreenHit:
+    __slots__ = ("entry", "distance", "changed")
+
+    def __init__(self, entry, distance, changed):
+        self.entry = entry
+        self.distance = distance
+        self.changed = changed
+
+    @property
+    def duplicate(self):
+        return not self.changed
+
+    @property
+    def exact(self):
+        # Identical fingerprints: the only hit whose OCR texts are reused, a near one only flags
+        return self.distance == 0
+
+    @property
+    def edited(self):
+        # A few boxes differ and the rest match: the classic retouched score
+        return 0 < len(self.changed) <= SCREEN_EDIT_ROIS
+
+    def describe(self):
+        return {"matchId": self.entry["matchId"], "userId": self.entry["userId"], "bytesHash": self.entry["digest"],
+                "distance": self.distance, "changedRois": self.changed, "edited": self.edited}
+
+
+class ScreenIndex:
+    # Per (tournament, layout) index of the ROI fingerprints of every screenshot already verified.
+    # A screenshot's code is its per-ROI ink hashes concatenated, so a different score in one small
+    # box counts even though the rest of the scoreboard template is identical.
+    # Bounded by SCREEN_INDEX_MB across all scopes: the oldest entries of the least recently used scope go first.
+    # Lives in the process that runs verify_upload: with OCR_EXECUTOR=process each worker screens on its own.
+    def __init__(self, size=SCREEN_INDEX_SIZE, scopes=SCREEN_SCOPES, max_bits=SCREEN_MAX_BITS, max_mb=SCREEN_INDEX_MB):
+        self.size = size
+        self.max_scopes = scopes
+        self.max_bits = max_bits
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.bytes = 0
+        self.scopes = OrderedDict()  # scope -> (keys, HammingIndex, OrderedDict digest -> entry)
+        self.lock = threading.Lock()
+        self.duplicates = 0
+        self.edits = 0
+
+    @staticmethod
+    def _code(keys, fingerprints):
+        code = 0
+        for key in keys:
+            code = (code << ROI_BITS) | fingerprints[key]
+        return code
+
+    @staticmethod
+    def _cost(index, entry):
+        # Estimated resident bytes: the code in every chunk table, the fingerprints, the reused texts and reads
+        texts = entry["texts"] or {}
+        return (index.chunks * CHUNK_ENTRY_BYTES + len(entry["fingerprints"]) * (ROI_BITS // 8 + 120)
+                + sum(len(k) + len(v) + 120 for k, v in texts.items()) + len(entry["reads"]) * 300)
+
+    def _drop_scope(self, scope):
+        _, _, entries = self.scopes.pop(scope)
+        self.bytes -= sum(entry["bytes"] for entry in entries.values())
+
+    def _evict(self, index, entries):
+        old, entry = entries.popitem(last=False)
+        index.remove(old)
+        self.bytes -= entry["bytes"]
+
+    def _scope(self, scope, fingerprints, create):
+        keys = tuple(sorted(fingerprints))
+        state = self.scopes.get(scope)
+        if state is None or state[0] != keys:
+            if not create:
+                return None
+            if state is not None:
+                self._drop_scope(scope)
+            state = (keys, HammingIndex(ROI_BITS * len(keys), self.max_bits), OrderedDict())
+            self.scopes[scope] = state
+            while len(self.scopes) > self.max_scopes:
+                self._drop_scope(next(iter(self.scopes)))
+        self.scopes.move_to_end(scope)
+        return state
+
+    def lookup(self, scope, fingerprints):
+        # Closest earlier screenshot within SCREEN_MAX_BITS, with the ROIs that differ
+        if self.max_bits <= 0 or not fingerprints:
+            return None
+        with self.lock:
+            state = self._scope(scope, fingerprints, False)
+            if state is None:
+                return None
+            keys, index, entries = state
+            found = index.search(self._code(keys, fingerprints), self.max_bits)
+            if not found:
+                return None
+            distance, digest = found[0]
+            entry = entries[digest]
+            changed = sorted(key for key in keys if (fingerprints[key] ^ entry["fingerprints"][key]).bit_count() > SCREEN_ROI_BITS)
+            hit = ScreenHit(entry, distance, changed)
+            if hit.duplicate:
+                self.duplicates += 1
+            elif hit.edited:
+                self.edits += 1
+            return hit
+
+    def add(self, scope, fingerprints, digest, match_id, user_id, texts=None, reads=None):
+        # texts: the OCR output of a full read (with its per-ROI reads), reused for later exact copies
+        if self.max_bits <= 0 or not fingerprints:
+            return
+        with self.lock:
+            keys, index, entries = self._scope(scope, fingerprints, True)
+            entry = entries.get(digest)
+            if entry is not None:
+                entries.move_to_end(digest)
+                if texts is not None:
+                    entry.update(texts=texts, reads=reads or {})
+            else:
+                entry = entries[digest] = {"digest": digest, "matchId": match_id, "userId": user_id, "fingerprints": fingerprints,
+                                           "texts": texts, "reads": reads or {}, "bytes": 0}
+                index.add(digest, self._code(keys, fingerprints))
+            cost = self._cost(index, entry)
+            self.bytes += cost - entry["bytes"]
+            entry["bytes"] = cost
+            while len(entries) > self.size:
+                self._evict(index, entries)
+            while self.bytes > self.max_bytes:
+                oldest = next(iter(self.scopes))
+                _, old_index, old_entries = self.scopes[oldest]
+                if oldest == scope and len(entries) <= 1:
+                    break
+                self._evict(old_index, old_entries)
+                if not old_entries:
+                    del self.scopes[oldest]
+
+    def by_digest(self, scope, digest):
+        with self.lock:
+            state = self.scopes.get(scope)
+            return state[2].get(digest) if state else None
+
+    def stats(self):
+        with self.lock:
+            return {
+                "scopes": len(self.scopes),
+                "entries": sum(len(state[2]) for state in self.scopes.values()),
+                "maxBits": self.max_bits,
+                "mb": round(self.bytes / (1024 * 1024), 1),
+                "maxMb": round(self.max_bytes / (1024 * 1024), 1),
+                "duplicates": self.duplicates,
+                "edits": self.edits,
+            }
+
+
+screen_index = ScreenIndex()
+
+
+def screen_scope(profile, request):
+    return (request.get("tournamentId") or "", profile["game"], int(profile["teamSize"]), profile["layoutVersion"])
+
+
+def seen_before(scope, digest, request):
+    # A byte-identical upload served from the result cache, compared against whoever sent it first
+    entry = screen_index.by_digest(scope, digest)
+    if entry is None or (entry["matchId"], entry["userId"]) == (request["matchId"], request.get("userId")):
+        return None
+    return {"matchId": entry["matchId"], "userId": entry["userId"], "bytesHash": digest, "distance": 0, "changedRois": [], "edited": False}
+
+
+def relevant(similar, digest, request):
+    # A screening hit, unless it is the exact file this user already sent for this match (re-read under other request fields)
+    if similar is None or (similar["bytesHash"], similar["matchId"], similar["userId"]) == (digest, request["matchId"], request.get("userId")):
+        return None
+    return similar
+
+
+def flag(result, similar, request):
+    # Records what the screenshot resembles; a copy from another match or an edited copy needs review
+    review = similar["matchId"] != request["matchId"] or similar["edited"]
+    result["meta"]["screening"] = {**similar, "review": review}
+    if review:
+        if similar["edited"]:
+            note = f"Screenshot looks like an edited copy of one submitted for match {similar['matchId']} ({', '.join(similar['changedRois'])} differ)"
+        elif similar["changedRois"]:
+            note = f"Screenshot resembles one submitted for match {similar['matchId']}"
+        else:
+            note = f"Screenshot is a near-duplicate of one submitted for match {similar['matchId']}"
+        result["coherence"]["notes"].append(note)
+        result["coherence"]["ok"] = False
+    return result
@@ -0,0 +1,17 @@
+import os, sys, tempfile
+
+# Modules live at the repo root; keep imports offline and out of the checkout
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TRANSLATE_BACKEND", "none")
+_data = tempfile.mkdtemp(prefix="ocr-tests-")
+os.environ.setdefault("JOBS_DB", os.path.join(_data, "jobs.db"))
+os.environ.setdefault("JOBS_DIR", os.path.join(_data, "jobs"))
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def ready(monkeypatch):
+    # Routes answer 503 until warmup finishes; tests that need another state set it themselves
+    import lifecycle
+    monkeypatch.setattr(lifecycle.model_state, "state", "ready")
@@ -0,0 +1,53 @@
+import json
+from fastapi.testclient import TestClient
+import main
+from executor import PoolFull
+
+
+def fake_verify(profile, request, upload):
+    data = bytes(upload.view)
+    upload.release()
+    return {"game": profile["game"], "teamSize": 1, "winner": None, "tieBreak": None, "confidence": 1.0,
+            "meta": {"matchId": request["matchId"], "bytesHash": upload.digest, "size": len(data)},
+            "coherence": {"ok": True, "notes": []}}
+
+
+def test_batch_item_retries_after_pool_full(monkeypatch):
+    calls = []
+
+    async def run(fn, *args, done=None):
+        calls.append(args)
+        if len(calls) == 1:
+            raise PoolFull()
+        result = fn(*args)
+        done()
+        return result
+
+    monkeypatch.setattr(main, "verify_upload", fake_verify)
+    monkeypatch.setattr(main.ocr_executor, "run", run)
+    items = [{"game": "efootball", "matchId": "batch-retry", "userId": "u1"}]
+    res = TestClient(main.app).post("/ocr/batch/verify", data={"items": json.dumps(items)},
+                                    files=[("images", ("a.png", b"not really a png", "image/png"))])
+    line = json.loads(res.text.splitlines()[0])
+    assert line["status"] == 200, line
+    assert line["result"]["meta"]["size"] == len(b"not really a png")
+    assert len(calls) == 2
+
+
+def test_batch_item_bad_team_size_is_422():
+    items = [{"game": "freefire", "teamSize": "four", "matchId": "m", "userId": "u", "uploaderGameUser": "a", "opponentGameUser": "b"}]
+    res = TestClient(main.app).post("/ocr/batch/verify", data={"items": json.dumps(items)},
+                                    files=[("images", ("a.png", b"x", "image/png"))])
+    assert json.loads(res.text.splitlines()[0])["status"] == 422
+
+
+def test_verify_routes_answer_503_until_models_are_ready(monkeypatch):
+    monkeypatch.setattr(main.model_state, "state", "warming")
+    client = TestClient(main.app)
+    res = client.post("/ocr/efootball/verify", data={"matchId": "m", "userId": "u"}, files={"image": ("a.png", b"x", "image/png")})
+    assert res.status_code == 503 and res.headers["Retry-After"]
+    res = client.post("/ocr/batch/verify", data={"items": "[{}]"}, files=[("images", ("a.png", b"x", "image/png"))])
+    assert res.status_code == 503
+    assert client.get("/readyz").status_code == 503
+    assert client.get("/healthz").status_code == 200
+
@@ -0,0 +1,65 @@
+import time
+import numpy as np
+import cv2
+from cache import ResultCache, CropMemo
+
+
+def test_result_cache_evicts_least_recently_used():
+    cache = ResultCache(size=2, db_path=None)
+    cache.put("a", {"v": 1})
+    cache.put("b", {"v": 2})
+    assert cache.get("a") == {"v": 1}
+    cache.put("c", {"v": 3})
+    assert cache.get("b") is None and cache.get("a") == {"v": 1}
+    got = cache.get("c")
+    got["v"] = 99
+    assert cache.get("c") == {"v": 3}
+    assert cache.stats()["hits"] == 4 and cache.stats()["misses"] == 1
+
+
+def test_disk_tier_survives_restarts_and_expires(tmp_path):
+    path = str(tmp_path / "results.db")
+    ResultCache(size=1, db_path=path).put("a", {"v": 1})
+    cache = ResultCache(size=1, db_path=path)
+    assert cache.get("a", disk=False) is None and cache.stats()["misses"] == 0
+    assert cache.get("a") == {"v": 1} and cache.stats()["diskHits"] == 1
+    assert cache.get("a", disk=False) == {"v": 1}
+    expired = ResultCache(size=1, db_path=path, ttl=-1)
+    expired.put("b", {"v": 2})
+    cache.items.clear()
+    assert cache.get("b") is None and cache.stats()["misses"] == 1
+    assert cache.db.execute("SELECT COUNT(*) FROM results WHERE key = 'b'").fetchone()[0] == 0
+
+
+def test_crop_memo_evicts_and_keys_on_allowlist():
+    memo = CropMemo(size=2)
+    a, b = np.zeros((8, 8), np.uint8), np.full((8, 8), 255, np.uint8)
+    assert memo.key(a) != memo.key(a, "0123456789") and memo.key(a) != memo.key(b)
+    assert memo.key(a) != memo.key(np.zeros((4, 16), np.uint8))
+    memo.put(memo.key(a), "a")
+    memo.put(memo.key(b), "b")
+    assert memo.get(memo.key(a)) == "a"
+    memo.put(memo.key(a, "01"), "c")
+    assert memo.get(memo.key(b)) is None and memo.stats()["entries"] == 2
+
+
+def test_normalized_crop_memo_matches_rescaled_crops():
+    memo = CropMemo(mode="normalized")
+    crop = np.zeros((48, 96), np.uint8)
+    crop[:, 40:56] = 255
+    assert memo.key(crop) == memo.key(cv2.resize(crop, (48, 24), interpolation=cv2.INTER_NEAREST))
+
+
+def test_bypassed_reads_neither_read_nor_fill_the_memo(monkeypatch):
+    import ocr
+    calls = []
+    monkeypatch.setattr(ocr.crop_batcher, "recognize", lambda crops, allowlists: calls.append(len(crops)) or ["7"] * len(crops))
+    monkeypatch.setattr(ocr, "crop_memo", CropMemo())
+    crop = np.full((10, 10), 255, np.uint8)
+    with ocr.crop_memo.bypassed():
+        assert ocr.recognize_crops([crop]) == ["7"]
+        assert ocr.recognize_crops([crop]) == ["7"]
+    assert calls == [1, 1] and ocr.crop_memo.stats()["entries"] == 0
+    ocr.recognize_crops([crop])
+    ocr.recognize_crops([crop])
+    assert calls == [1, 1, 1] and ocr.crop_memo.stats()["hits"] == 1
@@ -0,0 +1,76 @@
+import json
+import numpy as np
+import pytest
+import ocr
+from engines import ENGINES, OcrEngine, OnnxEngine, engine_for
+from registry import build_plan
+
+
+class FakeEngine(OcrEngine):
+    name = "fake"
+    min_confidence = 0.5
+
+    def __init__(self, results, available=True):
+        super().__init__()
+        self.results = results
+        self._available = available
+
+    def available(self):
+        return self._available
+
+    def read(self, crops, params):
+        return self.results[:len(crops)]
+
+
+def test_unavailable_engine_reads_as_easyocr(monkeypatch):
+    monkeypatch.setitem(ENGINES, "fake", FakeEngine([], available=False))
+    assert engine_for("fake") is ENGINES["easyocr"]
+    assert engine_for("missing") is ENGINES["easyocr"]
+    monkeypatch.setitem(ENGINES, "fake", FakeEngine([]))
+    assert engine_for("fake") is ENGINES["fake"]
+
+
+def test_unsure_and_unread_crops_go_to_easyocr(monkeypatch):
+    fake = FakeEngine([("1", 0.9), ("2", 0.1), (None, None)])
+    monkeypatch.setitem(ENGINES, "fake", fake)
+    monkeypatch.setattr(ocr, "OCR_MODE", "batch")
+    easy = []
+    monkeypatch.setattr(ocr, "recognize_crops", lambda crops, allowlists=None: easy.append(len(crops)) or ["e"] * len(crops))
+    plan = build_plan({"a": [0, 0, 0.2, 0.2], "b": [0.3, 0, 0.5, 0.2], "c": [0.6, 0, 0.8, 0.2], "d": [0, 0.5, 0.2, 0.7]}, 100, 100,
+                      {f: {"engine": "fake"} for f in ("a", "b", "c")})
+    reads = {}
+    texts = ocr.ocr_plan(np.full((100, 100), 200, np.uint8), plan, reads)
+    assert texts == {"a": "1", "b": "e", "c": "e", "d": "e"} and easy == [3]
+    assert reads == {"a": {"engine": "fake", "confidence": 0.9},
+                     "b": {"engine": "easyocr", "confidence": None, "fallbackFrom": "fake", "fallbackConfidence": 0.1}}
+    assert fake.stats()["crops"] == 3 and fake.stats()["fallbacks"] == 1
+
+
+def onnx_model(tmp_path, parity):
+    path = tmp_path / "recognizer.onnx"
+    path.write_bytes(b"")
+    (tmp_path / "recognizer.json").write_text(json.dumps({"characters": "0123456789", "imgH": 64, "parity": parity}))
+    return str(path)
+
+
+def test_onnx_model_loads_only_after_passing_its_parity_check(tmp_path):
+    assert OnnxEngine(onnx_model(tmp_path, {"passed": True}))._parity_passed()
+    assert not OnnxEngine(onnx_model(tmp_path, {"passed": False, "mismatches": 3}))._parity_passed()
+    assert not OnnxEngine(str(tmp_path / "missing.onnx"))._parity_passed()
+
+
+def test_parity_can_be_waived(tmp_path):
+    pytest.importorskip("onnxruntime")
+    assert not OnnxEngine(onnx_model(tmp_path, {"passed": False})).available()
+    assert OnnxEngine(onnx_model(tmp_path, {"passed": False}), require_parity=False).available()
+
+
+def test_onnx_decoding_collapses_repeats_and_blanks():
+    engine = OnnxEngine("unused.onnx")
+    engine.characters = ["[blank]"] + list("0123456789")
+    text, confidence = engine._decode(np.array([2, 2, 0, 2, 4, 0]), np.array([0.9, 0.9, 1.0, 0.8, 1.0, 1.0]))
+    assert text == "113" and confidence == pytest.approx((0.9 * 0.8 * 1.0) ** (2.0 / np.sqrt(3)))
+    assert engine._decode(np.zeros(4, int), np.ones(4)) == ("", 0.0)
+    assert engine._ignored("12") == [i for i in range(1, 11) if i not in (2, 3)]
+    batch = engine._batch([np.zeros((32, 32), np.uint8), np.full((32, 64), 255, np.uint8)])
+    assert batch.shape == (2, 1, 64, 128) and (batch[0, 0, :, 64:] == -1.0).all() and (batch[1] == 1.0).all()
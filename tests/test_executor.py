@@ -0,0 +1,63 @@
+import asyncio
+import threading
+import pytest
+from fastapi.testclient import TestClient
+import main
+from executor import OcrExecutor, PoolFull
+
+
+def test_full_pool_rejects_and_counts():
+    executor = OcrExecutor("thread", workers=1, queue_size=1)
+    release = threading.Event()
+
+    async def main():
+        first = asyncio.create_task(executor.run(release.wait, 5))
+        second = asyncio.create_task(executor.run(release.wait, 5))
+        await asyncio.sleep(0.05)
+        with pytest.raises(PoolFull):
+            await executor.run(release.wait, 5)
+        release.set()
+        return await asyncio.gather(first, second)
+
+    assert asyncio.run(main()) == [True, True]
+    stats = executor.stats()
+    assert stats["rejected"] == 1 and stats["completed"] == 2 and stats["inflight"] == 0
+    executor.shutdown()
+
+
+def test_cancelled_caller_keeps_the_slot_until_the_worker_finishes():
+    executor = OcrExecutor("thread", workers=1, queue_size=0)
+    release, events = threading.Event(), []
+
+    def job():
+        release.wait(5)
+        events.append("worker")
+        return "ok"
+
+    async def main():
+        task = asyncio.create_task(executor.run(job, done=lambda: events.append("done")))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert executor.stats()["inflight"] == 1 and events == []
+        with pytest.raises(PoolFull):
+            await executor.run(job)
+        release.set()
+        while executor.stats()["inflight"]:
+            await asyncio.sleep(0.01)
+
+    asyncio.run(main())
+    assert events == ["worker", "done"]
+    executor.shutdown()
+
+
+def test_verify_route_answers_503_with_retry_after_when_the_pool_is_full(monkeypatch):
+    async def run(fn, *args, done=None):
+        raise PoolFull()
+
+    monkeypatch.setattr(main.ocr_executor, "run", run)
+    res = TestClient(main.app).post("/ocr/efootball/verify", data={"matchId": "full-pool", "userId": "u"},
+                                    files={"image": ("a.png", b"x", "image/png")})
+    assert res.status_code == 503 and res.headers["Retry-After"] == str(main.OCR_RETRY_AFTER)
+    assert "inflight" in res.json()["pool"]
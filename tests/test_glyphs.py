@@ -0,0 +1,39 @@
+import numpy as np
+import cv2
+from glyphs import GlyphAtlas, GlyphAtlases, segment
+
+
+def render(text, scale=1.2, thickness=2):
+    img = np.full((48, 30 * len(text) + 20, 3), 230, dtype=np.uint8)
+    cv2.putText(img, text, (10, 38), cv2.FONT_HERSHEY_SIMPLEX, scale, (20, 20, 20), thickness, cv2.LINE_AA)
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    return cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+
+
+def atlas():
+    return GlyphAtlas.build([(render("0123456789"), "0123456789"), (render("24"), "2 4"), (render("77"), "777")])
+
+
+def test_build_keeps_crops_whose_glyphs_match_the_text():
+    built, skipped = atlas()
+    assert skipped == 1
+    assert list(built.labels) == list("0123456789") + ["2", "4"]
+    assert built.templates.shape == (12, 16 * 24)
+
+
+def test_read_returns_text_and_weakest_glyph_score():
+    built, _ = atlas()
+    text, confidence = built.read(render("4071"))
+    assert text == "4071" and confidence > 0.9
+    assert len(segment(render("4071"))[1]) == 4
+    assert built.read(np.zeros((0, 0), dtype=np.uint8)) == ("", 0.0)
+    assert GlyphAtlas([], np.zeros((0, 16 * 24))).read(render("1")) == ("", 0.0)
+
+
+def test_atlases_load_by_name(tmp_path):
+    built, _ = atlas()
+    built.save(str(tmp_path / "efootball.npz"))
+    atlases = GlyphAtlases(str(tmp_path))
+    assert atlases.get("efootball").read(render("90"))[0] == "90"
+    assert atlases.get("fcm") is None
+    assert atlases.stats() == {"efootball": 12, "fcm": None}
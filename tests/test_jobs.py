@@ -0,0 +1,161 @@
+import io, time, asyncio, threading
+import pytest
+from jobs import JobQueue, JobRunner, check_webhook_url, WEBHOOK_ATTEMPTS
+
+
+def make_queue(tmp_path, **kw):
+    queue = JobQueue(str(tmp_path / "data" / "jobs.db"), str(tmp_path / "data" / "jobs"), lanes=["final", "default"], max_attempts=2, **kw)
+    queue.open()
+    return queue
+
+
+def test_nothing_is_created_before_open(tmp_path):
+    JobQueue(str(tmp_path / "data" / "jobs.db"), str(tmp_path / "data" / "jobs"))
+    assert not (tmp_path / "data").exists()
+
+
+def submit(queue, lane="default"):
+    return queue.submit({"game": "efootball"}, io.BytesIO(b"png"), lane)
+
+
+def test_claim_takes_highest_lane_first(tmp_path):
+    queue = make_queue(tmp_path)
+    low = submit(queue)
+    high = submit(queue, "final")
+    assert queue.claim()["id"] == high
+    assert queue.claim()["id"] == low
+    assert queue.claim() is None
+
+
+def test_unknown_lane_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        submit(make_queue(tmp_path), "nope")
+
+
+class RacingDb:
+    # Lets another queue claim the job between this queue's SELECT and its UPDATE
+    def __init__(self, db, race):
+        self.db = db
+        self.race = race
+
+    def execute(self, sql, *args):
+        cur = self.db.execute(sql, *args)
+        if sql.startswith("SELECT") and self.race:
+            self.race.pop()()
+        return cur
+
+    def commit(self):
+        self.db.commit()
+
+
+def test_claim_is_exclusive_across_processes(tmp_path):
+    a, b = make_queue(tmp_path), make_queue(tmp_path)
+    job_id = submit(a)
+    won = []
+    b.db = RacingDb(b.db, [lambda: won.append(a.claim())])
+    assert b.claim() is None
+    assert won[0]["id"] == job_id
+    assert a.get(job_id)["attempts"] == 1
+
+
+def test_defer_keeps_the_attempt(tmp_path):
+    queue = make_queue(tmp_path)
+    job_id = submit(queue)
+    queue.defer(queue.claim(), 0)
+    job = queue.claim()
+    assert job["id"] == job_id and job["attempts"] == 1
+
+
+def test_fail_requeues_then_dead_letters_and_retry_replays(tmp_path, monkeypatch):
+    monkeypatch.setattr("jobs.JOB_RETRY_DELAY", 0)
+    queue = make_queue(tmp_path)
+    job_id = submit(queue)
+    assert queue.fail(queue.claim(), "boom") == "queued"
+    assert queue.fail(queue.claim(), "boom") == "dead"
+    assert queue.get(job_id)["status"] == "dead"
+    assert queue.list("dead")[0]["error"] == {"status": 500, "detail": "boom"}
+    assert queue.retry(job_id)
+    assert not queue.retry(job_id)
+    assert queue.claim()["attempts"] == 1
+
+
+def test_complete_and_reject_finish_the_job(tmp_path):
+    queue = make_queue(tmp_path)
+    done, bad = submit(queue), submit(queue)
+    queue.complete(queue.claim(), {"winner": "A"})
+    queue.reject(queue.claim(), 422, "Missing userId")
+    assert queue.get(done)["result"] == {"winner": "A"}
+    assert queue.get(bad)["error"] == {"status": 422, "detail": "Missing userId"}
+
+
+def test_only_stale_running_jobs_are_requeued(tmp_path):
+    queue = make_queue(tmp_path, lease=60)
+    live, stale = submit(queue), submit(queue)
+    queue.claim(), queue.claim()
+    queue.db.execute("UPDATE jobs SET updated = ? WHERE id = ?", (time.time() - 120, stale))
+    queue.db.commit()
+    # Another worker starting up must leave the live job alone
+    make_queue(tmp_path, lease=60)
+    assert queue.get(live)["status"] == "running"
+    assert queue.get(stale)["status"] == "queued"
+    queue.touch(live)
+    assert queue.requeue_stale() == 0
+
+
+@pytest.mark.parametrize("url", ["ftp://93.184.216.34/x", "http://127.0.0.1/hook", "http://localhost:8000/hook", "http://10.0.0.5/hook",
+                                 "http://169.254.169.254/latest/meta-data", "http://[::1]/hook", "http://192.168.1.1/"])
+def test_webhook_urls_to_internal_addresses_are_rejected(url):
+    with pytest.raises(ValueError):
+        check_webhook_url(url)
+
+
+def test_webhook_url_to_public_address_is_accepted():
+    assert check_webhook_url("https://93.184.216.34/hook")
+
+
+def test_webhook_retries_without_sleeping_after_the_last_attempt(tmp_path, monkeypatch):
+    queue = make_queue(tmp_path)
+    job_id = submit(queue)
+    runner = JobRunner(queue, None)
+    sleeps = []
+    monkeypatch.setattr("jobs.time.sleep", sleeps.append)
+    monkeypatch.setattr(runner.session, "post", lambda *a, **kw: type("Res", (), {"status_code": 500})())
+    runner._post_webhook(job_id, "https://93.184.216.34/hook")
+    assert len(sleeps) == WEBHOOK_ATTEMPTS - 1
+    assert queue.get(job_id)["webhook"] == "failed: HTTP 500"
+
+
+
+def test_runner_keeps_queue_calls_off_the_event_loop(tmp_path):
+    queue = make_queue(tmp_path)
+    job_id = submit(queue)
+    calls = []
+
+    class Recording:
+        def __getattr__(self, name):
+            attr = getattr(queue, name)
+            if not callable(attr):
+                return attr
+
+            def call(*args):
+                calls.append((name, threading.get_ident()))
+                return attr(*args)
+            return call
+
+    async def handler(params, image):
+        return {"size": len(image.file.read())}
+
+    async def main():
+        runner = JobRunner(Recording(), handler, workers=1)
+        runner.start()
+        for _ in range(500):
+            if queue.get(job_id)["status"] == "done":
+                break
+            await asyncio.sleep(0.01)
+        await runner.stop()
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(main())
+    assert queue.get(job_id)["result"] == {"size": 3}
+    assert {"claim", "complete"} <= {name for name, _ in calls}
+    assert all(thread != loop_thread for _, thread in calls)
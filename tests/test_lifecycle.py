@@ -0,0 +1,44 @@
+from fastapi.testclient import TestClient
+import lifecycle
+import main
+from cache import CropMemo
+from lifecycle import ModelState
+from registry import profile_registry
+
+
+def test_start_walks_the_states_and_warms_every_profile(monkeypatch):
+    seen = []
+    state = ModelState(size=(1600, 720))
+    monkeypatch.setattr(lifecycle, "load_reader", lambda: seen.append(state.state))
+    monkeypatch.setattr(lifecycle.recognizer_pool, "start", lambda: None)
+    monkeypatch.setattr(lifecycle, "crop_memo", CropMemo())
+    monkeypatch.setattr(lifecycle, "ocr_plan", lambda img, plan: seen.append((state.state, img.shape, lifecycle.crop_memo.local.bypass)))
+    state.start()
+    assert seen[0] == "loading" and state.ready and state.error is None
+    assert seen[1:] == [("warming", (720, 1600, 3), True)] * len(profile_registry.profiles)
+    assert len(state.describe()["warmedProfiles"]) == len(profile_registry.profiles)
+
+
+def test_failed_load_fails_liveness_and_readiness(monkeypatch):
+    state = ModelState(warmup=False)
+
+    def broken():
+        raise RuntimeError("no weights")
+
+    monkeypatch.setattr(lifecycle, "load_reader", broken)
+    state.start()
+    assert state.state == "failed" and state.error == "RuntimeError: no weights"
+    monkeypatch.setattr(main, "model_state", state)
+    client = TestClient(main.app)
+    assert client.get("/healthz").status_code == 503
+    res = client.get("/readyz")
+    assert res.status_code == 503 and res.json()["error"] == "RuntimeError: no weights"
+
+
+def test_readyz_answers_once_warm(monkeypatch):
+    state = ModelState(warmup=False)
+    monkeypatch.setattr(main, "model_state", state)
+    client = TestClient(main.app)
+    assert client.get("/readyz").status_code == 503 and client.get("/healthz").status_code == 200
+    state.state = "ready"
+    assert client.get("/readyz").status_code == 200
@@ -0,0 +1,56 @@
+import pytest
+from matches import MatchStore, compare_submissions, crop_diff
+
+
+def submission(winner, full_time=True, timestamp=None, game="fcm", team_size=1, confidence=0.8):
+    return {"game": game, "teamSize": team_size, "winner": winner, "tieBreak": "goals", "confidence": confidence,
+            "meta": {"bytesHash": f"{winner}-{timestamp}", "isFullTime": full_time, "timestamp": timestamp}}
+
+
+def test_full_time_submission_is_preferred():
+    out = compare_submissions("fcm", submission("A", full_time=False, timestamp="2026-01-01T10:10:00"),
+                              submission("B", timestamp="2026-01-01T10:00:00"))
+    assert out["preferred"] == "B" and out["winner"] == "B" and out["confidence"] == pytest.approx(0.85)
+
+
+def test_later_timestamp_breaks_a_tie_and_agreement_wins():
+    a, b = submission("A", timestamp="2026-01-01T10:00:00", game="freefire"), submission("A", timestamp="2026-01-01T10:01:00", game="freefire")
+    out = compare_submissions("freefire", a, b)
+    assert out["preferred"] == "B" and out["winner"] == "A"
+    assert compare_submissions("freefire", a, {**b, "meta": {}}, serverB="2026-01-01T09:00:00")["preferred"] == "A"
+
+
+def test_efootball_aligned_timestamps_raise_confidence():
+    a, b = submission("A", timestamp="2026-01-01T10:00:00"), submission("A", timestamp="2026-01-01T10:02:00")
+    out = compare_submissions("efootball", a, b)
+    assert out["aligned"] and out["confidence"] == pytest.approx(0.89)
+
+
+def test_crop_diff_reports_changed_rois():
+    a = {"digest": "x", "signatures": {"goals": "0000000000000000", "user": "ffff000000000000"}}
+    b = {"digest": "y", "signatures": {"goals": "00000000000fffff", "user": "ffff000000000001"}}
+    assert crop_diff(a, b) == {"sameImage": False, "rois": {"goals": 20, "user": 1}, "changed": ["goals"]}
+    assert crop_diff(a, {"digest": "y", "signatures": {}}) is None
+
+
+def test_match_store_compares_the_first_two_submissions(tmp_path):
+    store = MatchStore(size=2, db_path=str(tmp_path / "matches.db"))
+    assert store.record("m1", "u1", submission("A"))["compare"] is None
+    match = store.record("m1", "u2", submission("A"), {"goals": "0000000000000000"})
+    assert match["compare"]["winner"] == "A" and store.compares == 1
+    store.record("m1", "u1", submission("B", full_time=False))
+    match = store.get("m1")
+    assert [s["userId"] for s in match["submissions"]] == ["u1", "u2"] and match["compare"]["preferred"] == "B"
+    assert store.compares == 2
+    store.record("m1", "u3", submission("B"))
+    assert store.compares == 2 and len(store.get("m1")["submissions"]) == 3
+    for other in ("m2", "m3"):
+        store.record(other, "u1", submission("A"))
+    assert "m1" not in store.items and store.get("m1")["matchId"] == "m1"
+
+
+def test_match_store_rejects_mixed_team_sizes():
+    store = MatchStore(db_path=None)
+    store.record("m1", "u1", submission("A", game="freefire", team_size=2))
+    match = store.record("m1", "u2", submission("A", game="freefire", team_size=4))
+    assert "error" in match["compare"]
@@ -0,0 +1,39 @@
+import pickle
+from metrics import Histogram, Metrics, Timings
+
+
+def test_histogram_renders_cumulative_buckets():
+    h = Histogram("t_seconds", "test", ("game",), (0.1, 1.0))
+    for seconds in (0.05, 0.1, 0.5, 3.0):
+        h.observe(('e"f',), seconds)
+    lines = h.render().splitlines()
+    assert lines[:2] == ["# HELP t_seconds test", "# TYPE t_seconds histogram"]
+    assert lines[2:5] == ['t_seconds_bucket{game="e\\"f",le="0.1"} 2', 't_seconds_bucket{game="e\\"f",le="1.0"} 3',
+                          't_seconds_bucket{game="e\\"f",le="+Inf"} 4']
+    assert lines[5] == 't_seconds_sum{game="e\\"f"} 3.65' and lines[6] == 't_seconds_count{game="e\\"f"} 4'
+
+
+def test_timings_cross_processes_and_sum_per_field():
+    timings = Timings()
+    timings.add("ocr", 0.01)
+    timings.add("ocr", 0.02)
+    timings.roi("teamA_goals", "glyph", 0.001)
+    timings.roi("teamA_goals", "easyocr", 0.002)
+    back = Timings.from_dict(pickle.loads(pickle.dumps(timings.as_dict())))
+    described = back.describe(0.05)
+    assert described["totalMs"] == 50.0 and described["stagesMs"] == {"ocr": 30.0}
+    assert described["fields"] == {"teamA_goals": {"engine": "mixed", "rois": 2, "ms": 3.0}}
+    assert Timings.from_dict(None).stages == {}
+
+
+def test_metrics_record_every_stage_and_roi():
+    metrics = Metrics(enabled=True)
+    timings = Timings({"decode": 0.004}, [["teamA_goals", "glyph", 0.0003]])
+    metrics.record({"game": "efootball", "teamSize": 1}, timings, 0.2, cached=False)
+    text = metrics.render()
+    assert 'ocr_verify_seconds_count{game="efootball",teamSize="1",cached="false"} 1' in text
+    assert 'ocr_stage_seconds_bucket{game="efootball",teamSize="1",stage="decode",le="0.005"} 1' in text
+    assert 'ocr_roi_seconds_count{game="efootball",teamSize="1",field="teamA_goals",engine="glyph"} 1' in text
+    off = Metrics(enabled=False)
+    off.record({"game": "efootball", "teamSize": 1}, timings, 0.2, cached=True)
+    assert "_count" not in off.render()
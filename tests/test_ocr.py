@@ -0,0 +1,163 @@
+import io
+import hashlib
+import pickle
+import tempfile
+import threading
+import time
+import numpy as np
+import cv2
+import pytest
+import ocr
+from cache import CropMemo
+from ocr import CropBatcher, preprocess_crops, _percentiles, binarize, decode_scale, load_upload, Upload
+from registry import build_plan
+
+
+def crops(seed, n=6):
+    rng = np.random.default_rng(seed)
+    out = []
+    for _ in range(n):
+        h, w = int(rng.integers(4, 50)), int(rng.integers(4, 120))
+        crop = np.full((h, w), rng.integers(0, 256), np.uint8)
+        cv2.putText(crop, str(rng.integers(0, 9999)), (1, h - 2), cv2.FONT_HERSHEY_SIMPLEX, max(0.2, h / 35), int(rng.integers(0, 256)), 1, cv2.LINE_AA)
+        out.append(np.clip(crop.astype(int) + rng.integers(-8, 9, crop.shape), 0, 255).astype(np.uint8))
+    return out
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_group_otsu_matches_thresholding_each_crop(seed):
+    group = crops(seed)
+    for crop, done in zip(group, preprocess_crops(group, {"threshold": "otsu", "invert": True})):
+        assert np.array_equal(done, binarize(cv2.bitwise_not(crop)))
+    for crop, done in zip(group, preprocess_crops(group, {"threshold": "otsu", "invert": "auto"})):
+        light = np.count_nonzero(binarize(crop)) * 2 < crop.size
+        assert np.array_equal(done, binarize(cv2.bitwise_not(crop) if light else crop))
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_group_percentiles_match_numpy(seed):
+    group = crops(seed) + [np.random.default_rng(seed).integers(0, 256, (3, 7), dtype=np.uint8)]
+    lo, hi = _percentiles(group, (5, 95))
+    assert [tuple(np.percentile(c, (5, 95))) for c in group] == list(zip(lo, hi))
+
+
+def test_adaptive_group_keeps_empty_crops_and_shapes():
+    group = crops(3, 3) + [np.zeros((0, 4), np.uint8)]
+    done = preprocess_crops(group, {"threshold": "adaptive", "invert": "auto", "upscale": True})
+    assert [d.shape[0] for d in done[:3]] == [max(64, c.shape[0]) for c in group[:3]]
+    assert done[3].size == 0 and set(np.unique(np.concatenate([d.ravel() for d in done[:3]]))) <= {0, 255}
+
+
+def test_plan_batches_groups_sharing_params():
+    plan = build_plan({"a": [0, 0, 0.1, 0.1], "b": [0.2, 0, 0.3, 0.1], "c": [0.4, 0, 0.5, 0.1]}, 100, 100,
+                      {"a": {"upscale": True}, "c": {"upscale": True}})
+    assert [(params.get("upscale", False), idx) for params, idx in plan.batches] == [(True, [0, 2]), (False, [1])]
+
+
+class DetectReader:
+    def __init__(self, lines, polys=()):
+        self.lines = lines
+        self.polys = polys
+
+    def detect(self, gray):
+        return [[[x0, x1, y0, y1] for x0, y0, x1, y1 in self.lines]], [list(self.polys)]
+
+
+def test_detected_lines_go_to_the_rois_they_overlap(monkeypatch):
+    plan = build_plan({"a": [0, 0, 0.5, 0.5], "b": [0.5, 0, 1, 0.5], "c": [0, 0.6, 1, 0.9]}, 100, 100)
+    lines = [(10, 10, 40, 20),  # inside a
+             (40, 30, 60, 40),  # half in a, half in b: read in both
+             (90, 40, 99, 58)]  # mostly between b and c, most of its overlap in b
+    polys = [[(60, 65), (80, 65), (80, 75), (60, 75)]]
+    monkeypatch.setattr(ocr, "load_reader", lambda: DetectReader(lines, polys))
+    monkeypatch.setattr(ocr, "recognize_crops", lambda crops: [f"{c.shape[1]}x{c.shape[0]}" for c in crops])
+    assert ocr.ocr_text_detect(np.zeros((100, 100), np.uint8), plan) == {"a": "30x10 10x10", "b": "10x10 9x10", "c": "20x10"}
+    monkeypatch.setattr(ocr, "load_reader", lambda: DetectReader([]))
+    assert ocr.ocr_text_detect(np.zeros((100, 100), np.uint8), plan) == {"a": "", "b": "", "c": ""}
+
+
+def test_recognize_crops_batches_every_miss_into_one_call(monkeypatch):
+    calls = []
+
+    def recognize(crops, allowlists):
+        calls.append(list(allowlists))
+        return [f"{c.shape[1]}:{a}" for c, a in zip(crops, allowlists)]
+
+    monkeypatch.setattr(ocr.crop_batcher, "recognize", recognize)
+    monkeypatch.setattr(ocr, "crop_memo", CropMemo())
+    a, b = np.zeros((8, 10), np.uint8), np.zeros((8, 12), np.uint8)
+    empty = np.zeros((0, 5), np.uint8)
+    assert ocr.recognize_crops([a, empty, b], [None, None, "0123456789"]) == ["10:None", "", "12:0123456789"]
+    assert ocr.recognize_crops([b, a]) == ["12:None", "10:None"]
+    assert calls == [[None, "0123456789"], [None]]
+
+
+def test_decode_scale_keeps_the_smallest_roi_readable():
+    assert decode_scale(720, 0.1) == 1
+    assert decode_scale(2160, 0.1) == 4
+    assert decode_scale(4320, 0.5) == 8
+    assert decode_scale(2160, None) == 1
+
+
+def test_reduced_decode_is_grayscale_and_reports_the_original_size():
+    img = np.random.default_rng(1).integers(0, 255, (1440, 3200, 3), dtype=np.uint8)
+    data = cv2.imencode(".jpg", img)[1].tobytes()
+    gray, exif_time, size = load_upload(Upload(io.BytesIO(data)), 0.1)
+    assert size == (3200, 1440) and gray.shape == (720, 1600) and exif_time is None
+
+
+def test_upload_hashes_in_memory_and_rolled_over_files_in_place():
+    data = bytes(range(256)) * 5000
+    spooled = tempfile.SpooledTemporaryFile(max_size=1024)
+    spooled.write(data)
+    for fileobj in (io.BytesIO(data), spooled):
+        upload = Upload(fileobj)
+        assert upload.digest == hashlib.sha256(data).hexdigest() and upload.size == len(data)
+        assert bytes(upload.view[:4]) == data[:4]
+    assert upload._mmap is not None
+    copy = pickle.loads(pickle.dumps(upload))
+    assert copy.digest == upload.digest and bytes(copy.view) == data
+    upload.release(close=False)
+    assert upload.view is None and upload._mmap is None and not spooled.closed
+    upload.release()
+    assert spooled.closed and upload.fileobj is None
+    empty = Upload(tempfile.SpooledTemporaryFile(max_size=0))
+    assert empty.size == 0 and empty.digest == hashlib.sha256(b"").hexdigest()
+    empty.release()
+
+
+def test_batcher_merges_callers_that_queue_behind_a_running_batch():
+    gate, sizes = threading.Event(), []
+
+    def run(crops, allowlists):
+        sizes.append(len(crops))
+        if len(sizes) == 1:
+            gate.wait(5)
+        return [f"{c}:{a}" for c, a in zip(crops, allowlists)]
+
+    batcher = CropBatcher(run, window_ms=0)
+    out = {}
+    threads = [threading.Thread(target=lambda i=i: out.__setitem__(i, batcher.recognize([i, i + 10], ["0", None])))
+               for i in range(4)]
+    threads[0].start()
+    while not sizes:
+        time.sleep(0.001)
+    for thread in threads[1:]:
+        thread.start()
+    while batcher.queued < 6:
+        time.sleep(0.001)
+    gate.set()
+    for thread in threads:
+        thread.join(5)
+    assert sizes == [2, 6] and out == {i: [f"{i}:0", f"{i + 10}:None"] for i in range(4)}
+    assert batcher.stats()["batches"] == 2 and batcher.stats()["callsPerBatch"] == 2.0
+
+
+def test_batcher_raises_the_runs_error_in_every_caller():
+    def run(crops, allowlists):
+        raise RuntimeError("recognizer down")
+
+    batcher = CropBatcher(run, window_ms=0)
+    with pytest.raises(RuntimeError):
+        batcher.recognize([1])
+    assert not batcher.leading and batcher.stats()["crops"] == 1
@@ -0,0 +1,26 @@
+from concurrent.futures.process import BrokenProcessPool
+import ocr
+from ocr_workers import RecognizerPool
+
+
+class BrokenPool:
+    def submit(self, fn, *args):
+        raise BrokenProcessPool("model process died")
+
+
+def test_idle_pool_stays_in_process(monkeypatch):
+    monkeypatch.setattr(ocr, "recognize_crops_local", lambda crops, allowlists=None: ["local"] * len(crops))
+    pool = RecognizerPool(processes=0)
+    pool.start()
+    assert not pool.active and pool.recognize([1, 2]) == ["local", "local"]
+    assert pool.stats()["calls"] == 0 and pool.stats()["processes"] == 0
+
+
+def test_broken_pool_falls_back_to_the_parent_reader(monkeypatch):
+    monkeypatch.setattr(ocr, "recognize_crops_local", lambda crops, allowlists=None: ["local"] * len(crops))
+    pool = RecognizerPool(processes=2)
+    pool.pool = BrokenPool()
+    assert pool.recognize([1, 2, 3]) == ["local"] * 3
+    assert not pool.active
+    stats = pool.stats()
+    assert stats["failures"] == 1 and stats["calls"] == 1 and stats["crops"] == 3 and stats["processes"] == 0
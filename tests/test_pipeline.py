@@ -0,0 +1,114 @@
+import io
+import numpy as np
+import cv2
+import pytest
+import pipeline
+from ocr import Upload
+from registry import profile_registry
+from screen import ScreenIndex
+
+PROFILE = profile_registry.profiles[("efootball", 1, "v1")]
+
+
+def png(img, level=3):
+    return cv2.imencode(".png", img, [cv2.IMWRITE_PNG_COMPRESSION, level])[1].tobytes()
+
+
+def screenshot():
+    rng = np.random.default_rng(7)
+    return rng.integers(0, 255, (720, 1600, 3), dtype=np.uint8)
+
+
+@pytest.fixture
+def ocr_calls(monkeypatch):
+    calls = []
+
+    def ocr_plan(img, plan, reads=None, timings=None):
+        calls.append(set(plan.rects))
+        return {key: "1" for key in plan.rects}
+
+    monkeypatch.setattr(pipeline, "ocr_plan", ocr_plan)
+    monkeypatch.setattr(pipeline, "screen_index", ScreenIndex())
+    return calls
+
+
+def verify(data, match_id, user_id):
+    request = {"matchId": match_id, "userId": user_id, "tournamentId": "t1"}
+    return pipeline.verify_upload(PROFILE, request, Upload(io.BytesIO(data)))
+
+
+def numeric_rois():
+    plan = profile_registry.plan(PROFILE, 1600, 720, pipeline.numeric_fields(PROFILE))
+    return set(plan.rects)
+
+
+def test_exact_copy_reuses_names_and_reads_numbers_again(ocr_calls):
+    img = screenshot()
+    verify(png(img, 3), "m1", "u1")
+    result = verify(png(img, 9), "m2", "u2")
+    assert result["_screening"]["distance"] == 0
+    assert len(ocr_calls) == 2 and ocr_calls[1] == numeric_rois()
+    assert "teamA_user" not in ocr_calls[1] and "teamA_goals" in ocr_calls[1]
+
+
+def test_near_copy_is_read_in_full(ocr_calls):
+    img = screenshot()
+    verify(png(img), "m1", "u1")
+    edited = img.copy()
+    x0, y0, x1, y1 = profile_registry.plan(PROFILE, 1600, 720).rects["teamA_goals"]
+    edited[y0:y0 + 2, x0:x0 + 2] = 255 - edited[y0:y0 + 2, x0:x0 + 2]
+    result = verify(png(edited), "m2", "u2")
+    assert result["_screening"] is not None and result["_screening"]["distance"] > 0
+    assert ocr_calls[1] == ocr_calls[0]
+
+
+def test_fast_stages_put_required_fields_first():
+    profile = {**PROFILE, "required": ["userName"]}
+    stages = pipeline.fast_stages(profile)
+    assert stages[0] == (["userName", "goals"], ("goals",))
+    assert stages[-1][1] is None
+    profile = {**profile, "winnerStages": [["goals", "bannerLabel"], ["penalties", "clock"]]}
+    assert pipeline.fast_stages(profile) == [(["userName", "goals", "bannerLabel"], ("goals",)), (["penalties", "clock"], None)]
+
+
+def test_fast_mode_stops_once_the_winner_is_decided(ocr_calls, monkeypatch):
+    monkeypatch.setattr(pipeline, "ocr_plan", lambda img, plan, reads=None, timings=None: (
+        ocr_calls.append(set(plan.rects)), {"teamA_goals": "2", "teamB_goals": "1"})[1])
+    request = {"matchId": "m1", "userId": "u1", "tournamentId": "t1", "mode": "fast"}
+    result = pipeline.verify_upload(PROFILE, request, Upload(io.BytesIO(png(screenshot()))))
+    assert result["winner"] == "A" and result["tieBreak"] == "goals"
+    assert result["meta"]["evaluation"]["stages"] == 1 and "penalties" in result["meta"]["evaluation"]["skipped"]
+    first = tuple(pipeline.fast_stages(PROFILE)[0][0])
+    assert ocr_calls == [set(profile_registry.plan(PROFILE, 1600, 720, first).rects)]
+
+
+def test_fast_confidence_counts_only_the_values_it_read(ocr_calls, monkeypatch):
+    texts = {"teamA_goals": "2", "teamB_goals": "1", "teamA_possession": "55%", "teamB_possession": "45%",
+             "teamA_shots_on_target": "4", "teamB_shots_on_target": "2", "title_full_time": "Full Time"}
+    monkeypatch.setattr(pipeline, "ocr_plan", lambda img, plan, reads=None, timings=None: {k: texts.get(k, "") for k in plan.rects})
+    data = png(screenshot())
+    full = pipeline.verify_upload(PROFILE, {"matchId": "m1", "userId": "u1", "tournamentId": "t-full"}, Upload(io.BytesIO(data)))
+    fast = pipeline.verify_upload(PROFILE, {"matchId": "m1", "userId": "u1", "mode": "fast"}, Upload(io.BytesIO(data)))
+    assert fast["meta"]["evaluation"]["stages"] == 1
+    assert fast["confidence"] == pytest.approx(0.72) and full["confidence"] == pytest.approx(0.96)
+
+
+def test_read_fields_parses_pairs_slots_and_unread_rois():
+    texts = {"teamA_goals": "3", "teamB_goals": "O1", "penalties_block": "PK: 4 - 3", "title_full_time": "Full Time 90:00"}
+    values = pipeline.read_fields(PROFILE, texts)
+    assert values["goals"] == {"left": 3, "right": 1} and values["penalties"] == {"left": 4, "right": 3}
+    assert values["possession"] == {"left": None, "right": None} and values["userName"] == {"left": "", "right": ""}
+    assert values["bannerLabel"] == "full_time" and values["clock"] == 5400
+    squad = profile_registry.profiles[("freefire", 2, "v1")]
+    values = pipeline.read_fields(squad, {"left_kills.0": "7", "left_kills.1": "x", "right_usernames.1": "Zed"})
+    assert values["kills"] == {"left": [7, None], "right": [None, None]}
+    assert values["userNames"]["right"] == ["", "Zed"]
+
+
+def test_resolve_sides_follows_the_uploader_or_the_profile():
+    dls = profile_registry.profiles[("dls", 1, "v1")]
+    values = {"userName": {"left": "Rival", "right": "Striker99"}}
+    assert pipeline.resolve_sides(dls, values, {"uploaderGameUser": "striker99"}) == ({"A": "right", "B": "left"}, "right")
+    assert pipeline.resolve_sides(dls, values, {"uploaderGameUser": "nobody"}) == ({"A": "left", "B": "right"}, None)
+    fcm = profile_registry.profiles[("fcm", 1, "v1")]
+    assert pipeline.resolve_sides(fcm, values, {}) == ({"A": "right", "B": "left"}, "right")
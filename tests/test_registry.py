@@ -0,0 +1,83 @@
+import json
+import os
+import shutil
+import pytest
+from registry import ProfileRegistry, ProfileError, validate_profile, PROFILES_DIR, PARSER_NAMES, WINNER_RULE_NAMES
+
+NAMES = ("efootball_1v1.json", "fcm_1v1.json", "dls_1v1.json")
+
+
+def registry_in(tmp_path):
+    for name in NAMES:
+        shutil.copy(os.path.join(PROFILES_DIR, name), tmp_path / name)
+    return ProfileRegistry(str(tmp_path), reload_interval=0)
+
+
+def test_reload_keeps_only_the_broken_files_old_profile(tmp_path):
+    registry = registry_in(tmp_path)
+    assert set(registry.profiles) == {("efootball", 1, "v1"), ("fcm", 1, "v1"), ("dls", 1, "v1")}
+    edited = json.loads((tmp_path / "fcm_1v1.json").read_text())
+    edited["teamSize"] = 2
+    (tmp_path / "fcm_1v1.json").write_text(json.dumps(edited))
+    (tmp_path / "efootball_1v1.json").write_text("{not json")
+    os.remove(tmp_path / "dls_1v1.json")
+    registry.load()
+    assert set(registry.profiles) == {("efootball", 1, "v1"), ("fcm", 2, "v1")}
+    assert list(registry.errors) == ["efootball_1v1.json"]
+    registry.load()
+    assert ("efootball", 1, "v1") in registry.profiles
+
+
+def test_new_broken_file_adds_nothing(tmp_path):
+    registry = registry_in(tmp_path)
+    (tmp_path / "broken.json").write_text("[]")
+    registry.load()
+    assert len(registry.profiles) == 3 and list(registry.errors) == ["broken.json"]
+
+
+@pytest.mark.parametrize("change", [
+    {"roi": {"a": 5}},
+    {"fields": {"f": "a"}},
+    {"teamSize": "one"},
+    {"winner": "coin_toss"},
+    {"fields": {"goals": {"left": "teamA_goals", "right": "teamB_goals", "parser": "roman"}}},
+    {"fields": {"goals": {"roi": ["teamA_goals"]}}},
+    {"labels": ["Full Time"]},
+    {"preprocess": {"goals": "digits"}},
+    {"sides": {"A": "left"}},
+    {"winnerStages": ["goals"]},
+])
+def test_wrongly_typed_profile_is_an_error_that_keeps_the_old_entry(tmp_path, change):
+    registry = registry_in(tmp_path)
+    old = registry.profiles[("efootball", 1, "v1")]
+    edited = {**old, **change}
+    (tmp_path / "efootball_1v1.json").write_text(json.dumps(edited))
+    registry.load()
+    assert registry.profiles[("efootball", 1, "v1")] is old
+    assert list(registry.errors) == ["efootball_1v1.json"]
+    with pytest.raises(ProfileError):
+        validate_profile(edited)
+
+
+def test_profile_names_match_the_pipeline():
+    import pipeline
+    assert set(PARSER_NAMES) == set(pipeline.PARSERS) | {"label"}
+    assert set(WINNER_RULE_NAMES) == set(pipeline.WINNER_RULES)
+
+
+def test_plans_are_built_once_per_resolution_and_field_set(tmp_path, monkeypatch):
+    import registry as registry_module
+    registry = registry_in(tmp_path)
+    profile = registry.profiles[("efootball", 1, "v1")]
+    plan = registry.plan(profile, 1600, 720)
+    assert registry.plan(profile, 1600, 720) is plan
+    assert registry.plan(profile, 1280, 720) is not plan
+    stage = registry.plan(profile, 1600, 720, ("goals",))
+    assert set(stage.rects) == {"teamA_goals", "teamB_goals"} < set(plan.rects)
+    x0, y0, x1, y1 = profile["roi"]["teamA_goals"]
+    assert plan.rects["teamA_goals"] == (int(x0 * 1600), int(y0 * 720), int(x1 * 1600), int(y1 * 720))
+    monkeypatch.setattr(registry_module, "ROI_PLAN_CACHE_SIZE", 2)
+    registry.plan(profile, 800, 360)
+    assert len(registry.plans) == 2 and registry.plan(profile, 1600, 720) is not plan
+    registry.load()
+    assert not registry.plans
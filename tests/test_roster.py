@@ -0,0 +1,28 @@
+import random
+from Levenshtein import distance as lev
+from roster import BKTree, RosterIndex
+
+
+def test_bk_tree_search_matches_a_linear_scan():
+    rng = random.Random(11)
+    words = sorted({"".join(rng.choice("abcde") for _ in range(rng.randint(3, 8))) for _ in range(300)})
+    tree = BKTree()
+    for word in words:
+        tree.add(word)
+    for probe in ("abcd", "eeeee", "abacabad", "cab"):
+        for k in (0, 1, 2):
+            assert tree.search(probe, k) == sorted((lev(probe, w), w) for w in words if lev(probe, w) <= k)
+
+
+def test_assign_gives_each_registered_name_to_one_slot():
+    index = RosterIndex(["ShadowFox", "ShadowFix", "Kaito_99", "Nova"])
+    slots = index.assign(["ShadowFox", "ShadowF0x", "Kait0_99", "xxxxxxxx"])
+    assert [s["match"] for s in slots] == ["ShadowFox", "ShadowFix", "Kaito_99", None]
+    assert index.contains(slots, "kaito_99") and not index.contains(slots, "Nova")
+
+
+def test_best_and_version():
+    index = RosterIndex(["Nova", "nova", "Orion"])
+    assert len(index) == 2
+    assert index.best("N0va")[0] == "Nova" and index.best("zzzzzzz") == (None, None)
+    assert index.version == RosterIndex(["Orion", "Nova"]).version
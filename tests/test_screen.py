@@ -0,0 +1,49 @@
+import random
+from screen import HammingIndex, ScreenIndex, ROI_BITS
+
+
+def test_hamming_index_finds_codes_within_max_bits():
+    rng = random.Random(3)
+    index = HammingIndex(1024, 8)
+    codes = {f"k{i}": rng.getrandbits(1024) for i in range(200)}
+    for key, code in codes.items():
+        index.add(key, code)
+    probe = codes["k5"] ^ (0b1011 << 300) ^ (1 << 1000)
+    assert index.search(probe, 8) == [(4, "k5")]
+    assert index.search(probe, 3) == []
+    index.remove("k5")
+    assert index.search(codes["k5"], 8) == []
+    assert all(index.search(code, 0) == [(0, key)] for key, code in codes.items() if key != "k5")
+
+
+def test_screen_index_marks_exact_and_edited_hits():
+    screens = ScreenIndex(max_bits=64)
+    rng = random.Random(5)
+    fingerprints = {key: rng.getrandbits(ROI_BITS) for key in ("a", "b", "c", "d")}
+    screens.add("scope", fingerprints, "d1", "m1", "u1", {"a": "x"})
+    hit = screens.lookup("scope", dict(fingerprints))
+    assert hit.exact and hit.duplicate and hit.entry["texts"] == {"a": "x"}
+    hit = screens.lookup("scope", {**fingerprints, "b": fingerprints["b"] ^ 0b111})
+    assert not hit.exact and hit.duplicate
+    hit = screens.lookup("scope", {**fingerprints, "b": fingerprints["b"] ^ 0xFFFF})
+    assert hit.edited and hit.changed == ["b"]
+    assert screens.lookup("other", fingerprints) is None
+
+
+def test_screen_index_evicts_by_total_size_across_scopes():
+    rng = random.Random(9)
+    screens = ScreenIndex(max_bits=16, max_mb=0.05)
+
+    def add(scope, digest):
+        screens.add(scope, {key: rng.getrandbits(ROI_BITS) for key in ("a", "b")}, digest, "m", "u")
+
+    add("old", "o1")
+    add("old", "o2")
+    per_entry = screens.bytes // 2
+    for i in range(int(screens.max_bytes // per_entry) + 3):
+        add("new", f"n{i}")
+    assert screens.bytes <= screens.max_bytes
+    assert "old" not in screens.scopes
+    assert screens.by_digest("new", "n0") is None and screens.by_digest("new", f"n{i}") is not None
+    assert screens.bytes == sum(entry["bytes"] for state in screens.scopes.values() for entry in state[2].values())
+    assert all(len(index.codes) == len(entries) for _, index, entries in screens.scopes.values())
@@ -0,0 +1,34 @@
+import threading
+from translate import Translator, StubBackend
+
+
+class SlowBackend(StubBackend):
+    def __init__(self, table):
+        super().__init__(table)
+        self.release = threading.Event()
+
+    def translate(self, text):
+        self.release.wait(5)
+        return super().translate(text)
+
+
+def test_over_budget_lookup_falls_back_and_is_counted():
+    backend = SlowBackend({"Terminado": "Full Time"})
+    translator = Translator(backend, budget_ms=10)
+    assert translator.translate("Terminado") == "Terminado"
+    assert translator.fallbacks() == 1 and translator.stats()["overBudget"] == 1
+    backend.release.set()
+    translator.pool.shutdown(wait=True)
+    assert translator.translate("Terminado") == "Full Time"
+    assert translator.fallbacks() == 1
+
+
+def test_fallbacks_are_counted_per_thread():
+    backend = SlowBackend({})
+    translator = Translator(backend, budget_ms=10)
+    seen = []
+    worker = threading.Thread(target=lambda: seen.append((translator.translate("Tiempo"), translator.fallbacks())))
+    worker.start()
+    worker.join()
+    backend.release.set()
+    assert seen == [("Tiempo", 1)] and translator.fallbacks() == 0
@@ -0,0 +1,39 @@
+import json, os
+import pytest
+from validators import LabelMatcher, normalize_label, fuzzy_match
+
+PROFILES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "profiles")
+
+
+def labels(name):
+    with open(os.path.join(PROFILES, name)) as f:
+        return json.load(f)["labels"]
+
+
+def test_exact_variant_inside_text():
+    matcher = LabelMatcher({"full_time": ["Full Time"], "penalties": ["PK"]})
+    assert matcher.match("FULL TIME 90:00") == "full_time"
+    assert matcher.match("pk 5-4") == "penalties"
+
+
+def test_one_edit_on_long_word_variant():
+    matcher = LabelMatcher({"full_time": ["Full Time"]})
+    assert matcher.match("Fuil Time") == "full_time"
+    assert matcher.match("Half Time") is None
+
+
+def test_short_variants_match_exactly():
+    assert LabelMatcher({"kills": ["Kills", "K"]}).match("J") is None
+
+
+@pytest.mark.parametrize("profile", ["dls_1v1.json", "fcm_1v1.json"])
+@pytest.mark.parametrize("clock", ["80:00", "70:00", "60:00", "20:00", "90:01"])
+def test_clock_variants_need_an_exact_match(profile, clock):
+    full_time = {"full_time": labels(profile)["full_time"]}
+    assert normalize_label(clock, full_time) != "full_time"
+    assert normalize_label("90:00", full_time) == "full_time"
+
+
+def test_fuzzy_username_match():
+    assert fuzzy_match("Player_One", "playerone")
+    assert not fuzzy_match("alpha", "omega")
@@ -0,0 +1,54 @@
+from fastapi.testclient import TestClient
+import main
+from test_batch import fake_verify
+from matches import MatchStore
+
+
+def screened_verify(profile, request, upload):
+    from screen import screen_index, screen_scope
+    result = fake_verify(profile, request, upload)
+    screen_index.add(screen_scope(profile, request), {"goals": 1}, upload.digest, request["matchId"], request.get("userId"))
+    return {**result, "_screening": None, "_signatures": {"goals": 1}}
+
+
+def test_cached_results_are_screened_against_each_request(monkeypatch):
+    monkeypatch.setattr(main, "verify_upload", screened_verify)
+    client = TestClient(main.app)
+
+    def send(match_id, user_id):
+        res = client.post("/ocr/efootball/verify", data={"matchId": match_id, "userId": user_id, "tournamentId": "t-cache"},
+                          files={"image": ("a.png", b"same screenshot bytes", "image/png")})
+        assert res.status_code == 200, res.text
+        return res.json()
+
+    assert "screening" not in send("m1", "u1")["meta"]
+    for value in main.result_cache.items.values():
+        assert "_screening" not in value and "_signatures" not in value
+    copy = send("m2", "u2")
+    assert copy["meta"]["cached"] and copy["meta"]["screening"]["review"]
+    assert copy["meta"]["screening"]["matchId"] == "m1"
+    again = send("m1", "u1")
+    assert again["meta"]["cached"] and "screening" not in again["meta"]
+
+
+def test_results_with_untranslated_labels_are_not_cached(monkeypatch):
+    monkeypatch.setattr(main, "verify_upload", lambda profile, request, upload: {**fake_verify(profile, request, upload), "_fallbacks": 1})
+    client = TestClient(main.app)
+    for _ in range(2):
+        res = client.post("/ocr/efootball/verify", data={"matchId": "m-late", "userId": "u1"},
+                          files={"image": ("a.png", b"late translation bytes", "image/png")})
+        assert res.status_code == 200, res.text
+        assert "cached" not in res.json()["meta"] and "_fallbacks" not in res.json()
+
+
+def test_compare_by_match_id_checks_the_routes_game(monkeypatch):
+    monkeypatch.setattr(main, "match_store", MatchStore(db_path=None))
+    for user in ("u1", "u2"):
+        main.match_store.record("ff-1", user, {"game": "freefire", "teamSize": 2, "winner": "A", "confidence": 0.9, "meta": {}})
+    client = TestClient(main.app)
+    assert client.post("/ocr/freefire/compare", json={"matchId": "ff-1"}).json()["winner"] == "A"
+    assert client.post("/ocr/freefire/compare/2", json={"matchId": "ff-1"}).status_code == 200
+    res = client.post("/ocr/efootball/compare", json={"matchId": "ff-1"})
+    assert res.status_code == 409 and "freefire" in res.json()["detail"]
+    assert client.post("/ocr/freefire/compare/1", json={"matchId": "ff-1"}).status_code == 409
+    assert client.post("/ocr/efootball/compare", json={"matchId": "unknown"}).status_code == 404
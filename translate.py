@@ -0,0 +1,154 @@
+import os, sqlite3, threading, logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import requests
+from requests.adapters import HTTPAdapter
+
+TRANSLATE_BACKEND = os.getenv("TRANSLATE_BACKEND", "google")  # "google", "stub" or "none"
+TRANSLATE_BUDGET_MS = int(os.getenv("TRANSLATE_BUDGET_MS", "200"))  # how long a verify waits for a translation
+TRANSLATE_TIMEOUT = float(os.getenv("TRANSLATE_TIMEOUT", "4"))  # HTTP timeout of the background call
+TRANSLATE_CACHE_SIZE = int(os.getenv("TRANSLATE_CACHE_SIZE", "4096"))
+TRANSLATE_CACHE_DB = os.getenv("TRANSLATE_CACHE_DB")  # optional SQLite file, survives restarts
+
+log = logging.getLogger("ocr.translate")
+
+
+class GoogleTranslateBackend:
+    url = "https://translation.googleapis.com/language/translate/v2"
+
+    def __init__(self, api_key, timeout=TRANSLATE_TIMEOUT):
+        self.api_key = api_key
+        self.timeout = timeout
+        # One keep-alive session so repeated lookups reuse the TLS connection
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+
+    def translate(self, text):
+        res = self.session.post(self.url, params={"key": self.api_key},
+                                json={"q": text, "target": "en", "format": "text"}, timeout=self.timeout)
+        res.raise_for_status()
+        return res.json()["data"]["translations"][0]["translatedText"]
+
+
+class StubBackend:
+    # Local stand-in for tests and offline runs: fixed table, unknown text comes back unchanged
+    def __init__(self, table=None):
+        self.table = table or {}
+
+    def translate(self, text):
+        return self.table.get(text, text)
+
+
+def make_backend(name=TRANSLATE_BACKEND):
+    if name == "stub":
+        return StubBackend()
+    if name == "google":
+        api_key = os.getenv("GOOGLE_TRANSLATE_KEY")
+        return GoogleTranslateBackend(api_key) if api_key else None
+    return None
+
+
+class Translator:
+    def __init__(self, backend, budget_ms=TRANSLATE_BUDGET_MS, cache_size=TRANSLATE_CACHE_SIZE, db_path=TRANSLATE_CACHE_DB):
+        self.backend = backend
+        self.budget = budget_ms / 1000.0
+        self.cache_size = cache_size
+        self.items = OrderedDict()
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="translate")
+        self.hits = 0
+        self.misses = 0
+        self.late = 0
+        self.errors = 0
+        self.local = threading.local()  # per verify thread: lookups answered with the raw text
+        self.db = None
+        if db_path:
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            self.db.execute("CREATE TABLE IF NOT EXISTS translations (text TEXT PRIMARY KEY, translated TEXT NOT NULL)")
+            self.db.commit()
+
+    def translate(self, text):
+        # Returns the English text, or the input unchanged when no translation is ready within the budget
+        if not text or self.backend is None:
+            return text
+        cached = self._lookup(text)
+        if cached is not None:
+            return cached
+        try:
+            return self._submit(text).result(timeout=self.budget)
+        except TimeoutError:
+            # Keep verifying with the raw label; the background call still fills the cache
+            with self.lock:
+                self.late += 1
+            self.local.fallbacks = self.fallbacks() + 1
+            return text
+        except Exception:
+            self.local.fallbacks = self.fallbacks() + 1
+            return text
+
+    def fallbacks(self):
+        # Raw-text answers on this thread so far; a verify compares the count before and after
+        return getattr(self.local, "fallbacks", 0)
+
+    def _lookup(self, text):
+        with self.lock:
+            translated = self.items.get(text)
+            if translated is None and self.db is not None:
+                row = self.db.execute("SELECT translated FROM translations WHERE text = ?", (text,)).fetchone()
+                if row:
+                    translated = row[0]
+                    self._remember(text, translated)
+            if translated is None:
+                self.misses += 1
+                return None
+            self.items.move_to_end(text)
+            self.hits += 1
+            return translated
+
+    def _submit(self, text):
+        with self.lock:
+            future = self.pending.get(text)
+            if future is None:
+                future = self.pool.submit(self._fetch, text)
+                self.pending[text] = future
+            return future
+
+    def _fetch(self, text):
+        try:
+            translated = self.backend.translate(text)
+        except Exception as e:
+            with self.lock:
+                self.errors += 1
+                self.pending.pop(text, None)
+            log.warning("Translation failed: %s", e)
+            raise
+        with self.lock:
+            self._remember(text, translated)
+            if self.db is not None:
+                self.db.execute("INSERT OR REPLACE INTO translations (text, translated) VALUES (?, ?)", (text, translated))
+                self.db.commit()
+            self.pending.pop(text, None)
+        return translated
+
+    def _remember(self, text, translated):
+        self.items[text] = translated
+        self.items.move_to_end(text)
+        while len(self.items) > self.cache_size:
+            self.items.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "backend": type(self.backend).__name__ if self.backend is not None else None,
+                "budgetMs": int(self.budget * 1000),
+                "entries": len(self.items),
+                "hits": self.hits,
+                "misses": self.misses,
+                "overBudget": self.late,
+                "errors": self.errors,
+                "inflight": len(self.pending),
+            }
+
+
+translator = Translator(make_backend())
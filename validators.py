@@ -1,8 +1,13 @@
-import os, requests, re
+import os, requests, re, unicodedata
+from functools import lru_cache
+from translate import translator
 from Levenshtein import distance as lev
 import re
 from math import floor
 
+LABEL_MAX_EDITS = int(os.getenv("LABEL_MAX_EDITS", "1"))  # OCR noise tolerated in a label ("Fuil Time")
+LABEL_FUZZY_MIN_LEN = int(os.getenv("LABEL_FUZZY_MIN_LEN", "5"))  # shorter variants ("PK", "K") must match exactly
+
 def parse_score(text: str):
     # e.g., "1 - 3" or "3-1"
     m = re.search(r"(\d+)\s*[-:\u2013]\s*(\d+)", text or "")
@@ -19,29 +24,75 @@ def parse_pair_numbers(left_text: str, right_text: str):
 
 
 def translate_to_english(text: str) -> str:
-  api_key = os.getenv("GOOGLE_TRANSLATE_KEY")
-  if not api_key or not text:
-    return text
-  try:
-    url = f"https://translation.googleapis.com/language/translate/v2?key={api_key}"
-    payload = {"q": text, "target": "en", "format": "text"}
-    res = requests.post(url, json=payload, timeout=4)
-    data = res.json()
-    return data["data"]["translations"][0]["translatedText"]
-  except Exception:
-    return text
-
-def normalize_label(raw_text: str, dictionary: dict) -> str:
-  rt = raw_text.lower()
-  for key, variants in dictionary.items():
-    for v in variants:
-      if v.lower() in rt:
+  # Cached, pooled and bounded by TRANSLATE_BUDGET_MS; falls back to the raw text
+  return translator.translate(text)
+
+def fold_text(text: str) -> str:
+  # casefold + compatibility forms (fullwidth, ligatures) + accents stripped + whitespace collapsed
+  text = unicodedata.normalize("NFKD", (text or "").casefold())
+  return " ".join("".join(c for c in text if not unicodedata.combining(c)).split())
+
+class LabelMatcher:
+  # A labels dictionary compiled once: every folded variant in one regex (longest first), then a
+  # word-window Levenshtein pass for OCR noise on the longer variants. Variants with digits or ':'
+  # (clocks, scores) only match exactly: one edit turns "90:00" into "80:00".
+  def __init__(self, dictionary: dict, max_edits: int = LABEL_MAX_EDITS):
+    self.max_edits = max_edits
+    self.lookup = {}
+    for key, variants in dictionary.items():
+      for v in variants:
+        folded = fold_text(v)
+        if folded and folded not in self.lookup:
+          self.lookup[folded] = key
+    phrases = sorted(self.lookup, key=len, reverse=True)
+    self.pattern = re.compile("|".join(re.escape(p) for p in phrases)) if phrases else None
+    self.fuzzy = [(len(p.split(" ")), p, key) for p, key in self.lookup.items()
+                  if len(p) >= LABEL_FUZZY_MIN_LEN and not re.search(r"[\d:]", p)]
+    self.key_names = [(key.replace("_", " "), key) for key in dictionary]
+
+  def match(self, text: str):
+    folded = fold_text(text)
+    if self.pattern is not None:
+      m = self.pattern.search(folded)
+      if m:
+        return self.lookup[m.group()]
+    if self.max_edits > 0 and folded:
+      words = folded.split(" ")
+      best = None
+      for n, phrase, key in self.fuzzy:
+        for i in range(len(words) - n + 1):
+          d = lev(" ".join(words[i:i + n]), phrase)
+          if d <= self.max_edits and (best is None or d < best[0]):
+            best = (d, key)
+      if best:
+        return best[1]
+    return None
+
+  def match_key_name(self, text: str):
+    folded = fold_text(text)
+    for name, key in self.key_names:
+      if name in folded:
         return key
-  translated = translate_to_english(raw_text).lower()
-  for key, variants in dictionary.items():
-    if key in translated:
-      return key
-  return rt
+    return None
+
+@lru_cache(maxsize=256)
+def _compile_labels(items, max_edits):
+  return LabelMatcher({k: list(v) for k, v in items}, max_edits)
+
+def compile_labels(dictionary: dict, max_edits: int = LABEL_MAX_EDITS) -> LabelMatcher:
+  return _compile_labels(tuple((k, tuple(v)) for k, v in dictionary.items()), max_edits)
+
+def normalize_label(raw_text: str, dictionary) -> str:
+  # dictionary: {key: [variants]} or a LabelMatcher compiled from one
+  matcher = dictionary if isinstance(dictionary, LabelMatcher) else compile_labels(dictionary)
+  key = matcher.match(raw_text)
+  if key:
+    return key
+  translated = translate_to_english(raw_text)
+  key = (matcher.match(translated) if translated != raw_text else None) or matcher.match_key_name(translated)
+  if key:
+    return key
+  return raw_text.lower()
 
 def normalize_username(name: str):
   return re.sub(r"[^a-zA-Z0-9 ]", "", name or "").strip().lower()
@@ -75,17 +126,32 @@ def validate_coherence_sports(a, b):
 
   return ok, notes
 
+@lru_cache(maxsize=4096)
+def parse_timestamp(ts: str):
+  # ISO time (EXIF or server) -> datetime, parsed once per distinct string; None when unparseable
+  from datetime import datetime
+  try:
+    return datetime.fromisoformat(ts.replace("Z",""))
+  except Exception:
+    return None
+
 def timestamps_close(tsA: str, tsB: str, max_minutes: int = 5):
   # As a fallback, this compares server-side upload times (passed in meta) if EXIF unavailable
-  from datetime import datetime
+  a, b = parse_timestamp(tsA), parse_timestamp(tsB)
   try:
-    a = datetime.fromisoformat(tsA.replace("Z",""))
-    b = datetime.fromisoformat(tsB.replace("Z",""))
     delta = abs((a - b).total_seconds()) / 60.0
     return delta <= max_minutes
   except Exception:
     return False
 
+def later_of(tsA: str, tsB: str):
+  # "A" or "B" for the later timestamp, None when either is missing or they can't be compared
+  a, b = parse_timestamp(tsA or ""), parse_timestamp(tsB or "")
+  try:
+    return "A" if a > b else "B"
+  except Exception:
+    return None
+
 def pick_better_submission(metaA, metaB):
   # Prefer full-time; else prefer later timestamp
   if metaA.get("isFullTime") and not metaB.get("isFullTime"):
@@ -96,13 +162,9 @@ def pick_better_submission(metaA, metaB):
   tsA = metaA.get("timestamp")
   tsB = metaB.get("timestamp")
   if tsA and tsB:
-    from datetime import datetime
-    try:
-      a = datetime.fromisoformat(tsA.replace("Z",""))
-      b = datetime.fromisoformat(tsB.replace("Z",""))
-      return "A" if a > b else "B"
-    except Exception:
-      pass
+    later = later_of(tsA, tsB)
+    if later:
+      return later
   return "A"  # default
 
 